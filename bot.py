@@ -5,7 +5,8 @@ import datetime
 from discord.ext import commands, tasks
 import logging
 from src.constants import (
-    LOGGING_FILE, REFRESH_DELAY, AUTH_FILE, TEMP_DIR
+    LOGGING_FILE, POLL_TICK, AUTH_FILE, TEMP_DIR, DISCORD_MAX_EMBED_FIELDS,
+    CACHE_WARM_TICK
 )
 from src.utils import (
     send_message, invert_csv, progress_bar
@@ -15,6 +16,14 @@ from src.database import Database
 from src.discord_helper import DiscordHelper
 from src.consistency_checker import ConsistencyChecker
 from src.ed_helper import EdHelper
+from src.async_ed_helper import AsyncEdHelper
+from src.job_executor import JobExecutor
+from src.job_queue import JobQueue
+from src.job_delivery import JobDelivery
+from src.metrics import Metrics
+from src.poll_scheduler import PollScheduler
+from src.cache_warmer import CacheWarmer
+from src.discord_scheduler import DiscordScheduler
 
 logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
                     level=logging.INFO)
@@ -26,6 +35,10 @@ intents = discord.Intents(messages=True, guilds=True,
                           members=True, message_content=True, reactions=True)
 bot = commands.Bot(command_prefix='!', intents=intents)
 database = Database()
+executor = JobExecutor()
+scheduler = PollScheduler()
+warmer = CacheWarmer()
+delivery = JobDelivery(bot)
 
 # -----------------------------------------------------------------------------#
 # START COMMANDS
@@ -98,6 +111,11 @@ async def br_push(ctx):
                                "This command can only be used in a thread " +
                                "started by the intructor-bot")
             return
+        if database.get_discord_thread(ctx.guild.id, thread.id) is None:
+            logging.info("Used in an already resolved backreading thread")
+            await send_message(ctx.channel,
+                               "This thread has already been resolved")
+            return
 
         await DiscordHelper.push_ed_response(ctx, database, bot, thread)
         logging.info(f"Successfully pushed response from {ctx.channel}")
@@ -130,16 +148,104 @@ async def br_pull(ctx):
                            f"Error encountered when handling request: {e}")
 
 
+@bot.command(
+    name='br-interval',
+    help=("Shows how often threads are pulled from Ed. The server's admin can "
+          "call with a number of minutes to pin the interval, or 'auto' to "
+          "let it adapt to course activity again")
+)
+async def br_interval(ctx, minutes=None):
+    logging.info(f"Poll interval command from {ctx.guild.id}: {minutes}")
+    try:
+        if ctx.guild.id not in database:
+            logging.info(f"{ctx.guild.id} not registered in database")
+            await send_message(ctx.channel,
+                               "Backreading bot not setup for this server")
+            return
+
+        if minutes is not None:
+            if str(ctx.author.id) != str(database.get_admin(ctx.guild.id)):
+                await send_message(ctx.channel, "Only this server's " +
+                                   "backreading admin can pin the interval")
+                return
+            if minutes == 'auto':
+                database.set_poll_interval(ctx.guild.id, None)
+            elif minutes.isdigit() and int(minutes) > 0:
+                database.set_poll_interval(ctx.guild.id, int(minutes) * 60)
+            else:
+                await send_message(ctx.channel, "Provide a whole number of " +
+                                   "minutes or 'auto'")
+                return
+
+        course = database.get_course(ctx.guild.id)
+        pinned = DiscordHelper.pinned_interval(database, [
+            guild_id for guild_id in database.guild_ids()
+            if database.get_course(guild_id) == course
+        ])
+        interval, until_next = scheduler.status(course, pinned)
+        await send_message(
+            ctx.channel,
+            f"Polling Ed every {interval / 60:.1f} minutes " +
+            ("(pinned)" if pinned is not None else "(adaptive)") +
+            f", next poll in {until_next / 60:.1f} minutes"
+        )
+    except Exception as e:
+        logging.exception(e)
+        await send_message(ctx.channel,
+                           f"Error encountered when handling request: {e}")
+
+
+@bot.command(
+    name='br-metrics',
+    help=("Shows thread refresh timings, Ed cache statistics and the "
+          "Discord outbound queue")
+)
+async def br_metrics(ctx):
+    logging.info(f"Metrics requested from {ctx.guild.id}")
+    try:
+        snapshot = Metrics.snapshot()
+        embed = discord.Embed(title="Metrics")
+        for name, timing in snapshot['timings'].items():
+            embed.add_field(name=name, value=(
+                f"Last: {timing['last']:.2f}s\n" +
+                f"Mean: {timing['mean']:.2f}s\n" +
+                f"Max: {timing['max']:.2f}s\n" +
+                f"Count: {timing['count']}"
+            ))
+        for name, count in snapshot['counters'].items():
+            embed.add_field(name=name, value=str(count))
+        embed.add_field(name="ed_cache", value="\n".join(
+            f"{name}: {value}"
+            for name, value in AsyncEdHelper.cache.stats().items()
+        ))
+        embed.add_field(name="ed_disk_cache", value="\n".join(
+            f"{name}: {value}"
+            for name, value in AsyncEdHelper.disk_cache.stats().items()
+        ))
+        embed.add_field(name="discord_queue", value="\n".join(
+            f"{name}: {value}"
+            for name, value in DiscordScheduler.depth().items()
+        ))
+        await send_message(ctx.channel, embed)
+    except Exception as e:
+        logging.exception(e)
+        await send_message(ctx.channel,
+                           f"Error encountered when handling request: {e}")
+
+
 @bot.command(
     name='gr-check',
-    help=("Checks to see if TAs are done grading. Call with submissions "
-          "link. Optional attachment: .csv grading spreadsheet"))
-async def gr_check(ctx, submission_link):
+    help=("Queues a check to see if TAs are done grading. Call with "
+          "submissions link. Optional 2nd arg: whether or not to resume an "
+          "interrupted check with the same arguments (default true). "
+          "Optional attachment: .csv grading spreadsheet"))
+async def gr_check(ctx, submission_link, resume: bool = True):
     logging.info(f"Checking submissions for {ctx.guild.id} w/ completed " +
                  f"grading - {submission_link}")
     try:
         if not EdHelper.valid_assignment_url(submission_link):
-            send_message(ctx.channel, "Provided link is invalid, try again")
+            await send_message(ctx.channel,
+                               "Provided link is invalid, try again")
             return
         if "attempt" in submission_link and "email" in submission_link:
             await send_message(ctx.channel,
@@ -149,38 +255,21 @@ async def gr_check(ctx, submission_link):
             return
 
         spreadsheet = invert_csv(
-            DiscordHelper.get_attachment(ctx.message.attachments[0].url)
+            (await ctx.message.attachments[0].read()).decode('utf-8')
         ) if ctx.message.attachments else None
-        ed_helper = EdHelper(database.get_token(ctx.guild.id))
-
-        update_progress = None
-        if "attempt" in submission_link:
-            # Converting requires a lot of API calls which takes much longer
-            progress_bar_message = await send_message(ctx.channel,
-                                                      progress_bar(0, 1))
-
-            async def update_progress(curr, total):  # noqa: F811
-                await progress_bar_message.edit(
-                    embed=discord.Embed(description=progress_bar(curr, total))
-                )
-
-        key_to_ungraded, total_ungraded = (
-            await ConsistencyChecker.check_ungraded(
-                ed_helper, submission_link, spreadsheet, update_progress
-            )
-        )
 
-        embeds = DiscordHelper._format_ungraded_embed(
-            key_to_ungraded, ed_helper.get_slide(submission_link)['title']
+        # Interrupted checks are checkpointed under this key, so a requeued
+        # or repeated job picks up where the last one stopped. Only requests
+        # that agree on 'resume' share a job
+        key = JobQueue.job_key(ctx.guild.id, 'ungraded', submission_link,
+                               spreadsheet)
+        job, created = job_queue.submit(
+            ctx.guild.id, ctx.channel.id, 'ungraded',
+            [submission_link, spreadsheet, key, resume],
+            JobQueue.job_key(ctx.guild.id, 'ungraded', submission_link,
+                             spreadsheet, resume), ctx.message.id
         )
-        for embed in embeds:
-            await send_message(ctx.channel, embed)
-        await send_message(ctx.channel,
-                           "All clear!" if total_ungraded == 0 else
-                           f"{total_ungraded} students still ungraded")
-
-        logging.info("Successfully checked grading completion for " +
-                     f"{ctx.guild.id}")
+        await send_message(ctx.channel, _queued_message(job, created))
     except Exception as e:
         logging.exception(e)
         await send_message(ctx.channel,
@@ -189,10 +278,13 @@ async def gr_check(ctx, submission_link):
 
 @bot.command(
     name='gr-consistency',
-    help=("Checks the consistency of grading. Call with the submission link. "
-          "Optional 2nd arg: whether or not a template is used. Optional "
+    help=("Queues a check of the consistency of grading. Call with the "
+          "submission link. Optional 2nd arg: whether or not a template is "
+          "used. Optional 3rd arg: whether or not to resume an interrupted "
+          "check with the same arguments (default true). Optional "
           "attachment: .csv grading spreadsheet"))
-async def gr_consistency(ctx, submission_link, template: bool = False):
+async def gr_consistency(ctx, submission_link, template: bool = False,
+                         resume: bool = True):
     logging.info(f"Checking submissions for consistency in {ctx.guild.id}: "
                  f"{submission_link}, {template}")
     try:
@@ -207,56 +299,92 @@ async def gr_consistency(ctx, submission_link, template: bool = False):
                                "again with the email removed")
             return
 
-        ed_helper = EdHelper(database.get_token(ctx.guild.id))
         spreadsheet = invert_csv(
-            DiscordHelper.get_attachment(ctx.message.attachments[0].url)
+            (await ctx.message.attachments[0].read()).decode('utf-8')
         ) if ctx.message.attachments else None
         file_path = os.path.join(TEMP_DIR,
                                  f'{ctx.guild.id}-{datetime.datetime.now()}')
 
-        progress_bar_message = await send_message(ctx.channel,
-                                                  progress_bar(0, 1))
+        key = JobQueue.job_key(ctx.guild.id, 'consistency', submission_link,
+                               template, spreadsheet)
+        job, created = job_queue.submit(
+            ctx.guild.id, ctx.channel.id, 'consistency',
+            [submission_link, file_path, template, spreadsheet, key, resume],
+            JobQueue.job_key(ctx.guild.id, 'consistency', submission_link,
+                             template, spreadsheet, resume), ctx.message.id
+        )
+        await send_message(ctx.channel, _queued_message(job, created))
+    except Exception as e:
+        logging.exception(e)
+        await send_message(ctx.channel,
+                           f"Error encountered when handling request: {e}")
 
-        async def update_progress(curr, total):
-            await progress_bar_message.edit(
-                embed=discord.Embed(description=progress_bar(curr, total))
-            )
 
-        # TODO: shard blocking issue
-        fixes, not_present, total_issues = (
-            await ConsistencyChecker.check_consistency(
-                ed_helper, submission_link, file_path, template,
-                spreadsheet, update_progress
-            )
-        )
+@bot.command(
+    name='gr-jobs',
+    help="Lists this server's queued and running grading checks"
+)
+async def gr_jobs(ctx):
+    logging.info(f"Listing jobs for {ctx.guild.id}")
+    try:
+        jobs = job_queue.get_jobs(ctx.guild.id)
+        if not jobs:
+            await send_message(ctx.channel, "No grading checks queued")
+            return
 
-        if total_issues > 0:
-            embeds = DiscordHelper._format_fixes_embed(
-                spreadsheet, fixes,
-                ed_helper.get_slide(submission_link)['title']
-            )
-            await send_message(
-                ctx.channel, embeds[0],
-                files=[discord.File(file_path + ".csv"),
-                       discord.File(file_path + ".html")]
-            )
-            for i in range(1, len(embeds)):
-                await send_message(ctx.channel, embeds[i])
-        if len(not_present) > 0:
-            await send_message(ctx.channel,
-                               f"{len(not_present)} students not on the " +
-                               "grading spreadsheet, refresh the roster")
+        embed = discord.Embed(title="Grading checks")
+        for job in jobs[:DISCORD_MAX_EMBED_FIELDS]:
+            completed, total = job['progress']
+            value = job['status'].capitalize()
+            if total > 0:
+                value += (f"\n{progress_bar(completed, total)} " +
+                          f"{completed} / {total}")
+            eta = JobQueue.eta(job)
+            if eta is not None:
+                value += f"\nETA: {datetime.timedelta(seconds=int(eta))}"
+            embed.add_field(name=f"#{job['id']} {job['kind']}", value=value,
+                            inline=False)
+        await send_message(ctx.channel, embed)
+    except Exception as e:
+        logging.exception(e)
         await send_message(ctx.channel,
-                           "All clear!" if total_issues == 0 else
-                           f"{total_issues} students with consistency issues")
+                           f"Error encountered when handling request: {e}")
 
-        logging.info("Successfully completed consistency check for " +
-                     f"{ctx.guild.id}")
+
+@bot.command(
+    name='gr-cancel',
+    help="Cancels a queued or running grading check. Call with the job ID"
+)
+async def gr_cancel(ctx, job_id: int):
+    logging.info(f"Cancelling job {job_id} for {ctx.guild.id}")
+    try:
+        if not job_queue.cancel(ctx.guild.id, job_id):
+            await send_message(ctx.channel,
+                               f"No job #{job_id} found for this server")
+            return
+        await send_message(ctx.channel, f"Cancelled job #{job_id}")
     except Exception as e:
         logging.exception(e)
         await send_message(ctx.channel,
                            f"Error encountered when handling request: {e}")
 
+# -----------------------------------------------------------------------------#
+# START JOBS
+
+
+def _queued_message(job, created):
+    if not created:
+        return (f"An identical check is already queued as job #{job['id']}" +
+                ", its results will be posted here too")
+    return (f"Queued as job #{job['id']}, results will be posted here. " +
+            "Use 'gr-jobs' to check on it")
+
+
+job_queue = JobQueue(executor, database, {
+    'ungraded': ConsistencyChecker.ungraded_job,
+    'consistency': ConsistencyChecker.consistency_job
+}, delivery.deliver, publish=delivery.deliver_partial)
+
 # -----------------------------------------------------------------------------#
 # START EVENTS
 
@@ -266,14 +394,23 @@ async def on_connect():
     logging.info("Bot finished loading external files!")
     if not pull_threads.is_running():
         pull_threads.start()
+    if not warm_cache.is_running():
+        warm_cache.start()
+    job_queue.start()
 
 
-@tasks.loop(seconds=REFRESH_DELAY*60)
+@tasks.loop(seconds=POLL_TICK)
 async def pull_threads():
     try:
-        for guild_id in database.guild_ids():
-            # TODO: Shard blocking
-            await DiscordHelper.refresh_threads(guild_id, database, bot)
+        await DiscordHelper.refresh_all_threads(database, bot, scheduler)
+    except Exception as e:
+        logging.exception(e)
+
+
+@tasks.loop(seconds=CACHE_WARM_TICK)
+async def warm_cache():
+    try:
+        await warmer.tick(database)
     except Exception as e:
         logging.exception(e)
 
@@ -281,7 +418,13 @@ async def pull_threads():
 @bot.event
 async def close():
     logging.info("Shutting down, saving database")
+    # Stop everything that can still write to the database first
+    await job_queue.stop()
+    await warmer.stop()
+    executor.shutdown()
     database.save()
+    database.close()
+    await AsyncEdHelper.close_sessions()
 
 # -----------------------------------------------------------------------------#
 # START BOT
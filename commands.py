@@ -5,16 +5,24 @@ import argparse
 import datetime
 
 from src.ed_helper import EdHelper
+from src.async_ed_helper import AsyncEdHelper
+from src.assignment_context import AssignmentContext
 from src.consistency_checker import ConsistencyChecker
+from src.checkpoint import Checkpoint
+from src.snapshot import (
+    EdSnapshot, SnapshotEdHelper
+)
 from src.utils import (
     progress_bar, invert_csv
 )
 from src.exceptions import (
     MissingArgument, InvalidArgument
 )
-from src.constants import TEMP_DIR
+from src.constants import (
+    TEMP_DIR, CHECK_CONCURRENCY
+)
 
-CHOICES = ['consistency', 'ungraded', 'check_feedback_boxes']
+CHOICES = ['consistency', 'ungraded', 'check_feedback_boxes', 'snapshot']
 PROGRESS_INCREMENT = 50
 
 
@@ -57,31 +65,99 @@ async def main():
         dest='ferpa', action='store_true'
     )
     parser.set_defaults(ferpa=False)
+    parser.add_argument(
+        '--jsonl', '-j',
+        help="Also writes consistency results as JSON lines",
+        dest='jsonl', action='store_true'
+    )
+    parser.set_defaults(jsonl=False)
+    parser.add_argument(
+        '--full',
+        help="Rechecks every student instead of only the ones that changed " +
+             "since the last consistency check",
+        dest='incremental', action='store_false'
+    )
+    parser.set_defaults(incremental=True)
+    parser.add_argument(
+        '--restart',
+        help="Starts over instead of resuming an interrupted run with the " +
+             "same arguments",
+        dest='resume', action='store_false'
+    )
+    parser.set_defaults(resume=True)
+    parser.add_argument(
+        '--snapshot',
+        help="Path to an assignment snapshot. The snapshot command saves " +
+             "one, every other command runs against it without calling Ed"
+    )
     parser.add_argument(
         '--query', '-q',
         help="Search query term"
     )
+    parser.add_argument(
+        '--concurrency', '-n',
+        help="How many students to check against Ed at once",
+        type=int, default=CHECK_CONCURRENCY
+    )
 
     args = parser.parse_args()
-    await globals()[args.command](args)
+    try:
+        await globals()[args.command](args)
+    finally:
+        await AsyncEdHelper.close_sessions()
 
 
-async def consistency(args):
+async def _ed_helper(args):
+    """
+    Returns the Ed helper for an analysis command: one answering from the
+    snapshot if --snapshot is given (the assignment link defaults to the
+    snapshot's), otherwise one for the validated Ed token
+    """
+    if args.snapshot is None:
+        return await _live_ed_helper(args)
+    snapshot = EdSnapshot.load(args.snapshot)
+    if args.assignment_link is None:
+        args.assignment_link = snapshot.url
+    print(f"\nUsing snapshot captured at {snapshot.captured_at}")
+    return SnapshotEdHelper(snapshot)
+
+
+async def _live_ed_helper(args):
+    """
+    Returns the Ed helper for the validated Ed token and assignment link
+    """
     if args.ed_token is None:
         raise MissingArgument("Ed token required to run grading checks")
     if args.assignment_link is None:
         raise MissingArgument("Assignment link required to run grading checks")
-    if not EdHelper.valid_token(args.ed_token):
+    if not await AsyncEdHelper.valid_token(args.ed_token):
         raise InvalidArgument("Ed token is invalid")
     if not EdHelper.valid_assignment_url(args.assignment_link):
         raise InvalidArgument("Assignment link is invalid")
+    return await AsyncEdHelper.create(args.ed_token)
+
 
+async def consistency(args):
+    ed_helper = await _ed_helper(args)
     spreadsheet = None
     if args.scrubbed_spreadsheet is not None:
         spreadsheet = invert_csv(open(args.scrubbed_spreadsheet).read())
 
-    ed_helper = EdHelper(args.ed_token)
+    context = await AssignmentContext.create(ed_helper, args.assignment_link)
     file_name = os.path.join(TEMP_DIR, f'user-{datetime.datetime.now()}')
+    # Students' results don't depend on the spreadsheet, only on what's
+    # checked. Snapshot runs are quick and should be reproducible, so they
+    # don't checkpoint or reuse earlier results
+    checkpoint = None
+    if args.snapshot is None:
+        checkpoint = await Checkpoint.open(
+            Checkpoint.key('consistency', args.assignment_link,
+                           args.template),
+            args.resume
+        )
+    if checkpoint is not None and checkpoint.done:
+        print(f"\nResuming from checkpoint ({len(checkpoint.done)} " +
+              "students already checked)")
 
     print("\nRunning consistency checker:")
     print(progress_bar(0, 1), end='\r', flush=True)
@@ -92,8 +168,11 @@ async def consistency(args):
 
     fixes, not_present, total_issues = (
         await ConsistencyChecker.check_consistency(
-            ed_helper, args.assignment_link, file_name, args.template,
-            spreadsheet, update_progress, args.ferpa
+            ed_helper, context, file_name, args.template,
+            spreadsheet, update_progress, args.ferpa, args.concurrency,
+            jsonl=args.jsonl,
+            incremental=args.incremental and args.snapshot is None,
+            checkpoint=checkpoint
         )
     )
 
@@ -115,24 +194,25 @@ async def consistency(args):
             print(f"\t{link}")
     print()
     print("Result files can be found at:" +
-          f"\n\t{file_name}.csv\n\t{file_name}.html\n")
+          f"\n\t{file_name}.csv\n\t{file_name}.html" +
+          (f"\n\t{file_name}.jsonl" if args.jsonl else "") + "\n")
 
 
 async def ungraded(args):
-    if args.ed_token is None:
-        raise MissingArgument("Ed token required to run grading checks")
-    if args.assignment_link is None:
-        raise MissingArgument("Assignment link required to run grading checks")
-    if not EdHelper.valid_token(args.ed_token):
-        raise InvalidArgument("Ed token is invalid")
-    if not EdHelper.valid_assignment_url(args.assignment_link):
-        raise InvalidArgument("Assignment link is invalid")
-
+    ed_helper = await _ed_helper(args)
     spreadsheet = None
     if args.scrubbed_spreadsheet is not None:
         spreadsheet = open(args.scrubbed_spreadsheet)
 
-    ed_helper = EdHelper(args.ed_token)
+    context = await AssignmentContext.create(ed_helper, args.assignment_link)
+    checkpoint = None
+    if args.snapshot is None:
+        checkpoint = await Checkpoint.open(
+            Checkpoint.key('ungraded', args.assignment_link), args.resume
+        )
+    if checkpoint is not None and checkpoint.done:
+        print(f"\nResuming from checkpoint ({len(checkpoint.done)} " +
+              "students already converted)")
     print("\nRunning grade completion checker:")
     print(progress_bar(0, 1), end='\r', flush=True)
 
@@ -142,7 +222,8 @@ async def ungraded(args):
 
     key_to_ungraded, not_present, total_ungraded = (
         await ConsistencyChecker.check_ungraded(
-            ed_helper, args.assignment_link, spreadsheet, update_progress
+            ed_helper, context, spreadsheet, update_progress,
+            args.concurrency, checkpoint=checkpoint
         )
     )
 
@@ -162,23 +243,14 @@ async def ungraded(args):
 
 
 async def check_feedback_boxes(args):
-    if args.ed_token is None:
-        raise MissingArgument("Ed token required to check feedback boxes")
-    if args.assignment_link is None:
-        raise MissingArgument("Assignment link required to check feedback " +
-                              "boxes")
     if args.query is None:
         raise MissingArgument("Query to search for required when checking " +
                               "feedback boxes")
-    if not EdHelper.valid_token(args.ed_token):
-        raise InvalidArgument("Ed token is invalid")
-    if not EdHelper.valid_assignment_url(args.assignment_link):
-        raise InvalidArgument("Assignment link is invalid")
+    ed_helper = await _ed_helper(args)
 
     args.query = args.query.lower()
-    ed_helper = EdHelper(args.ed_token)
     ids = EdHelper.get_ids(args.assignment_link)
-    results = ed_helper.get_attempt_results(ids[1])
+    results = await ed_helper.get_attempt_results(ids[1])
 
     print()
     print(f"Running check for: {args.assignment_link}")
@@ -191,8 +263,11 @@ async def check_feedback_boxes(args):
 
         user_id = result['user_id']
         email = result['email']
-        attempt_id = ed_helper.get_attempts(ids[1], user_id)['final_id']
-        response = ed_helper.get_quiz_responses(attempt_id, ids[2])[0]
+        attempts = await ed_helper.get_attempts(ids[1], user_id)
+        attempt_id = attempts['final_id']
+        response = (
+            await ed_helper.get_quiz_responses(attempt_id, ids[2])
+        )[0]
 
         if (response is not None and
                 response['lesson_mark'] is not None and
@@ -212,5 +287,27 @@ async def check_feedback_boxes(args):
     print(f"Total number of occurrences found: {len(found)}")
 
 
+async def snapshot(args):
+    if args.snapshot is not None and os.path.exists(args.snapshot):
+        raise InvalidArgument(f"{args.snapshot} already exists")
+    ed_helper = await _live_ed_helper(args)
+    file_path = args.snapshot or os.path.join(
+        TEMP_DIR, f'snapshot-{datetime.datetime.now()}.json.gz'
+    )
+
+    print("\nCapturing assignment:")
+    print(progress_bar(0, 1), end='\r', flush=True)
+
+    async def update_progress(curr, total):
+        print(progress_bar(curr, total), end='\n' if curr == total
+              else '\r', flush=True)
+
+    captured = await EdSnapshot.capture(ed_helper.token, args.assignment_link,
+                                        args.concurrency, update_progress)
+    captured.save(file_path)
+    print(f"\nCaptured {len(captured.responses)} Ed responses to:" +
+          f"\n\t{file_path}\n")
+
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,119 @@
+import asyncio
+import datetime
+
+from typing import (
+    Optional, Dict, TYPE_CHECKING
+)
+
+from src.ed_helper import (
+    EdHelper, EdRegex
+)
+from src.constants import (
+    ASSIGNMENT_GRACE_MINUTES
+)
+
+if TYPE_CHECKING:
+    from src.async_ed_helper import AsyncEdHelper
+
+
+class AssignmentContext:
+    """
+    Represents everything about a single Ed assignment that stays the same for
+    every student. Built once per command so the checkers don't refetch the
+    slide, lesson, challenge or rubric per student
+    """
+
+    def __init__(
+        self,
+        url: str,
+        slide: Dict,
+        lesson: Optional[Dict],
+        challenge: Optional[Dict],
+        rubric: Optional[Dict]
+    ):
+        """
+        Constructs a new assignment context from already fetched Ed objects.
+        Use AssignmentContext.create to fetch them
+
+        Params: 'url' - The ed assignment url, with any email removed
+                'slide' - The Ed slide object for the url
+                'lesson' - The Ed lesson object (attempt slides only)
+                'challenge' - The Ed challenge object (challenge slides only)
+                'rubric' - The Ed rubric object (attempt slides only)
+        """
+        self.url = url
+        self.ids = EdHelper.get_ids(url)
+        self.course_id, self.lesson_id, self.slide_id = (
+            self.ids[0], self.ids[1], self.ids[2]
+        )
+        self.attempt_slide = EdHelper.is_overall_submission_link(url)
+        self.slide = slide
+        self.lesson = lesson
+        self.challenge = challenge
+        self.rubric = rubric
+        self.challenge_id = (slide['challenge_id']
+                             if not self.attempt_slide else None)
+
+        if not self.attempt_slide:
+            self.due_at = EdHelper.parse_datetime(challenge['due_at'],
+                                                  milliseconds=False)
+            self.num_criteria = len(challenge['settings']['criteria'])
+            self.rubric_index = {}
+        else:
+            self.due_at = EdHelper.parse_datetime(lesson['due_at'],
+                                                  milliseconds=False)
+            self.num_criteria = len(rubric['sections'])
+            self.rubric_index = EdHelper._index_rubric(rubric)
+
+    @property
+    def title(
+        self
+    ) -> str:
+        """
+        Returns: The title of the assignment slide
+        """
+        return self.slide['title']
+
+    @property
+    def closed_at(
+        self
+    ) -> float:
+        """
+        Returns: When (epoch seconds) the assignment stopped taking
+                 submissions, its due date plus ASSIGNMENT_GRACE_MINUTES
+        """
+        return (self.due_at + datetime.timedelta(
+            minutes=ASSIGNMENT_GRACE_MINUTES
+        )).timestamp()
+
+    @staticmethod
+    async def create(
+        ed_helper: 'AsyncEdHelper',
+        url: str
+    ) -> 'AssignmentContext':
+        """
+        Fetches all assignment-wide information needed by the checkers
+
+        Params: 'ed_helper' - A properly initialized AsyncEdHelper object with
+                              API access to the ed assignment
+                'url' - The url of the ed assignment
+        Returns: The assignment context for the url
+        """
+        url = EdRegex.EMAIL_REGEX.sub('', url)
+        lesson_id, slide_id = EdHelper.get_ids(url)[1:3]
+
+        async def get_rubric():
+            return await ed_helper.get_rubric(
+                await ed_helper.get_rubric_id(slide_id)
+            )
+
+        lesson, challenge, rubric = None, None, None
+        if not EdHelper.is_overall_submission_link(url):
+            slide = await ed_helper.get_slide(url)
+            challenge = await ed_helper.get_challenge(slide['challenge_id'])
+        else:
+            slide, lesson, rubric = await asyncio.gather(
+                ed_helper.get_slide(url), ed_helper.get_lesson(lesson_id),
+                get_rubric()
+            )
+        return AssignmentContext(url, slide, lesson, challenge, rubric)
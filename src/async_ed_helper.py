@@ -0,0 +1,864 @@
+import asyncio
+import json
+import logging
+import time
+import aiohttp
+
+from typing import (
+    Optional, List, Dict, Any, Tuple, Mapping, Awaitable, Union
+)
+from src.constants import (
+    LOGGING_FILE, ED_CONNECTION_LIMIT, ED_DNS_CACHE_TTL, ED_KEEPALIVE_TIMEOUT,
+    ED_REQUEST_TIMEOUT, ED_CACHE_TTLS, ED_CACHE_STALE, ED_DISK_CACHE_TTLS,
+    RECONCILE_CONCURRENCY
+)
+from src.exceptions import (
+    InvalidResponse, InvalidEdToken, EdRequestFailed
+)
+from src.ed_helper import (
+    EdConstants, EdRegex, EdHelper, EdTokenCache
+)
+from src.assignment_context import AssignmentContext
+from src.rate_limiter import (
+    TokenBucket, RetryPolicy
+)
+from src.response_cache import ResponseCache
+from src.disk_cache import DiskCache
+from src.utils import bounded_map
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class AsyncEdHelper:
+    """
+    Represents an asyncio interface with the Ed API. Mirrors EdHelper, but
+    every request is an awaitable made over a pooled aiohttp session that is
+    shared by all helpers using the same token
+    """
+
+    # (token, event loop) -> session. Sessions are bound to the loop they
+    # were created on, so helpers used from several loops get one each
+    _sessions: Dict[Tuple[str, Any], aiohttp.ClientSession] = {}
+
+    # Ed GET responses shared by every helper, see ED_CACHE_TTLS
+    cache = ResponseCache()
+    # Ed GET responses shared with other processes, see ED_DISK_CACHE_TTLS
+    disk_cache = DiskCache()
+    # cache key -> in-flight background revalidation
+    _revalidating: Dict[Tuple, Any] = {}
+    # token -> shared helper, see AsyncEdHelper.for_token
+    _helpers: Dict[str, 'AsyncEdHelper'] = {}
+
+    def __init__(
+        self,
+        token: str,
+        retries: Optional[int] = 5,
+        connection_limit: Optional[int] = ED_CONNECTION_LIMIT
+    ):
+        """
+        Constructs a new async ed helper instance from the given API token.
+        Does not validate the token. Prefer AsyncEdHelper.for_token or
+        AsyncEdHelper.create, which share one helper per token
+
+        Params: 'token' - The Ed API token to use with requests
+                'retries' - How many times to attempt each request
+                'connection_limit' - The max number of simultaneous
+                                     connections to Ed for this token
+        """
+        self.token = token
+        self.retries = retries
+        self.connection_limit = connection_limit
+
+    @staticmethod
+    def for_token(
+        token: str,
+        retries: Optional[int] = 5,
+        connection_limit: Optional[int] = ED_CONNECTION_LIMIT
+    ) -> 'AsyncEdHelper':
+        """
+        Returns the process-wide helper for the given API token, creating it
+        if needed. The token isn't validated up front, if Ed rejects it
+        requests raise InvalidEdToken instead
+
+        Params: 'retries', 'connection_limit' - Only used if the helper
+                                                doesn't exist yet
+        """
+        helper = AsyncEdHelper._helpers.get(token)
+        if helper is None:
+            helper = AsyncEdHelper(token, retries, connection_limit)
+            AsyncEdHelper._helpers[token] = helper
+        return helper
+
+    @staticmethod
+    async def create(
+        token: str,
+        retries: Optional[int] = 5,
+        connection_limit: Optional[int] = ED_CONNECTION_LIMIT
+    ) -> 'AsyncEdHelper':
+        """
+        Returns the shared helper for the given API token, making sure the
+        token is valid first. If it isn't, raises InvalidEdToken. Tokens
+        validated within ED_TOKEN_VALIDATION_TTL aren't checked with Ed again
+        """
+        helper = AsyncEdHelper.for_token(token, retries, connection_limit)
+        try:
+            await helper.user()
+            return helper
+        except InvalidResponse:
+            raise InvalidEdToken
+
+    async def user(
+        self
+    ) -> Dict:
+        """
+        Returns: The Ed user object (including courses) for this helper's
+                 token, reusing the last validation until it expires. Raises
+                 InvalidResponse if the token is invalid
+        """
+        user = EdTokenCache.get(self.token)
+        if user is not None:
+            return user
+        try:
+            user = await self._get(EdConstants.USER_REQUEST)
+        except Exception:
+            raise InvalidResponse("Invalid Ed token")
+        EdTokenCache.put(self.token, user)
+        return user
+
+    def _session(
+        self
+    ) -> aiohttp.ClientSession:
+        """
+        Returns: The pooled session for this helper's token on the running
+                 event loop, creating it if needed
+        """
+        key = (self.token, asyncio.get_running_loop())
+        session = AsyncEdHelper._sessions.get(key)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                ttl_dns_cache=ED_DNS_CACHE_TTL,
+                keepalive_timeout=ED_KEEPALIVE_TIMEOUT
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=ED_REQUEST_TIMEOUT),
+                headers={'Authorization': 'Bearer ' + self.token}
+            )
+            AsyncEdHelper._sessions[key] = session
+        return session
+
+    async def _get(
+        self,
+        url: str,
+        payload: Optional[Dict] = None,
+        endpoint: Optional[str] = None,
+        prefer_cache_after: Optional[float] = None
+    ) -> Any:
+        """
+        Makes a GET request to the given 'url' endpoint with url params
+        'payload'. If 'endpoint' has a TTL in ED_CACHE_TTLS, the response is
+        served from / stored in the shared response cache. If it has a TTL in
+        ED_DISK_CACHE_TTLS, responses missing from memory are served from /
+        stored in the persistent response store
+
+        Params: 'prefer_cache_after' - When (epoch seconds) the response
+                                       stopped changing. A stored response
+                                       fetched after then is served without
+                                       revalidating, however old it is
+        """
+        ttl = ED_CACHE_TTLS.get(endpoint)
+        if ttl is None:
+            if endpoint not in ED_DISK_CACHE_TTLS:
+                return await self._check_token(get_response(
+                    self._session(), url, self.retries,
+                    TokenBucket.for_key(self.token), payload
+                ))
+            return (await self._get_stored(
+                ResponseCache.key(self.token, url, payload), url, payload,
+                endpoint, prefer_cache_after
+            ))[0]
+
+        cache = AsyncEdHelper.cache
+        key = ResponseCache.key(self.token, url, payload)
+        entry = cache.get(key)
+        if entry is not None and entry.fresh():
+            cache.record('hits')
+            return entry.value
+        if entry is not None and entry.servable_stale():
+            # Serve what we have and let Ed take its time in the background
+            cache.record('stale_hits')
+            if key not in AsyncEdHelper._revalidating:
+                task = asyncio.ensure_future(
+                    self._revalidate(key, url, payload, ttl, endpoint)
+                )
+                task.add_done_callback(AsyncEdHelper._revalidated)
+                AsyncEdHelper._revalidating[key] = task
+            return entry.value
+
+        cache.record('misses')
+        return await self._revalidate(key, url, payload, ttl, endpoint)
+
+    @staticmethod
+    def _revalidated(
+        task: asyncio.Task
+    ) -> None:
+        """
+        Done callback of background revalidations, logging why one failed
+        since nothing else awaits it
+        """
+        if not task.cancelled() and task.exception() is not None:
+            logging.info(f"Background revalidation failed: {task.exception()}")
+
+    async def _revalidate(
+        self,
+        key: Tuple,
+        url: str,
+        payload: Optional[Dict],
+        ttl: float,
+        endpoint: Optional[str] = None
+    ) -> Any:
+        """
+        Fetches the response cached under 'key', sending the cached validators
+        so Ed can answer 304 if nothing changed. If Ed fails temporarily and
+        the cached response is still servable, returns it instead of raising.
+        If Ed says the resource is gone, the cached response is dropped.
+        Responses
+        that aren't cached at all come from the persistent response store if
+        'endpoint' has a TTL in ED_DISK_CACHE_TTLS
+        """
+        cache = AsyncEdHelper.cache
+        entry = cache.get(key)
+        try:
+            if entry is None and endpoint in ED_DISK_CACHE_TTLS:
+                body, headers, fresh_for = await self._get_stored(
+                    key, url, payload, endpoint
+                )
+                # Don't keep it in memory longer than it's fresh on disk
+                return cache.put(key, body, min(ttl, fresh_for),
+                                 headers).value
+            modified, headers, body = await self._check_token(
+                get_conditional(
+                    self._session(), url, self.retries,
+                    TokenBucket.for_key(self.token), payload,
+                    entry.conditional_headers() if entry is not None else None
+                )
+            )
+            if not modified and entry is not None:
+                cache.record('revalidated')
+                entry.refresh(ttl)
+                if endpoint in ED_DISK_CACHE_TTLS:
+                    await asyncio.to_thread(AsyncEdHelper.disk_cache.touch,
+                                            key)
+                return entry.value
+            if endpoint in ED_DISK_CACHE_TTLS:
+                await asyncio.to_thread(AsyncEdHelper.disk_cache.put, key,
+                                        endpoint, body, headers)
+            return cache.put(key, body, ttl, headers).value
+        except EdRequestFailed as e:
+            if e.status in RetryPolicy.GONE_STATUSES:
+                cache.discard(key)
+            elif (RetryPolicy.transient(e.status) and entry is not None and
+                    entry.servable_stale()):
+                logging.info(f"Serving stale response for {url}")
+                return entry.value
+            raise
+        finally:
+            AsyncEdHelper._revalidating.pop(key, None)
+
+    async def _get_stored(
+        self,
+        key: Tuple,
+        url: str,
+        payload: Optional[Dict],
+        endpoint: str,
+        prefer_cache_after: Optional[float] = None
+    ) -> Tuple[Any, Dict[str, str], float]:
+        """
+        Gets the response stored under 'key' in the persistent response
+        store, fetching it from Ed (with the stored validators) if it isn't
+        stored or is older than its ED_DISK_CACHE_TTLS TTL. If Ed fails
+        temporarily and the stored response is within ED_CACHE_STALE of its
+        TTL, returns it instead of raising. If Ed says the resource is gone,
+        the stored response is dropped
+
+        Params: 'prefer_cache_after' - Same as _get
+        Returns: The response body, its validator headers and how many more
+                 seconds it's fresh for
+        """
+        disk_cache = AsyncEdHelper.disk_cache
+        ttl = ED_DISK_CACHE_TTLS[endpoint]
+        stored = await asyncio.to_thread(disk_cache.get, key)
+        if stored is not None:
+            value, headers, stored_at = stored
+            age = time.time() - stored_at
+            if (age < ttl or (prefer_cache_after is not None and
+                              stored_at >= prefer_cache_after)):
+                disk_cache.record('hits')
+                return value, headers, max(ttl - age, 0)
+
+        try:
+            modified, headers, body = await self._check_token(
+                get_conditional(
+                    self._session(), url, self.retries,
+                    TokenBucket.for_key(self.token), payload,
+                    stored[1] if stored is not None else None
+                )
+            )
+        except EdRequestFailed as e:
+            if e.status in RetryPolicy.GONE_STATUSES:
+                if stored is not None:
+                    await asyncio.to_thread(disk_cache.discard, key)
+            elif (RetryPolicy.transient(e.status) and stored is not None and
+                    age < ttl + ED_CACHE_STALE):
+                logging.info(f"Serving stale stored response for {url}")
+                return value, stored[1], 0
+            raise
+        if not modified and stored is not None:
+            disk_cache.record('revalidated')
+            await asyncio.to_thread(disk_cache.touch, key)
+            return value, stored[1], ttl
+        disk_cache.record('misses')
+        await asyncio.to_thread(disk_cache.put, key, endpoint, body, headers)
+        return body, headers, ttl
+
+    async def _post(
+        self,
+        url: str,
+        payload: Optional[Dict] = None
+    ) -> Any:
+        """
+        Makes a POST request to the given 'url' endpoint with json 'payload'
+        """
+        return await self._check_token(post_payload(
+            self._session(), url, self.retries,
+            TokenBucket.for_key(self.token), payload
+        ))
+
+    async def _check_token(
+        self,
+        request: Awaitable[Any]
+    ) -> Any:
+        """
+        Awaits 'request'. If Ed rejects the token, forgets everything cached
+        for it and raises InvalidEdToken
+        """
+        try:
+            return await request
+        except EdRequestFailed as e:
+            if e.status != 401:
+                raise
+            logging.info("Ed rejected token, invalidating cached data")
+            EdTokenCache.invalidate(self.token)
+            AsyncEdHelper.cache.invalidate(self.token)
+            await asyncio.to_thread(AsyncEdHelper.disk_cache.invalidate,
+                                    self.token)
+            raise InvalidEdToken("Ed token was rejected") from e
+
+    async def push_answer(
+        self,
+        thread_id: str,
+        answer: str
+    ) -> None:
+        """
+        Pushes an answer to the given Ed thread
+
+        Params: 'thread_id' - ID of the Ed thread to push a response to
+                'answer' - The answer to be pushed
+        """
+        logging.info(f"Pushing answer to {thread_id}")
+        payload = {'comment': {
+            'type': 'answer',
+            'content': f"<document version=\"2.0\"><paragraph>{answer}" +
+                       "</paragraph></document>",
+            'is_private': False,
+            'is_anonymous': False
+        }}
+        response = await self._post(EdConstants.POST_REQUEST.format(
+            thread_id=thread_id), payload
+        )
+        logging.info(response)
+        # Ed doesn't give a response body for accepting an answer
+        await self._post(EdConstants.ACCEPT_REQUEST.format(
+            comment_id=response['comment']['id']
+        ))
+
+    async def valid_course(
+        self,
+        url: str
+    ) -> bool:
+        """
+        Returns if the course represented by the given url is valid for the
+        initial auth token
+        """
+        courses = (await self.user())['courses']
+        if EdRegex.COURSE_PATTERN.fullmatch(url):
+            course_id = int(EdHelper.get_ids(url)[0])
+            for course in courses:
+                if course['course']['id'] == course_id:
+                    return course['course']
+        raise InvalidResponse
+
+    async def get_threads(
+        self,
+        course_id: int,
+        offset: Optional[int] = 0,
+        filters: Optional[Dict] = None
+    ) -> List[Dict]:
+        """
+        Params: 'course_id' - The ID of the Ed course to get threads for
+                'offset' - How many of the newest threads to skip
+                'filters' - Extra url params for Ed to filter threads by
+        Returns: A list of Ed thread objects for the course, newest first
+        """
+        payload = {'limit': EdConstants.THREAD_LIMIT, 'sort': 'new'}
+        if offset:
+            payload['offset'] = offset
+        payload.update(filters or {})
+        return (await self._get(EdConstants.THREAD_REQUEST.format(
+            id=course_id
+        ), payload, 'threads'))['threads']
+
+    async def get_lessons(
+        self,
+        course_id: int
+    ) -> List[Dict]:
+        """
+        Params: 'course_id' - The ID of the Ed course to get lessons for
+        Returns: A list of Ed lesson objects for the course
+        """
+        return (await self._get(EdConstants.COURSE_LESSONS.format(
+            course_id=course_id
+        ), endpoint='lessons'))['lessons']
+
+    async def get_new_threads(
+        self,
+        course_id: int,
+        cursor: Optional[Dict] = None,
+        filters: Optional[Dict] = None
+    ) -> Tuple[List[Dict], Optional[Dict]]:
+        """
+        Pages through a course's threads, newest first, until reaching the
+        high-water mark 'cursor' so no thread posted since the last sync is
+        missed. Without a cursor only the first page is fetched
+
+        Params: 'course_id' - The ID of the Ed course to get threads for
+                'cursor' - The newest thread seen on the last sync, as
+                           returned by this method
+                'filters' - Extra url params for Ed to filter threads by
+        Returns: Every thread fetched (newest first), and the new cursor
+        """
+        threads = []
+        for page in range(EdConstants.THREAD_MAX_PAGES):
+            page_threads = await self.get_threads(
+                course_id, page * EdConstants.THREAD_LIMIT, filters
+            )
+            threads.extend(page_threads)
+            # Check the oldest thread on the page since pinned threads can
+            # show up first regardless of age
+            if (cursor is None or
+                    len(page_threads) < EdConstants.THREAD_LIMIT or
+                    page_threads[-1]['id'] <= cursor['id']):
+                break
+        else:
+            logging.info(f"Stopped syncing course {course_id} after " +
+                         f"{EdConstants.THREAD_MAX_PAGES} pages")
+
+        newest = max(threads, key=lambda thread: thread['id'], default=None)
+        if newest is None or (cursor is not None and
+                              newest['id'] <= cursor['id']):
+            return threads, cursor
+        return threads, {'id': newest['id'],
+                         'created_at': newest['created_at']}
+
+    async def get_thread(
+        self,
+        thread_id: int
+    ) -> Dict:
+        """
+        Params: 'thread_id' - The ID of the Ed thread to get
+        Returns: The Ed thread object matching the given ID
+        """
+        return (await self._get(EdConstants.BASE_THREAD.format(
+            thread_id=thread_id
+        ), endpoint='thread'))['thread']
+
+    async def get_thread_states(
+        self,
+        thread_ids: List[Union[int, str]],
+        concurrency: Optional[int] = RECONCILE_CONCURRENCY
+    ) -> Dict[str, Optional[Dict]]:
+        """
+        Fetches the current state of many threads, at most 'concurrency' at
+        a time
+
+        Params: 'thread_ids' - The IDs of the Ed threads to check
+                'concurrency' - How many threads to fetch at once
+        Returns: A dictionary mapping thread ID -> Ed thread object, or None
+                 if the thread was deleted. Threads whose state couldn't be
+                 fetched are left out
+        """
+        thread_ids = [str(thread_id) for thread_id in thread_ids]
+
+        async def get_state(thread_id: str) -> Tuple[bool, Optional[Dict]]:
+            try:
+                return True, await self.get_thread(thread_id)
+            except EdRequestFailed as e:
+                if e.status == 404:
+                    return True, None
+                logging.info(f"Unable to check thread {thread_id}: {e}")
+                return False, None
+
+        states = await bounded_map(get_state, thread_ids, concurrency)
+        return {thread_id: state for thread_id, (known, state)
+                in zip(thread_ids, states) if known}
+
+    async def get_slide(
+        self,
+        url: str
+    ) -> Dict:
+        """
+        Params: 'url' - The url of the of the slide to get
+        Returns: An Ed slide object
+        """
+        payload = {'view': 1}
+        return (await self._get(EdConstants.SLIDE_REQUEST.format(
+            slide_id=EdHelper.get_ids(url)[2]
+        ), payload, 'slide'))['slide']
+
+    async def get_challenge_users(
+        self,
+        challenge_id: int
+    ) -> List[Dict]:
+        """
+        Params: 'challenge_id' - The ID of the Ed challenge to get users for
+        Returns: A list of Ed user objects for the challenge
+        """
+        return (await self._get(EdConstants.CHALLENGE_USER_REQUEST.format(
+            challenge_id=challenge_id
+        ), endpoint='challenge_users'))['users']
+
+    async def get_challenge(
+        self,
+        challenge_id: int
+    ) -> Dict:
+        """
+        Params: 'challenge_id' - The ID of the Ed challenge to get
+                                 information for
+        Returns: An Ed challenge object corresponding to the given ID
+        """
+        return (await self._get(EdConstants.BASE_CHALLENGE.format(
+            challenge_id=challenge_id
+        ), endpoint='challenge'))['challenge']
+
+    async def get_challenge_submissions(
+        self,
+        user_id: int,
+        challenge_id: int
+    ) -> List[Dict]:
+        """
+        Params: 'user_id' - The ID of the Ed user to get submissions for
+                'challenge_id' - The ID of the ed challenge
+        Returns: A list of Ed submission objects for the challenge
+        """
+        return (await self._get(EdConstants.CHALLENGE_SUBMISSIONS.format(
+            user_id=user_id, challenge_id=challenge_id
+        ), endpoint='submissions'))['submissions']
+
+    async def get_attempt_results(
+        self,
+        lesson_id: int
+    ) -> List[Dict]:
+        """
+        Params: 'lesson_id' - The ID of the Ed lesson to get the attempt
+                              results for
+        Returns: A list of Ed result objects for the lesson
+        """
+        return await self._get(EdConstants.ED_ATTEMPT_RESULTS_REQUEST.format(
+            lesson_id=lesson_id
+        ), endpoint='attempt_results')
+
+    async def get_lesson(
+        self,
+        lesson_id: int
+    ) -> Dict:
+        """
+        Params 'lesson_id' - The ID of the Ed lesson to get
+        Returns: An Ed lesson object matching the given id
+        """
+        return (await self._get(EdConstants.ED_LESSON_REQUEST.format(
+            lesson_id=lesson_id
+        ), endpoint='lesson'))['lesson']
+
+    async def get_rubric(
+        self,
+        rubric_id: int
+    ) -> Dict:
+        """
+        Params 'rubric_id' - The ID of the rubric to get
+        Returns: An Ed rubric object matching the given ID
+        """
+        return (await self._get(EdConstants.ED_RUBRIC_REQUEST.format(
+            rubric_id=rubric_id
+        ), endpoint='rubric'))['rubric']
+
+    async def get_rubric_id(
+        self,
+        slide_id: int
+    ) -> Dict:
+        """
+        Params 'slide_id' - The ID of the quiz slide to get the rubric of
+        Returns: The rubric ID for this quiz slide
+        """
+        return (await self._get(EdConstants.ED_QUESTION_REQUEST.format(
+            slide_id=slide_id
+        ), endpoint='questions'))['questions'][0]['rubric_id']
+
+    async def get_attempt_mark(
+        self,
+        mark_id: int
+    ) -> Dict:
+        """
+        Params 'mark_id' - The ID of the lesson mark to get
+        Returns: The Ed mark object matching the given ID
+        """
+        return await self._get(EdConstants.ED_MARK_REQUEST.format(
+            mark_id=mark_id
+        ), endpoint='mark')
+
+    async def get_quiz_responses(
+        self,
+        attempt_id: int,
+        slide_id: int
+    ) -> List[Dict]:
+        """
+        Params: 'attempt_id' - The ID of the attempt to get response for
+                'slide_id' - The ID of the quiz slide with responses
+        Returns: The responses for the quiz on the given slide and on the
+                 attempt matching the given id. Includes selected rubric
+                 options
+        """
+        return (await self._get(EdConstants.ED_QUIZ_REQUEST.format(
+            lesson_attempt_id=attempt_id, slide_id=slide_id
+        ), endpoint='quiz_responses'))['responses']
+
+    async def get_attempts(
+        self,
+        lesson_id: int,
+        user_id: int,
+        closed_at: Optional[float] = None
+    ) -> Dict:
+        """
+        Returns the attempts for a specific user within a specific lesson
+
+        Params: 'lesson_id' - The lesson ID to get attempts for
+                'user_id' - The user to get attempts for
+                'closed_at' - When (epoch seconds) the lesson stopped taking
+                              attempts, if known. Attempts fetched after then
+                              are reused without asking Ed again
+        """
+        return await self._get(EdConstants.ED_ATTTEMPT_REQUEST.format(
+            lesson_id=lesson_id, user_id=user_id
+        ), endpoint='attempts', prefer_cache_after=closed_at)
+
+    async def get_attempt_submissions(
+        self,
+        user_id: int,
+        context: AssignmentContext,
+        submission_id: int
+    ) -> List[Dict]:
+        """
+        Converts Ed attempt feedback information into the previous challenge
+        format
+
+        Params: 'user_id' - The ID of the user to get submission information
+                            for
+                'context' - The assignment being checked, rubric included
+                'submission_id' - The ID of the specific submission to check
+                                  feedback of
+        Returns: A dict containing relevant submission feedback information
+                 for the user
+        """
+        attempt_response = await self.get_attempts(context.lesson_id, user_id,
+                                                   context.closed_at)
+        final_id, final_submission_time = EdHelper._final_attempt(
+            attempt_response
+        )
+        if final_submission_time is None:
+            # No final submission submitted
+            return None
+
+        ed_quiz_responses = await self.get_quiz_responses(final_id,
+                                                          context.slide_id)
+        mark = await self.get_attempt_mark(
+            ed_quiz_responses[0]['lesson_mark']['id']
+        )
+        return EdHelper._format_attempt_submissions(
+            submission_id, final_submission_time,
+            ed_quiz_responses[0]['lesson_mark'], mark, context.rubric_index
+        )
+
+    async def get_attempt_user(
+        self,
+        user: Dict,
+        context: AssignmentContext
+    ) -> Dict:
+        """
+        Converts Ed attempt feedback completion information into the previous
+        challenge format
+
+        Params: 'user' - An Ed attempt user object
+                'context' - The assignment being checked, rubric included
+        Returns: A dict containing relevant submission information for the user
+        """
+        ret = {
+            'id': user['user_id'],
+            'tutorial': user['tutorial'],
+            'completed': False,
+            'feedback_status': 'incomplete'
+        }
+
+        attempt_response = await self.get_attempts(context.lesson_id,
+                                                   user['user_id'],
+                                                   context.closed_at)
+        if "final_id" not in attempt_response:
+            return ret
+        final_id = attempt_response['final_id']
+
+        ret['completed'] = True
+        ed_quiz_responses = await self.get_quiz_responses(final_id,
+                                                          context.slide_id)
+        mark = await self.get_attempt_mark(
+            ed_quiz_responses[0]['lesson_mark']['id']
+        )
+        if (len(EdHelper._selected_rubric_items(mark)) ==
+                context.num_criteria):
+            ret['feedback_status'] = 'complete'
+
+        return ret
+
+    @staticmethod
+    async def valid_token(
+        token: str,
+        retries: Optional[int] = 5
+    ) -> Dict:
+        """
+        If the given token is valid, returns the corresponding ed user object.
+        Otherwise raises InvalidResponse
+        """
+        return await AsyncEdHelper.for_token(token, retries).user()
+
+    @staticmethod
+    async def close_sessions() -> None:
+        """
+        Closes every pooled session that belongs to the running event loop.
+        Should be called before the loop shuts down
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[task for task
+                               in AsyncEdHelper._revalidating.values()
+                               if task.get_loop() is loop],
+                             return_exceptions=True)
+        for key in [key for key in AsyncEdHelper._sessions
+                    if key[1] is loop]:
+            await AsyncEdHelper._sessions.pop(key).close()
+
+
+async def _request(
+    session: aiohttp.ClientSession,
+    method: str,
+    url: str,
+    retries: int,
+    limiter: TokenBucket,
+    idempotent: bool,
+    **kwargs
+) -> Tuple[int, Mapping[str, str], Any]:
+    """
+    Makes a 'method' request to the given 'url' endpoint over the pooled
+    'session', waiting on 'limiter' before every attempt and retrying as
+    RetryPolicy decides. Raises EdRequestFailed if the request can't succeed.
+    Returns the status, headers and parsed body of the successful response
+    """
+    status = None
+    for i in range(retries):
+        await asyncio.sleep(limiter.reserve())
+        headers, sent = None, True
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                if response.ok:
+                    logging.debug(f"{method} response for {url}: {response}")
+                    body = await response.text()
+                    return (response.status, response.headers,
+                            json.loads(body) if body else None)
+                status, headers = response.status, response.headers
+        except aiohttp.ClientConnectorError:
+            # The connection was never made, so the request wasn't sent
+            status, sent = None, False
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = None
+
+        delay = RetryPolicy.delay(i, status, headers, idempotent, sent)
+        if delay is None:
+            raise EdRequestFailed(f"{method} {url} failed with status " +
+                                  f"{status}", status)
+        if status == 429:
+            # Everyone using this token is being throttled, not just us
+            limiter.pause(delay)
+        logging.debug(f"{method} attempt {i + 1}/{retries} for {url} " +
+                      f"failed ({status}), retrying in {delay:.2f}s")
+        if i < retries - 1:
+            await asyncio.sleep(delay)
+    raise EdRequestFailed(f"{method} {url} failed after {retries} attempts",
+                          status)
+
+
+async def get_response(
+    session: aiohttp.ClientSession,
+    url: str,
+    retries: int,
+    limiter: TokenBucket,
+    payload: Optional[Dict] = None
+) -> Any:
+    """
+    Makes a GET request to the given 'url' endpoint over the pooled 'session'
+    using url params 'payload'
+    """
+    return (await _request(session, 'GET', url, retries, limiter, True,
+                           params=payload))[2]
+
+
+async def get_conditional(
+    session: aiohttp.ClientSession,
+    url: str,
+    retries: int,
+    limiter: TokenBucket,
+    payload: Optional[Dict] = None,
+    headers: Optional[Dict[str, str]] = None
+) -> Tuple[bool, Mapping[str, str], Any]:
+    """
+    Makes a conditional GET request to the given 'url' endpoint over the
+    pooled 'session' using url params 'payload' and validator 'headers'.
+    Returns whether or not the response was modified, the response headers
+    and the parsed body (None when unmodified)
+    """
+    status, response_headers, body = await _request(
+        session, 'GET', url, retries, limiter, True, params=payload,
+        headers=headers
+    )
+    return status != 304, response_headers, body
+
+
+async def post_payload(
+    session: aiohttp.ClientSession,
+    url: str,
+    retries: int,
+    limiter: TokenBucket,
+    payload: Optional[Dict] = None
+) -> Any:
+    """
+    Makes a POST request to the given 'url' endpoint over the pooled 'session'
+    using json params 'payload'. Only retried when Ed didn't process it
+    """
+    return (await _request(session, 'POST', url, retries, limiter, False,
+                           json=payload))[2]
@@ -0,0 +1,203 @@
+import asyncio
+import datetime
+import logging
+
+from collections import defaultdict
+from typing import (
+    Optional, Dict, List, Any, Tuple
+)
+from src.constants import (
+    LOGGING_FILE, CACHE_WARM_LEAD, CACHE_WARM_SPACING,
+    ASSIGNMENT_GRACE_MINUTES
+)
+from src.exceptions import (
+    EdRequestFailed, InvalidEdToken
+)
+from src.ed_helper import EdHelper
+from src.async_ed_helper import AsyncEdHelper
+from src.assignment_context import AssignmentContext
+from src.database import Database
+from src.metrics import Metrics
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class CacheWarmer:
+    """
+    Represents background prefetching of the Ed data gr-check and
+    gr-consistency need for lessons that are about to be due, so the checks
+    everyone runs right after the deadline mostly hit the response caches
+    (and only revalidate what changed) instead of all fetching at once.
+
+    Each lesson is warmed once per due date: first every quiz slide's
+    assignment data (slide, lesson, rubric) and the lesson's roster, then
+    each student's attempts, quiz responses and marks, spread out over time.
+    Each lesson is warmed again once it closes (its due date plus
+    ASSIGNMENT_GRACE_MINUTES): attempts fetched after then can't change, so
+    every check after the deadline reuses them from disk. Only one lesson is
+    warmed at a time
+    """
+
+    ATTEMPT_LINK = ('https://edstem.org/us/courses/{course_id}/lessons/' +
+                    '{lesson_id}/attempts?slide={slide_id}')
+
+    def __init__(
+        self,
+        lead: Optional[float] = CACHE_WARM_LEAD,
+        spacing: Optional[float] = CACHE_WARM_SPACING
+    ):
+        """
+        Params: 'lead' - How many seconds before a lesson's due date to warm
+                         it
+                'spacing' - How many seconds to wait between students
+        """
+        self.lead = lead
+        self.spacing = spacing
+        # (course, lesson ID) -> the due date it was warmed for
+        self.warmed: Dict[Tuple[str, str], str] = {}
+        # (course, lesson ID) -> the due date it was warmed after closing for
+        self.closed: Dict[Tuple[str, str], str] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def _upcoming(
+        self,
+        lessons: List[Dict]
+    ) -> List[Dict]:
+        """
+        Params: 'lessons' - Ed lesson objects for a course
+        Returns: The lessons due within 'lead' seconds
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        window = datetime.timedelta(seconds=self.lead)
+        return [lesson for lesson in lessons if lesson.get('due_at') and
+                now < EdHelper.parse_datetime(lesson['due_at'],
+                                              milliseconds=False)
+                <= now + window]
+
+    def _closed(
+        self,
+        lessons: List[Dict]
+    ) -> List[Dict]:
+        """
+        Params: 'lessons' - Ed lesson objects for a course
+        Returns: The lessons that closed (their due date plus
+                 ASSIGNMENT_GRACE_MINUTES) within the last 'lead' seconds
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        window = datetime.timedelta(seconds=self.lead)
+        grace = datetime.timedelta(minutes=ASSIGNMENT_GRACE_MINUTES)
+        return [lesson for lesson in lessons if lesson.get('due_at') and
+                now - window < EdHelper.parse_datetime(lesson['due_at'],
+                                                       milliseconds=False)
+                + grace <= now]
+
+    async def tick(
+        self,
+        database: Database
+    ) -> None:
+        """
+        Starts warming every lesson that's now within 'lead' of its due date
+        and hasn't been warmed for it yet, and every lesson that has closed
+        since and hasn't been warmed again. Does nothing while the last
+        lessons are still being warmed
+
+        Params: 'database' - The bot's database
+        """
+        if self.task is not None and not self.task.done():
+            return
+
+        courses = defaultdict(list)
+        for guild_id in database.guild_ids():
+            courses[database.get_course(guild_id)].append(guild_id)
+
+        queued = []
+        for course, guild_ids in courses.items():
+            ed_helper = AsyncEdHelper.for_token(
+                database.get_token(guild_ids[0])
+            )
+            try:
+                lessons = await ed_helper.get_lessons(course)
+            except (EdRequestFailed, InvalidEdToken) as e:
+                logging.info(f"Unable to get lessons for course {course}: {e}")
+                continue
+            for lesson in self._upcoming(lessons):
+                key = (str(course), str(lesson['id']))
+                if self.warmed.get(key) != lesson['due_at']:
+                    self.warmed[key] = lesson['due_at']
+                    queued.append((ed_helper, course, lesson['id']))
+            for lesson in self._closed(lessons):
+                key = (str(course), str(lesson['id']))
+                if self.closed.get(key) != lesson['due_at']:
+                    self.closed[key] = lesson['due_at']
+                    queued.append((ed_helper, course, lesson['id']))
+
+        if queued:
+            self.task = asyncio.ensure_future(self._warm(queued))
+
+    async def _warm(
+        self,
+        queued: List[Tuple[AsyncEdHelper, Any, Any]]
+    ) -> None:
+        """
+        Warms each (helper, course, lesson ID) one after another
+        """
+        for ed_helper, course, lesson_id in queued:
+            try:
+                await self._warm_lesson(ed_helper, course, lesson_id)
+            except (EdRequestFailed, InvalidEdToken) as e:
+                logging.info(f"Stopped warming lesson {lesson_id}: {e}")
+            except Exception as e:
+                logging.exception(e)
+
+    async def _warm_lesson(
+        self,
+        ed_helper: AsyncEdHelper,
+        course: Any,
+        lesson_id: Any
+    ) -> None:
+        """
+        Fetches everything a check of any of the lesson's quiz slides would,
+        one student at a time
+        """
+        lesson = await ed_helper.get_lesson(lesson_id)
+        contexts = []
+        for slide in lesson.get('slides', []):
+            if slide.get('type') != 'quiz':
+                continue
+            try:
+                contexts.append(await AssignmentContext.create(
+                    ed_helper, CacheWarmer.ATTEMPT_LINK.format(
+                        course_id=course, lesson_id=lesson_id,
+                        slide_id=slide['id']
+                    )
+                ))
+            except (EdRequestFailed, IndexError, KeyError, TypeError) as e:
+                # Not every quiz is graded with a rubric
+                logging.info(f"Not warming slide {slide['id']}: {e}")
+        if not contexts:
+            return
+
+        attempts = await ed_helper.get_attempt_results(lesson_id)
+        logging.info(f"Warming {len(attempts)} students for lesson " +
+                     f"{lesson_id} ({len(contexts)} slides)")
+        for attempt in attempts:
+            for context in contexts:
+                try:
+                    await ed_helper.get_attempt_user(attempt, context)
+                except EdRequestFailed as e:
+                    logging.info(f"Unable to warm user {attempt['user_id']}" +
+                                 f": {e}")
+            Metrics.increment('cache_warmed_students')
+            await asyncio.sleep(self.spacing)
+
+    async def stop(
+        self
+    ) -> None:
+        """
+        Cancels any warming in progress
+        """
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from typing import (
+    Optional, Dict, Any, Union
+)
+from src.constants import (
+    LOGGING_FILE, CHECKPOINT_DIR, CHECKPOINT_INTERVAL
+)
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class Checkpoint:
+    """
+    Represents the progress of a single check, saved to disk every
+    'interval' students so a check that's interrupted (bot restart, Ed
+    outage) continues where it left off when run again with the same
+    arguments. The checkpoint is deleted once the check finishes
+    """
+
+    def __init__(
+        self,
+        key: str,
+        directory: Optional[str] = CHECKPOINT_DIR,
+        interval: Optional[int] = CHECKPOINT_INTERVAL
+    ):
+        """
+        Params: 'key' - What identifies the check, i.e. from Checkpoint.key
+                'directory' - Where checkpoints are saved
+                'interval' - How many students to finish between saves
+        """
+        self.key = key
+        self.file_path = os.path.join(directory, key + '.json')
+        self.interval = interval
+        self.done: Dict[str, Any] = {}
+        self.resumed = 0
+        self.unsaved = 0
+        self.saving = None
+
+    @staticmethod
+    def key(
+        *params: Any
+    ) -> str:
+        """
+        Params: 'params' - Everything that affects the check's results (kind,
+                           link, flags, spreadsheet, ...). Must be JSON
+                           serializable
+        Returns: A key that's equal for checks that would produce the same
+                 results
+        """
+        return hashlib.sha256(json.dumps(params, sort_keys=True)
+                              .encode('utf-8')).hexdigest()
+
+    @staticmethod
+    async def open(
+        key: str,
+        resume: Optional[bool] = True
+    ) -> 'Checkpoint':
+        """
+        Params: 'key' - What identifies the check, i.e. from Checkpoint.key
+                'resume' - Whether or not to continue from the check's last
+                           checkpoint, otherwise it starts over (and
+                           overwrites the checkpoint as it goes)
+        Returns: The check's checkpoint, loaded off the event loop
+        """
+        checkpoint = Checkpoint(key)
+        if resume:
+            await asyncio.to_thread(checkpoint.load)
+        return checkpoint
+
+    def load(
+        self
+    ) -> 'Checkpoint':
+        """
+        Loads the students finished before the check was last interrupted
+
+        Returns: This checkpoint
+        """
+        try:
+            self.done = json.load(open(self.file_path))
+        except FileNotFoundError:
+            self.done = {}
+        except json.JSONDecodeError:
+            logging.warning(f"Ignoring corrupt checkpoint {self.file_path}")
+            self.done = {}
+        if self.done:
+            logging.info(f"Resuming check {self.key} with {len(self.done)} " +
+                         "students already done")
+        return self
+
+    def get(
+        self,
+        user_id: Union[int, str]
+    ) -> Optional[Any]:
+        """
+        Params: 'user_id' - The student's Ed user ID
+        Returns: The student's result if they were finished before the check
+                 was interrupted, otherwise None
+        """
+        result = self.done.get(str(user_id))
+        if result is not None:
+            self.resumed += 1
+        return result
+
+    async def put(
+        self,
+        user_id: Union[int, str],
+        result: Any
+    ) -> None:
+        """
+        Records a finished student, saving the checkpoint every 'interval'
+        students. Saves happen off the event loop, and are skipped while the
+        last one is still being written
+
+        Params: 'user_id' - The student's Ed user ID
+                'result' - The student's JSON serializable result
+        """
+        self.done[str(user_id)] = result
+        self.unsaved += 1
+        if self.unsaved >= self.interval and self.saving is None:
+            self.unsaved = 0
+            self.saving = asyncio.ensure_future(asyncio.to_thread(
+                self._write, json.dumps(self.done)
+            ))
+            try:
+                await self.saving
+            finally:
+                self.saving = None
+
+    def _write(
+        self,
+        data: str
+    ) -> None:
+        """
+        Atomically replaces the checkpoint file with 'data'
+        """
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, self.file_path)
+
+    async def clear(
+        self
+    ) -> None:
+        """
+        Deletes the checkpoint once its check has finished
+        """
+        if self.saving is not None:
+            await asyncio.gather(self.saving, return_exceptions=True)
+        try:
+            os.remove(self.file_path)
+        except FileNotFoundError:
+            pass
+        logging.info(f"Finished check {self.key}, {self.resumed} students " +
+                     "resumed from its checkpoint")
@@ -1,20 +1,27 @@
+import asyncio
 import os
-from collections import defaultdict
+from collections import defaultdict, Counter
 import datetime
 import re
 import logging
 
 from typing import (
-    List, Dict, Optional, Callable, Tuple, Union
+    List, Dict, Optional, Callable, Tuple, Union, Any, Awaitable
 )
 from src.utils import (
-    write_csv, convert_csv_to_html
+    bounded_map
 )
 from src.constants import (
-    TEMP_DIR, PROGRESS_UPDATE_MULTIPLE, ASSIGNMENT_GRACE_MINUTES, LOGGING_FILE
+    TEMP_DIR, PROGRESS_UPDATE_MULTIPLE, ASSIGNMENT_GRACE_MINUTES, LOGGING_FILE,
+    CHECK_CONCURRENCY
 )
 
 from src.ed_helper import EdHelper
+from src.async_ed_helper import AsyncEdHelper
+from src.assignment_context import AssignmentContext
+from src.report_sink import ReportSink
+from src.fingerprints import FingerprintStore
+from src.checkpoint import Checkpoint
 
 logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
                     level=logging.INFO)
@@ -33,6 +40,52 @@ class ConsistencyRegex:
 
 
 class ConsistencyChecker:
+    @staticmethod
+    def _progress_reporter(
+        progress_bar_update: Optional[Callable[[int, int], None]],
+        action: str
+    ) -> Callable[[int, int], None]:
+        """
+        Params: 'progress_bar_update' - A function to call with incremental
+                                        values that updates a user-viewable
+                                        progress bar (can be None)
+                'action' - What to call finished students in the logs
+        Returns: A function to call with (completed, total) every time a
+                 student finishes that only reports every
+                 PROGRESS_UPDATE_MULTIPLE students
+        """
+        async def report(completed: int, total: int):
+            if completed % PROGRESS_UPDATE_MULTIPLE == 0:
+                if progress_bar_update is not None:
+                    await progress_bar_update(completed, total)
+                logging.info(f"{completed} / {total} {action}")
+        return report
+
+    @staticmethod
+    def _group_reporter(
+        keys: List[Any],
+        partial: Optional[Callable[[str, List[Any]], Awaitable[None]]]
+    ) -> Callable[[int, Any], Awaitable[None]]:
+        """
+        Params: 'keys' - The group (TA | section) of every student, in the
+                         order they're checked
+                'partial' - A function to call with (group, results) once
+                            every student in a group is done (can be None)
+        Returns: A function to call with (index, result) every time a student
+                 finishes that calls 'partial' with the group's results, in
+                 check order, once the group is complete
+        """
+        remaining, results = Counter(keys), {}
+
+        async def finished(index: int, result: Any):
+            results[index] = result
+            key = keys[index]
+            remaining[key] -= 1
+            if partial is not None and not remaining[key]:
+                await partial(key, [results[i] for i in range(len(keys))
+                                    if keys[i] == key])
+        return finished
+
     @staticmethod
     def _count_ungraded(
         users: List[Dict],
@@ -68,54 +121,90 @@ class ConsistencyChecker:
 
     @staticmethod
     async def check_ungraded(
-        ed_helper: EdHelper,
-        url: str,
+        ed_helper: AsyncEdHelper,
+        context: AssignmentContext,
         spreadsheet: Optional[Dict[str, str]] = None,
-        progress_bar_update: Optional[Callable[[int, int], None]] = None
+        progress_bar_update: Optional[Callable[[int, int], None]] = None,
+        concurrency: Optional[int] = CHECK_CONCURRENCY,
+        partial: Optional[Callable[[str, int], Awaitable[None]]] = None,
+        checkpoint: Optional[Checkpoint] = None
     ) -> Tuple[Dict[str, int], int, int]:
         """
         Checks and organizes information regarding ungraded students for a
         given ed assignment
 
-        Params: 'ed_helper' - A properly initialized EdHelper object with API
-                              access to the ed assignment
-                'url' - The url of the ed assignment to check
+        Params: 'ed_helper' - A properly initialized AsyncEdHelper object with
+                              API access to the ed assignment
+                'context' - The ed assignment to check
                 'spreadsheet' - A dictionary mapping ed user_id -> TA name. If
                                 none, section codes will be used instead
                 'progress_bar_update' - A function to call with incremental
                                         values that updates a user-viewable
                                         progress bar
-                'attachment_url' - The url of the attachment sent with the
-                                   initial user request (can be None)
+                'concurrency' - How many students to convert at once
+                'partial' - A function to call with (section | TA, total
+                            ungraded) as soon as every student in that group
+                            is converted. Only called for attempt slides,
+                            since challenge users come back all at once
+                'checkpoint' - Where converted students are saved as the
+                               check goes, students already in it aren't
+                               converted again. Cleared once the check
+                               finishes
         Returns: A dictionary mapping either (section | TA) -> total ungraded
                  depending on if an attachment_url, the total number of
                  students not present in the given spreadsheet, and the total
                  number of ungraded students
         """
-        url = ConsistencyRegex.EMAIL_REGEX.sub('', url)
-        attempt_slide = EdHelper.is_overall_submission_link(url)
-
         users = None
-        if not attempt_slide:
-            slide = ed_helper.get_slide(url)
+        if not context.attempt_slide:
             users = [user for user
-                     in ed_helper.get_challenge_users(slide['challenge_id'])
+                     in await ed_helper.get_challenge_users(
+                         context.challenge_id)
                      if user['course_role'] == 'student']
         else:
-            ids = EdHelper.get_ids(url)
-            lesson_id, slide_id = ids[1], ids[2]
-            rubric = ed_helper.get_rubric(ed_helper.get_rubric_id(slide_id))
-            attempts, users = ed_helper.get_attempt_results(lesson_id), []
-
-            for i in range(len(attempts)):
-                if i % PROGRESS_UPDATE_MULTIPLE == 0:
-                    if progress_bar_update:
-                        await progress_bar_update(i, len(attempts))
-                    logging.info(f"{i} / {len(attempts)} Converted")
+            attempts = await ed_helper.get_attempt_results(context.lesson_id)
+
+            def key_of(attempt: Dict) -> Optional[str]:
+                if spreadsheet:
+                    return spreadsheet.get(str(attempt['user_id']))
+                return attempt['tutorial']
+
+            async def report_group(key: str, users: List[Dict]):
+                if spreadsheet and key is None:
+                    # Students missing from the spreadsheet aren't a group
+                    return
+                await partial(key, ConsistencyChecker._count_ungraded(
+                    users, spreadsheet
+                )[2])
+
+            # Convert a group at a time so each group is done as early as
+            # possible
+            attempts.sort(key=lambda attempt: str(key_of(attempt)))
+            finished = ConsistencyChecker._group_reporter(
+                [key_of(attempt) for attempt in attempts],
+                report_group if partial is not None else None
+            )
 
-                users.append(ed_helper.get_attempt_user(attempts[i], lesson_id,
-                                                        slide_id, rubric))
+            async def convert_user(indexed: Tuple[int, Dict]) -> Dict:
+                user_id = indexed[1]['user_id']
+                user = (checkpoint.get(user_id)
+                        if checkpoint is not None else None)
+                if user is None:
+                    user = await ed_helper.get_attempt_user(indexed[1],
+                                                            context)
+                    if checkpoint is not None:
+                        await checkpoint.put(user_id, user)
+                await finished(indexed[0], user)
+                return user
+
+            users = await bounded_map(
+                convert_user, list(enumerate(attempts)), concurrency,
+                ConsistencyChecker._progress_reporter(progress_bar_update,
+                                                      "Converted")
+            )
 
+        if checkpoint is not None:
+            await checkpoint.clear()
         return ConsistencyChecker._count_ungraded(users, spreadsheet)
 
     @staticmethod
@@ -242,21 +331,26 @@ class ConsistencyChecker:
 
     @staticmethod
     async def _find_fixes(
-        ed_helper: EdHelper,
-        url: str,
+        ed_helper: AsyncEdHelper,
+        context: AssignmentContext,
         template: Optional[bool] = False,
         spreadsheet: Optional[Dict[str, str]] = None,
         progress_bar_update: Optional[Callable[[int, int], None]] = None,
-        ferpa: Optional[bool] = True
+        ferpa: Optional[bool] = True,
+        concurrency: Optional[int] = CHECK_CONCURRENCY,
+        partial: Optional[Callable[[str, List[Tuple[str, str]]],
+                                   Awaitable[None]]] = None,
+        fingerprints: Optional[FingerprintStore] = None,
+        checkpoint: Optional[Checkpoint] = None
     ) -> Tuple[Dict[str, List[Tuple[str, str]]], List[str]]:
         """
         Finds all student submissions that have inconsistently formatted
         grading feedback and creates a dictionary containing the fixes that
         need to be made before publishing grades
 
-        Params: 'ed_helper' - A properly initialized EdHelper object with API
-                              access to the ed assignment
-                'url' - The ed assignment url
+        Params: 'ed_helper' - A properly initialized AsyncEdHelper object with
+                              API access to the ed assignment
+                'context' - The ed assignment to check
                 'template' - Whether or not the grading template is expected,
                              default False
                 'spreadsheet' - A dictionary mapping ed student ID to TA name,
@@ -266,42 +360,45 @@ class ConsistencyChecker:
                                         progress bar, default None
                 'ferpa' - Whether or not to censor student emails from links,
                           default True
+                'concurrency' - How many students to check at once, default
+                                CHECK_CONCURRENCY
+                'partial' - A function to call with (TA | section, [(link,
+                            fixes)]) as soon as every student in that group
+                            is checked, default None
+                'fingerprints' - The loaded fingerprints of the last check,
+                                 students that haven't changed since aren't
+                                 fetched again. Updated with this check's
+                                 results. Default None (check everyone)
+                'checkpoint' - Where checked students are saved as the check
+                               goes, students already in it aren't checked
+                               again. Default None
         Returns: A dictionary mapping (TA | link) -> (link, fixes) for all
                  assignment that had incorrect formatting and a List of links
                  to student assignments not found in the grading spreadsheet
         """
-        attempt_slide = EdHelper.is_overall_submission_link(url)
+        ids, attempt_slide = context.ids, context.attempt_slide
 
-        # Get the challenge id for the assignment
-        ids = EdHelper.get_ids(url)
-        lesson_id, slide_id = ids[1], ids[2]
-        challenge_id = (ed_helper.get_slide(url)['challenge_id']
-                        if not attempt_slide else None)
-
-        # Get user/challenge information
-        users, due_at, num_criteria, rubric = None, None, None, None
+        # Get user information, along with a fingerprint of each user's
+        # summary row to tell whether they changed since the last check
+        users, summaries = None, {}
         if not attempt_slide:
+            rows = [user for user in await ed_helper.get_challenge_users(
+                        context.challenge_id)
+                    if user['course_role'] == "student"]
             users = [(user['id'], None, user['tutorial'], None)
-                     for user in ed_helper.get_challenge_users(challenge_id)
-                     if user['course_role'] == "student"]
-
-            challenge = ed_helper.get_challenge(challenge_id)
-            due_at = EdHelper.parse_datetime(challenge['due_at'],
-                                             milliseconds=False)
-            num_criteria = len(challenge['settings']['criteria'])
+                     for user in rows]
         else:
+            rows = [attempt for attempt in await ed_helper.get_attempt_results(
+                        context.lesson_id)
+                    if attempt['course_role'] == 'student']
             users = [(attempt['user_id'], attempt['email'],
                       attempt['tutorial'], attempt['sourced_id'])
-                     for attempt in ed_helper.get_attempt_results(lesson_id)
-                     if attempt['course_role'] == 'student']
-
-            lesson = ed_helper.get_lesson(lesson_id)
-            due_at = EdHelper.parse_datetime(lesson['due_at'],
-                                             milliseconds=False)
-            rubric = ed_helper.get_rubric(ed_helper.get_rubric_id(slide_id))
-            num_criteria = len(rubric['sections'])
+                     for attempt in rows]
+        if fingerprints is not None:
+            summaries = {user[0]: FingerprintStore.summary(row)
+                         for user, row in zip(users, rows)}
 
-        fixes, not_present, count = defaultdict(list), [], 0
+        fixes, not_present, to_check = defaultdict(list), [], []
         for (user_id, email, section, submission_id) in users:
             if spreadsheet and str(user_id) not in spreadsheet:
                 # This student isn't present in the grading spreadsheet, skip
@@ -309,75 +406,122 @@ class ConsistencyChecker:
                     ids, user_id, email, submission_id, attempt_slide, ferpa
                 ))
                 continue
+            to_check.append((user_id, email, section, submission_id))
 
-            if count % PROGRESS_UPDATE_MULTIPLE == 0:
-                if progress_bar_update is not None:
-                    _ = await progress_bar_update(count, len(users))
-                logging.info(f"{count} / {len(users)} Completed")
-            count += 1
+        def key_of(user: Tuple[int, str, str, str]) -> str:
+            return (user[2] if spreadsheet is None
+                    else spreadsheet[str(user[0])])
+
+        def link_of(user: Tuple[int, str, str, str],
+                    submission_id: str) -> str:
+            return ConsistencyChecker._get_link(
+                ids, user[0], user[1], submission_id, attempt_slide, ferpa
+            )
 
-            submissions = (ed_helper.get_challenge_submissions(
-                                user_id, challenge_id
+        async def report_group(
+            key: str,
+            group: List[Tuple[Tuple, Tuple]]
+        ):
+            await partial(key, [(link_of(user, submission_id),
+                                 submission_fixes)
+                                for user, (submission_fixes, submission_id)
+                                in group if submission_fixes])
+
+        # Check a group (TA | section) at a time, in roster order within the
+        # group, so each group's results are complete as early as possible
+        to_check.sort(key=lambda user: str(key_of(user)))
+        finished = ConsistencyChecker._group_reporter(
+            [key_of(user) for user in to_check],
+            report_group if partial is not None else None
+        )
+
+        async def evaluate_user(
+            user: Tuple[int, str, str, str]
+        ) -> Tuple[Union[None, str], Union[None, str]]:
+            # The dependent calls for a single student stay in order, only
+            # separate students are run concurrently
+            user_id, _, _, submission_id = user
+            submissions = (await ed_helper.get_challenge_submissions(
+                                user_id, context.challenge_id
                            ) if not attempt_slide else
-                           ed_helper.get_attempt_submissions(
-                                user_id, lesson_id, slide_id,
-                                submission_id, rubric
+                           await ed_helper.get_attempt_submissions(
+                                user_id, context, submission_id
                            ))
-            if submissions is None:
-                continue
+            graded = (FingerprintStore.graded(submissions)
+                      if fingerprints is not None else None)
+            result = (fingerprints.evaluated(user_id, graded)
+                      if fingerprints is not None else None)
+            if result is None:
+                result = (None, None)
+                if submissions is not None:
+                    result = ConsistencyChecker._find_submission_fixes(
+                        submissions, context.num_criteria, context.due_at,
+                        template
+                    )
+            if fingerprints is not None:
+                fingerprints.put(user_id, summaries[user_id], graded, result)
+            return result
+
+        async def find_user_fixes(
+            indexed: Tuple[int, Tuple[int, str, str, str]]
+        ) -> Tuple[Union[None, str], Union[None, str]]:
+            index, user = indexed
+            result = (checkpoint.get(user[0])
+                      if checkpoint is not None else None)
+            if result is not None:
+                result = tuple(result)
+            elif fingerprints is not None:
+                result = fingerprints.unchanged(user[0], summaries[user[0]])
+            if result is None:
+                result = await evaluate_user(user)
+            if checkpoint is not None:
+                await checkpoint.put(user[0], list(result))
+            await finished(index, (user, result))
+            return result
+
+        if progress_bar_update is not None:
+            await progress_bar_update(0, len(to_check))
+        results = await bounded_map(
+            find_user_fixes, list(enumerate(to_check)), concurrency,
+            ConsistencyChecker._progress_reporter(progress_bar_update,
+                                                  "Completed")
+        )
 
-            submission_fixes, submission_id = (
-                ConsistencyChecker._find_submission_fixes(
-                    submissions, num_criteria, due_at, template
-                )
-            )
+        # Merge in check order so the report is the same on every run
+        for user, (submission_fixes, submission_id) in zip(to_check, results):
             if submission_fixes:
-                link = ConsistencyChecker._get_link(
-                    ids, user_id, email, submission_id, attempt_slide, ferpa
-                )
-
-                key = (section if spreadsheet is None
-                       else spreadsheet[str(user_id)])
-                fixes[key].append((link, submission_fixes))
+                fixes[key_of(user)].append((link_of(user, submission_id),
+                                            submission_fixes))
 
         logging.info("Completed consistency check")
         return fixes, not_present
 
-    @staticmethod
-    def _convert_fixes_to_list(
-        fixes: Dict[str, Tuple[str, str]]
-    ) -> List[List[str]]:
-        """
-        Converts the fixes dictionary to a list format used to export .csv and
-        .html files
-
-        Params: 'fixes' - A dictionary mapping (TA | link) -> (link, issue)
-        Returns: A list of [(TA | link), link, issue] lists
-        """
-        data = []
-        for ta, issues in fixes.items():
-            for (link, issue) in issues:
-                data.append([ta, link, issue])
-        return data
-
     @staticmethod
     async def check_consistency(
-        ed_helper: EdHelper,
-        url: str, file_name: str,
+        ed_helper: AsyncEdHelper,
+        context: AssignmentContext,
+        file_name: str,
         template: Optional[bool] = False,
         spreadsheet: Optional[Dict[str, str]] = None,
         progress_bar_update: Optional[Callable[[int, int], None]] = None,
-        ferpa: Optional[bool] = True
+        ferpa: Optional[bool] = True,
+        concurrency: Optional[int] = CHECK_CONCURRENCY,
+        partial: Optional[Callable[[str, List[Tuple[str, str]]],
+                                   Awaitable[None]]] = None,
+        jsonl: Optional[bool] = False,
+        incremental: Optional[bool] = True,
+        checkpoint: Optional[Checkpoint] = None
     ) -> Tuple[Dict[str, Tuple[str, str]], List[str], int]:
         """
         Checks and organizes information regarding grading consistency for a
-        given ed assignment.
-
-        Params: 'ed_helper' - A properly initialized EdHelper object with API
-                              access to the ed assignment
-                'url' - The url of the ed assignment to check
-                'file_name' - The name to use for the two saved .csv and .html
-                              files
+        given ed assignment. Each TA's (or section's) issues are written to
+        the report files as soon as all of their students are checked
+
+        Params: 'ed_helper' - A properly initialized AsyncEdHelper object with
+                              API access to the ed assignment
+                'context' - The ed assignment to check
+                'file_name' - The name to use for the saved .csv, .html (and
+                              .jsonl) files
                 'spreadsheet' - A dictionary mapping ed student ID to TA name
                                 (can be None)
                 'progress_bar_update' - A function to call with incremental
@@ -385,29 +529,117 @@ class ConsistencyChecker:
                                         progress bar
                 'ferpa' - Whether or not to censor student emails from links,
                           default True
+                'concurrency' - How many students to check at once, default
+                                CHECK_CONCURRENCY
+                'partial' - Same as _find_fixes
+                'jsonl' - Whether or not to also save a .jsonl file with one
+                          issue per line, default False
+                'incremental' - Whether or not to reuse the last check's
+                                results for students that haven't changed
+                                since (see FingerprintStore), default True
+                'checkpoint' - Same as _find_fixes, cleared once the check
+                               finishes. Default None
         Returns: A dictionary mapping (TA | link) -> (link, fixes) for all
                  assignment that had incorrect formatting, a list of links to
                  student assignments not found in the grading spreadsheet, and
                  the total number of issues found
         """
-        # Remove email since it mseese with ID regex
-        url = ConsistencyRegex.EMAIL_REGEX.sub('', url)
+        fingerprints = None
+        if incremental:
+            fingerprints = await asyncio.to_thread(FingerprintStore(
+                FingerprintStore.assignment_key(context, template)
+            ).load)
 
-        fixes, not_present = (
-            await ConsistencyChecker._find_fixes(
-                ed_helper, url, template, spreadsheet,
-                progress_bar_update, ferpa
+        file_path = os.path.join(TEMP_DIR, file_name)
+        async with ReportSink(file_path, jsonl) as sink:
+            async def report_group(key: str, issues: List[Tuple[str, str]]):
+                await sink.write([[key, link, issue]
+                                  for link, issue in issues])
+                if partial is not None:
+                    await partial(key, issues)
+
+            fixes, not_present = (
+                await ConsistencyChecker._find_fixes(
+                    ed_helper, context, template, spreadsheet,
+                    progress_bar_update, ferpa, concurrency, report_group,
+                    fingerprints, checkpoint
+                )
             )
-        )
+        if fingerprints is not None:
+            await asyncio.to_thread(fingerprints.save)
+        if checkpoint is not None:
+            await checkpoint.clear()
         if progress_bar_update:
             await progress_bar_update(1, 1)
 
-        # Write the info into files to be sent
-        data = ConsistencyChecker._convert_fixes_to_list(fixes)
-        total_issues = len(data)
+        return fixes, not_present, sink.rows
 
-        file_path = os.path.join(TEMP_DIR, file_name)
-        write_csv(file_path + ".csv", ['TA', 'Link', 'Issue'], data)
-        convert_csv_to_html(file_path + ".csv", file_path + ".html")
+    @staticmethod
+    async def ungraded_job(
+        token: str,
+        url: str,
+        spreadsheet: Optional[Dict[str, str]] = None,
+        checkpoint_key: Optional[str] = None,
+        resume: Optional[bool] = True,
+        progress: Optional[Callable[[int, int], None]] = None,
+        partial: Optional[Callable[[str, int], Awaitable[None]]] = None
+    ) -> Tuple[str, Tuple[Dict[str, int], int, int]]:
+        """
+        JobExecutor entry point for check_ungraded, building the Ed helper
+        and assignment context on the worker's event loop
+
+        Params: 'token' - The Ed API token to check with
+                'url' - The url of the ed assignment
+                'spreadsheet' - Same as check_ungraded
+                'checkpoint_key' - The key to checkpoint the check under
+                                   (see Checkpoint), None to not checkpoint
+                'resume' - Whether or not to continue from the last
+                           checkpoint under 'checkpoint_key'
+                'progress' - Same as check_ungraded's 'progress_bar_update'
+                'partial' - Same as check_ungraded
+        Returns: The assignment title and check_ungraded's results
+        """
+        ed_helper = await AsyncEdHelper.create(token)
+        context = await AssignmentContext.create(ed_helper, url)
+        checkpoint = (await Checkpoint.open(checkpoint_key, resume)
+                      if checkpoint_key is not None else None)
+        return context.title, await ConsistencyChecker.check_ungraded(
+            ed_helper, context, spreadsheet, progress, partial=partial,
+            checkpoint=checkpoint
+        )
 
-        return fixes, not_present, total_issues
+    @staticmethod
+    async def consistency_job(
+        token: str,
+        url: str,
+        file_name: str,
+        template: Optional[bool] = False,
+        spreadsheet: Optional[Dict[str, str]] = None,
+        checkpoint_key: Optional[str] = None,
+        resume: Optional[bool] = True,
+        progress: Optional[Callable[[int, int], None]] = None,
+        partial: Optional[Callable[[str, List[Tuple[str, str]]],
+                                   Awaitable[None]]] = None
+    ) -> Tuple[str, Tuple[Dict[str, Tuple[str, str]], List[str], int]]:
+        """
+        JobExecutor entry point for check_consistency, building the Ed helper
+        and assignment context on the worker's event loop
+
+        Params: 'token' - The Ed API token to check with
+                'url' - The url of the ed assignment
+                'file_name', 'template', 'spreadsheet' - Same as
+                                                        check_consistency
+                'checkpoint_key', 'resume' - Same as ungraded_job
+                'progress' - Same as check_consistency's
+                             'progress_bar_update'
+                'partial' - Same as check_consistency
+        Returns: The assignment title and check_consistency's results
+        """
+        ed_helper = await AsyncEdHelper.create(token)
+        context = await AssignmentContext.create(ed_helper, url)
+        checkpoint = (await Checkpoint.open(checkpoint_key, resume)
+                      if checkpoint_key is not None else None)
+        return context.title, await ConsistencyChecker.check_consistency(
+            ed_helper, context, file_name, template, spreadsheet, progress,
+            partial=partial, checkpoint=checkpoint
+        )
@@ -4,11 +4,57 @@ import os
 STORAGE_DIR = os.path.join(os.getcwd(), 'store')
 TEMP_DIR = os.path.join(os.getcwd(), 'temp')
 LOGGING_FILE = os.path.join(STORAGE_DIR, 'logging', 'base.log')
-DB_FILE = os.path.join(STORAGE_DIR, 'database.json')
+# SQLite database, migrated from database.json the first time it's opened.
+# Point at a .json file to keep using the JSON database instead
+DB_FILE = os.path.join(STORAGE_DIR, 'database.db')
+# JSON databases journal changes in the background. Queued changes are
+# written every JSON_FLUSH_INTERVAL seconds (or once JSON_FLUSH_BATCH are
+# queued), and the journal is compacted into the snapshot every
+# JSON_COMPACT_RECORDS changes
+JSON_FLUSH_INTERVAL = 1.0
+JSON_FLUSH_BATCH = 100
+JSON_COMPACT_RECORDS = 500
 AUTH_FILE = os.path.join(STORAGE_DIR, 'auth.json')
+JOBS_FILE = os.path.join(STORAGE_DIR, 'jobs.json')
+# What each consistency check saw per student, so reruns skip unchanged
+# students
+FINGERPRINT_DIR = os.path.join(STORAGE_DIR, 'fingerprints')
+# Progress of running checks, saved every CHECKPOINT_INTERVAL students so
+# an interrupted check resumes where it left off
+CHECKPOINT_DIR = os.path.join(TEMP_DIR, 'checkpoints')
+CHECKPOINT_INTERVAL = 25
 
 TIMEOUT = 45.0
 REFRESH_DELAY = 5
+# Adaptive thread polling, all in seconds. Courses are checked every
+# POLL_TICK and polled once their interval is up. The interval drops to
+# POLL_MIN_INTERVAL when new questions show up and is multiplied by
+# POLL_BACKOFF (up to POLL_MAX_INTERVAL) when none do. Within
+# POLL_DEADLINE_WINDOW of a lesson's due date a course is polled at least
+# every POLL_DEADLINE_INTERVAL. Intervals are randomly scaled by up to
+# +/- POLL_JITTER
+POLL_TICK = 30
+POLL_MIN_INTERVAL = 60
+POLL_MAX_INTERVAL = 30 * 60
+POLL_BACKOFF = 2
+POLL_JITTER = 0.1
+POLL_DEADLINE_WINDOW = 24 * 60 * 60
+POLL_DEADLINE_INTERVAL = 2 * 60
+
+# How many Ed courses have their threads refreshed at once, and how many
+# seconds a single course's refresh can take (guilds sharing a course are
+# refreshed together)
+REFRESH_CONCURRENCY = 5
+REFRESH_TIMEOUT = 120
+
+# Ed data for lessons due within CACHE_WARM_LEAD seconds is prefetched in
+# the background, so checks run right after the deadline mostly hit warm
+# caches. Courses are looked at every CACHE_WARM_TICK seconds, and students
+# are warmed CACHE_WARM_SPACING seconds apart to leave the token's Ed rate
+# limit to everything else
+CACHE_WARM_TICK = 5 * 60
+CACHE_WARM_LEAD = 60 * 60
+CACHE_WARM_SPACING = 1.0
 PULL_DELAY = 5
 
 # Viewable Ed link
@@ -30,3 +76,98 @@ ASSIGNMENT_GRACE_MINUTES = 15
 
 # Turns out discord has a max number of embed fields...
 DISCORD_MAX_EMBED_FIELDS = 25
+# ...and embeds (and characters across them) per message
+DISCORD_MAX_EMBEDS = 10
+DISCORD_MAX_EMBED_CHARS = 6000
+# ...and characters per embed description (less room for a "more" line)
+DISCORD_MAX_EMBED_DESCRIPTION = 4000
+
+# Reports longer than REPORT_MAX_MESSAGES messages are sent as one message
+# with page buttons, which stop working after REPORT_PAGE_TIMEOUT idle
+# seconds
+REPORT_MAX_MESSAGES = 2
+REPORT_PAGE_TIMEOUT = 60 * 60
+
+# How many report rows are buffered before being written to the report files
+REPORT_SINK_BATCH = 200
+
+# Outbound Discord calls are paced per bucket (channel) at a fixed rate
+# matching Discord's per-channel limit (5 messages / 5s) instead of waiting
+# on 429s. py-cord reads the X-RateLimit-* headers inside its HTTP client
+# and only returns response bodies, so the live headers can't be used here.
+# Calls that are rate limited anyway are retried
+DISCORD_BUCKET_RATE = 1
+DISCORD_BUCKET_BURST = 5
+DISCORD_MAX_RETRIES = 3
+
+# Ed connection pooling (aiohttp)
+ED_CONNECTION_LIMIT = 20
+ED_DNS_CACHE_TTL = 300
+ED_KEEPALIVE_TIMEOUT = 30
+ED_REQUEST_TIMEOUT = 30
+
+# How many students the checkers keep in flight with Ed at once
+CHECK_CONCURRENCY = 10
+
+# Ed rate limiting / retries, shared by every client using the same token
+ED_RATE_LIMIT = 10
+ED_RATE_BURST = 20
+ED_BACKOFF_BASE = 0.5
+ED_BACKOFF_CAP = 30
+
+# Ed response cache. TTLs are in seconds per endpoint, only listed endpoints
+# are cached. Stale responses may be served for ED_CACHE_STALE seconds past
+# their TTL while they are revalidated
+ED_CACHE_SIZE = 512
+ED_CACHE_STALE = 120
+ED_CACHE_TTLS = {
+    'slide': 600,
+    'lesson': 300,
+    'questions': 600,
+    'rubric': 600,
+    'challenge': 300,
+    'threads': 30,
+    'thread': 60,
+    'lessons': 60 * 60
+}
+# Persistent Ed response store shared by the bot and commands.py, checked
+# when a response isn't in the in-memory cache. Only endpoints listed in
+# ED_DISK_CACHE_TTLS are stored, each served without revalidating for its
+# TTL (seconds) after it was fetched. Responses that can't change anymore
+# (i.e. attempts fetched after the assignment closed) are always served. The
+# least recently used responses are evicted past ED_DISK_CACHE_BYTES
+ED_DISK_CACHE_FILE = os.path.join(STORAGE_DIR, 'ed_cache.db')
+ED_DISK_CACHE_BYTES = 256 * 1024 * 1024
+ED_DISK_CACHE_TTLS = {
+    'slide': 600,
+    'lesson': 300,
+    'questions': 600,
+    'rubric': 600,
+    'challenge': 300,
+    'lessons': 60 * 60,
+    # Grading state changes as TAs work, only reused for a short while
+    'challenge_users': 60,
+    'submissions': 60,
+    'attempt_results': 60,
+    'attempts': 60,
+    'quiz_responses': 60,
+    'mark': 60
+}
+
+# How long a validated Ed token's user/courses payload is reused for
+ED_TOKEN_VALIDATION_TTL = 60 * 60
+
+# Extra url params sent with every thread sync so Ed can filter server-side,
+# i.e. {'filter': 'unanswered'}. Threads are still filtered client-side
+ED_THREAD_FILTERS = {}
+
+# How many tracked threads are checked against Ed at once per guild
+RECONCILE_CONCURRENCY = 5
+
+# Checker jobs run off the bot's event loop. JOB_EXECUTOR is either 'thread'
+# or 'process'. Process workers don't share Ed rate limits or caches
+JOB_EXECUTOR = 'thread'
+JOB_WORKERS = 4
+JOB_GUILD_LIMIT = 1
+# How often (seconds) a running job checks whether it's been cancelled
+JOB_CANCEL_POLL = 0.5
@@ -1,5 +1,4 @@
 import logging
-import json
 from typing import (
     Optional, Union, Set, Dict
 )
@@ -8,8 +7,9 @@ from src.constants import (
     LOGGING_FILE, DB_FILE
 )
 from src.exceptions import (
-    GuildNotFound, DBFileNotFound
+    GuildNotFound
 )
+from src.storage import Storage
 
 logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
                     level=logging.INFO)
@@ -26,19 +26,17 @@ class Database:
         file_path: Optional[str] = DB_FILE
     ):
         """
-        Constructs a new database instance from the given file. If the file
-        cannot be found, raises the DBFileNotFound exception
+        Constructs a new database instance from the given file. The storage
+        backend is picked by the file's extension (see Storage.for_path). If
+        a JSON file cannot be found, raises the DBFileNotFound exception
 
         Params: 'file_path' - Path to the file containins guild information to
                               load
         """
         logging.info(f"Loading DB from file: {file_path}")
-        try:
-            self.guild_to_info = json.load(open(file_path))
-            self.db_file = file_path
-        except FileNotFoundError:
-            raise DBFileNotFound("Database file cannot be found, unable to " +
-                                 "create/load database")
+        self.storage = Storage.for_path(file_path)
+        self.guild_to_info = self.storage.load()
+        self.db_file = file_path
 
     def __contains__(
         self,
@@ -145,6 +143,72 @@ class Database:
         """
         return self._get(guild_id)['threads']
 
+    def get_discord_thread(
+        self,
+        guild_id: Union[int, str],
+        discord_id: Union[int, str]
+    ) -> Optional[Dict]:
+        """
+        Params: 'guild_id' - The guild ID to get info for
+                'discord_id' - The ID of a discord backreading thread
+        Returns: The thread's info from ThreadInfo.create (Ed thread ID,
+                 course ID and starter message ID), None if the thread isn't
+                 tracked
+        """
+        return self._get(guild_id)['discord_threads'].get(str(discord_id))
+
+    def get_cursor(
+        self,
+        guild_id: Union[int, str]
+    ) -> Optional[Dict]:
+        """
+        Params: 'guild_id' - The guild ID to get info for
+        Returns: The newest Ed thread seen when syncing the guild's course, as
+                 {'id', 'created_at'}. None if the course was never synced
+        """
+        return self._get(guild_id).get('cursor')
+
+    def set_cursor(
+        self,
+        guild_id: Union[int, str],
+        cursor: Optional[Dict]
+    ) -> None:
+        """
+        Updates the thread sync high-water mark for a guild
+
+        Params: 'guild_id' - The guild ID
+                'cursor' - The newest Ed thread seen, see get_cursor
+        """
+        if self._get(guild_id).get('cursor') == cursor:
+            return
+        self._get(guild_id)['cursor'] = cursor
+        self.storage.update_guild(str(guild_id), self._get(guild_id))
+
+    def get_poll_interval(
+        self,
+        guild_id: Union[int, str]
+    ) -> Optional[int]:
+        """
+        Params: 'guild_id' - The guild ID to get info for
+        Returns: The number of seconds an admin pinned the guild's thread
+                 polling interval to, None if it adapts automatically
+        """
+        return self._get(guild_id).get('poll_interval')
+
+    def set_poll_interval(
+        self,
+        guild_id: Union[int, str],
+        interval: Optional[int]
+    ) -> None:
+        """
+        Pins the guild's thread polling interval
+
+        Params: 'guild_id' - The guild ID
+                'interval' - The interval in seconds, None to unpin
+        """
+        self._get(guild_id)['poll_interval'] = interval
+        self.storage.update_guild(str(guild_id), self._get(guild_id))
+
     def register(
         self,
         guild_id: Union[int, str],
@@ -158,7 +222,7 @@ class Database:
                                result of GuildInfo.create
         """
         self.guild_to_info[str(guild_id)] = guild_info
-        self.save()
+        self.storage.put_guild(str(guild_id), guild_info)
 
     def delete(
         self,
@@ -170,7 +234,7 @@ class Database:
         Params: 'guild_id' - The guild ID to delete
         """
         del self.guild_to_info[str(guild_id)]
-        self.save()
+        self.storage.delete_guild(str(guild_id))
 
     def remove_thread(
         self,
@@ -183,24 +247,39 @@ class Database:
         Params: 'guild_id' - The guild ID
                 'ed_id' - The Ed thread ID to delete
         """
-        self.get_threads(guild_id).pop(str(ed_id))
-        self.save()
+        discord_id = self.get_threads(guild_id).pop(str(ed_id))
+        self._get(guild_id)['discord_threads'].pop(str(discord_id), None)
+        self.storage.delete_thread(str(guild_id), str(discord_id))
 
     def add_thread(
         self,
         guild_id: Union[int, str],
         ed_id: Union[int, str],
-        discord_id: Union[int, str]
+        discord_id: Union[int, str],
+        course: Optional[Union[int, str]] = None,
+        message_id: Optional[Union[int, str]] = None
     ) -> None:
         """
-        Adds a thread from the set of imported threads within the database
+        Adds a thread from the set of imported threads within the database,
+        indexed both by its Ed ID and by its discord ID
 
         Params: 'guild_id' - The guild ID
                 'ed_id' - The Ed thread ID to add
                 'discord_id' - The discord thread ID to add
-        """
+                'course' - The Ed course ID of the thread, defaults to the
+                           guild's course
+                'message_id' - The ID of the thread's starter message,
+                               defaults to 'discord_id' since threads share
+                               their starter message's ID
+        """
+        if course is None:
+            course = self.get_course(guild_id)
+        if message_id is None:
+            message_id = discord_id
+        thread_info = ThreadInfo.create(ed_id, course, message_id)
         self.get_threads(guild_id)[str(ed_id)] = int(discord_id)
-        self.save()
+        self._get(guild_id)['discord_threads'][str(discord_id)] = thread_info
+        self.storage.put_thread(str(guild_id), str(discord_id), thread_info)
 
     def save(
         self
@@ -209,11 +288,24 @@ class Database:
         Saves current information to the file the database was created with.
         If the file cannot be found, raises the DBFileNotFound exception
         """
-        try:
-            open(self.db_file, "w").write(json.dumps(self.guild_to_info))
-        except FileNotFoundError:
-            raise DBFileNotFound("Original database file can't be found, " +
-                                 "unable to save")
+        self.storage.save(self.guild_to_info)
+
+    def flush(
+        self
+    ) -> None:
+        """
+        Writes every change made so far without waiting for the storage to
+        batch it, i.e. before the database file is read by something else
+        """
+        self.storage.flush()
+
+    def close(
+        self
+    ) -> None:
+        """
+        Closes the database's storage, the database can't be used after
+        """
+        self.storage.close()
 
 
 class GuildInfo:
@@ -233,5 +325,22 @@ class GuildInfo:
             'course': course,
             'role': role,
             'approval': approval,
-            'threads': {}
+            'threads': {},
+            'discord_threads': {},
+            'cursor': None,
+            'poll_interval': None
+        }
+
+
+class ThreadInfo:
+    @staticmethod
+    def create(
+        ed_id: Union[int, str],
+        course: Union[int, str],
+        message_id: Union[int, str]
+    ) -> Dict:
+        return {
+            'ed_id': str(ed_id),
+            'course': course,
+            'message': int(message_id)
         }
@@ -1,26 +1,36 @@
+import asyncio
 import discord
 import logging
 import re
 import math
 import requests
 import datetime
+import time
+from collections import defaultdict
 
 from typing import (
     Union, Callable, Tuple, Dict, Optional, List, Any
 )
 from src.utils import (
-    send_message, repeat_request, dm_check, correct_user_check, y_n_emoji
+    send_message, repeat_request, dm_check, correct_user_check, y_n_emoji,
+    bounded_map
 )
 from src.constants import (
-    TIMEOUT, LOGGING_FILE, PULL_DELAY, THREAD_LINK, DISCORD_MAX_EMBED_FIELDS
+    TIMEOUT, LOGGING_FILE, PULL_DELAY, THREAD_LINK, DISCORD_MAX_EMBED_FIELDS,
+    ED_THREAD_FILTERS, POLL_TICK, REFRESH_CONCURRENCY, REFRESH_TIMEOUT,
+    DISCORD_MAX_EMBED_DESCRIPTION
 )
 from src.exceptions import (
-    TimeoutError, InvalidResponse
+    TimeoutError, InvalidResponse, InvalidEdToken, EdRequestFailed
 )
 
 from src.database import Database
 from src.ed_helper import EdHelper
+from src.async_ed_helper import AsyncEdHelper
 from src.database import GuildInfo
+from src.metrics import Metrics
+from src.poll_scheduler import PollScheduler
+from src.discord_scheduler import DiscordScheduler
 
 logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
                     level=logging.INFO)
@@ -61,17 +71,23 @@ class DiscordHelper:
     async def create_thread(
         channel: Any,
         starting_message: str,
-        thread_name: str
+        thread_name: str,
+        priority: Optional[int] = DiscordScheduler.BACKGROUND
     ) -> Any:
         """
         Params: 'channel' - The channel in which to create the thread
                 'starting_message' - The starting message to created the
                                      thread off of
                 'thread_name' - The name of the thread
+                'priority' - The DiscordScheduler priority of the calls
         Returns: The newly created discord thread
         """
-        message = await send_message(channel, starting_message)
-        return await message.create_thread(name=thread_name)
+        message = await send_message(channel, starting_message,
+                                     priority=priority)
+        return await DiscordScheduler.run(
+            str(channel.id), lambda: message.create_thread(name=thread_name),
+            priority
+        )
 
     @staticmethod
     def get_role(
@@ -83,7 +99,7 @@ class DiscordHelper:
                 'role_id' - The role ID to get
         Returns: The role object corresponding to the given role ID
         """
-        return discord.utils.get(guild.roles, id=role_id)
+        return guild.get_role(int(role_id))
 
     @staticmethod
     def get_thread(
@@ -95,7 +111,7 @@ class DiscordHelper:
                 'thread_id' - The thread ID to get
         Returns: The thread object corresponding to the given thread ID
         """
-        return discord.utils.get(guild.threads, id=thread_id)
+        return guild.get_thread(int(thread_id))
 
     @staticmethod
     async def resolve_thread(
@@ -103,7 +119,8 @@ class DiscordHelper:
         database: Database,
         guild_id: int,
         ed_thread_id: int,
-        final_message: str
+        final_message: str,
+        priority: Optional[int] = DiscordScheduler.INTERACTIVE
     ) -> None:
         """
         Resolves the given thread, sending a final message and removing it
@@ -116,13 +133,19 @@ class DiscordHelper:
                              archived
                 'thread_id' - The Ed ID of the thread being archived
                 'final_message' - The final message to send to the thread
+                'priority' - The DiscordScheduler priority of the calls,
+                             BACKGROUND when Ed resolved the thread
         """
-        discord_thread_id = database.get_threads(guild_id)[ed_thread_id]
+        discord_thread_id = database.get_threads(guild_id)[str(ed_thread_id)]
         logging.debug(f"Resolving thread {discord_thread_id}")
         thread = bot.get_channel(discord_thread_id)
 
-        await send_message(thread, final_message)
-        await thread.edit(archived=True, locked=True,)
+        await send_message(thread, final_message, priority=priority)
+        await DiscordScheduler.run(
+            f"{thread.id}/edit", lambda: thread.edit(archived=True,
+                                                     locked=True,),
+            priority
+        )
         database.remove_thread(guild_id, ed_thread_id)
 
     @staticmethod
@@ -150,7 +173,8 @@ class DiscordHelper:
         logging.info("Getting Ed API token from user")
         try:
             token, user = await repeat_request(bot, check_wrapper,
-                                               EdHelper.valid_token, TIMEOUT,
+                                               AsyncEdHelper.valid_token,
+                                               TIMEOUT,
                                                invalid_wrapper)
             logging.debug(f"Successfully retrived valid ed token {token}, " +
                           f"username {user['user']['name']}")
@@ -168,7 +192,7 @@ class DiscordHelper:
         ctx: Any,
         bot: Any,
         respond_public_channel: Callable[[str], None],
-        ed_helper: EdHelper
+        ed_helper: AsyncEdHelper
     ) -> Tuple[str, Dict]:
         """
         Gets the appropriate Ed staff course URL via repeat request. Raises
@@ -288,7 +312,7 @@ class DiscordHelper:
                              "provide. If you're not comfortable with this, " +
                              "feel free to let the request timeout")
             token, _ = await DiscordHelper._get_token(ctx, bot, respond_dm)
-            ed_helper = EdHelper(token)
+            ed_helper = AsyncEdHelper.for_token(token)
 
             # 3. Get the url with checking
             await respond_public_channel("Now, provide the url of the " +
@@ -378,7 +402,7 @@ class DiscordHelper:
             return (await send_message(ctx.channel, message))
 
         guild_id = ctx.guild.id
-        ed_helper = EdHelper(database.get_token(guild_id))
+        ed_helper = AsyncEdHelper.for_token(database.get_token(guild_id))
 
         # Double-checking w/ admin or sender
         checker = discord.utils.get(
@@ -393,15 +417,17 @@ class DiscordHelper:
             await respond_thread("Answer not approved")
             return
 
-        starting_message = await thread.parent.fetch_message(thread.id)
-        to_push = (
-            await thread.fetch_message(ctx.message.reference.message_id)
-        ).content
-        course_thread_ids = EdHelper.get_ids(starting_message.embeds[0].url)
+        # Discord usually resolves the replied to message already
+        reference = ctx.message.reference
+        to_push = (reference.resolved.content
+                   if isinstance(reference.resolved, discord.Message) else
+                   (await thread.fetch_message(reference.message_id)).content)
+        ed_thread_id = database.get_discord_thread(guild_id,
+                                                   thread.id)['ed_id']
 
-        ed_helper.push_answer(course_thread_ids[1], to_push)
+        await ed_helper.push_answer(ed_thread_id, to_push)
         await DiscordHelper.resolve_thread(
-            bot, database, ctx.guild.id, course_thread_ids[1], "Pushed to Ed!"
+            bot, database, ctx.guild.id, ed_thread_id, "Pushed to Ed!"
         )
 
     @staticmethod
@@ -474,6 +500,32 @@ class DiscordHelper:
             i += 1
         return embeds
 
+    @staticmethod
+    def _format_group_embed(
+        key: str,
+        issues: List[Tuple[str, str]]
+    ) -> Any:
+        """
+        Creates and formats a discord embed with the consistency issues found
+        for a single TA / section, posted while the rest are still checked
+
+        Params: 'key' - The TA name or section code
+                'issues' - A list of (link, issue) for the group
+        Returns: A properly formatted discord embed
+        """
+        lines, length = [], 0
+        for i, (link, issue) in enumerate(issues):
+            line = f"[{issue}]({link})"
+            if length + len(line) + 1 > DISCORD_MAX_EMBED_DESCRIPTION:
+                lines.append(f"...and {len(issues) - i} more")
+                break
+            lines.append(line)
+            length += len(line) + 1
+        return discord.Embed(
+            title=f"{key}: {len(issues)} students with issues",
+            description="\n".join(lines) if lines else "All clear!"
+        )
+
     @staticmethod
     def _format_ungraded_embed(
         key_to_ungraded: Dict[str, int],
@@ -505,17 +557,61 @@ class DiscordHelper:
         return embeds
 
     @staticmethod
-    async def refresh_threads(
+    async def _reconcile_threads(
+        bot: Any,
+        database: Database,
         guild_id: Any,
+        states: Dict[str, Optional[Dict]]
+    ) -> None:
+        """
+        Checks every thread the guild is tracking against its current state on
+        Ed, resolving the ones that were answered or deleted
+
+        Params: 'bot' - The discord bot object
+                'database' - The bot's database
+                'guild_id' - The ID of the guild to reconcile
+                'states' - A dictionary mapping Ed thread ID -> its current Ed
+                           thread object, None if it was deleted. Threads
+                           missing from it are left alone
+        """
+        server_threads = database.get_threads(guild_id)
+        for ed_thread_id in list(server_threads):
+            if ed_thread_id not in states:
+                continue
+            thread = states[ed_thread_id]
+            if thread is None:
+                # Thread's been deleted from ed and is still in discord
+                logging.info(f"Closing deleted thread {ed_thread_id} with " +
+                             f"channel id {server_threads[ed_thread_id]}")
+                await DiscordHelper.resolve_thread(
+                    bot, database, guild_id, ed_thread_id, "Deleted from Ed",
+                    DiscordScheduler.BACKGROUND
+                )
+            elif thread['is_answered']:
+                # If we've already posted about it, resolve if answered
+                logging.info(f"Closing thread {ed_thread_id} with channel " +
+                             f"id {server_threads[ed_thread_id]}")
+                await DiscordHelper.resolve_thread(
+                    bot, database, guild_id, ed_thread_id, "Resolved on Ed",
+                    DiscordScheduler.BACKGROUND
+                )
+
+    @staticmethod
+    async def _post_new_threads(
+        bot: Any,
         database: Database,
-        bot: Any
-    ) -> Any:
+        guild_id: Any,
+        ed_threads: List[Dict]
+    ) -> None:
         """
-        Refreshes backreading threads for the given guild
+        Creates a backreading thread in the guild's channel for every
+        unanswered assignment question it isn't tracking yet
 
-        Params: 'guild_id' - The ID of the guild to refresh
+        Params: 'bot' - The discord bot object
                 'database' - The bot's database
-                'bot' - The discord bot object
+                'guild_id' - The ID of the guild to post to
+                'ed_threads' - Ed thread objects for the guild's course,
+                               newest first
         """
         # jic it's needed: 'filter': 'unanswered'
         guild = await bot.fetch_guild(int(guild_id))
@@ -524,21 +620,8 @@ class DiscordHelper:
         today = datetime.datetime.now(datetime.timezone.utc)  # noqa: F841
         delay_delta = datetime.timedelta(minutes=PULL_DELAY)  # noqa: F841
 
-        ed_helper = EdHelper(database.get_token(guild_id))
-        ed_threads = ed_helper.get_threads(database.get_course(guild_id))
         server_threads = database.get_threads(guild_id)
 
-        deleted_threads = ({int(key) for key, _ in server_threads.items()} -
-                           {thread['id'] for thread in ed_threads})
-        for thread_id in deleted_threads:
-            # Thread's been deleted from ed and is still in discord (or in
-            # theory the thread is really old and unanswered on ed)
-            logging.info(f"Closing deleted thread {thread_id} with channel " +
-                         f"id {server_threads[thread_id]}")
-            await DiscordHelper.resolve_thread(bot, database, guild_id,
-                                               thread_id, "Deleted from Ed")
-            continue
-
         for thread in reversed(ed_threads):
             if (thread['category'] != "Assignments" or
                thread['type'] != "question"):
@@ -547,14 +630,6 @@ class DiscordHelper:
                 continue
 
             ed_thread_id = str(thread['id'])
-            if ed_thread_id in server_threads and thread['is_answered']:
-                # If we've already posted about it, resolve if answered
-                logging.info(f"Closing thread {ed_thread_id} with channel " +
-                             f"id {server_threads[ed_thread_id]}")
-                await DiscordHelper.resolve_thread(
-                    bot, database, guild_id, ed_thread_id, "Resolved on Ed"
-                )
-                continue
             if thread['is_answered']:
                 # Thread has already been answered
                 continue
@@ -575,20 +650,259 @@ class DiscordHelper:
             created_thread = await DiscordHelper.create_thread(
                 channel, starting_message, thread['title']
             )
+            # Track the thread right away so a refresh that's cut short by
+            # its timeout doesn't create it again next cycle
+            database.add_thread(guild_id, ed_thread_id, created_thread.id,
+                                course, created_thread.id)
 
             # Create detailed message so starting message can be deleted after
             embed = DiscordHelper._format_backreading_embed(
                 thread, course, simple=False
             )
-            await send_message(created_thread, embed)
+            await send_message(created_thread, embed,
+                               priority=DiscordScheduler.BACKGROUND)
 
             # Ping so it appears on the left, but delete after
-            ping = await created_thread.send(DiscordHelper.get_role(
-                guild, database.get_role(guild_id)).mention
+            mention = DiscordHelper.get_role(
+                guild, database.get_role(guild_id)
+            ).mention
+            ping = await DiscordScheduler.run(
+                str(created_thread.id), lambda: created_thread.send(mention),
+                DiscordScheduler.BACKGROUND
             )
-            await ping.delete()
-
-            # Add thread id to guild_info
-            database.add_thread(guild_id, ed_thread_id, created_thread.id)
+            await DiscordScheduler.run(f"{created_thread.id}/delete",
+                                       ping.delete,
+                                       DiscordScheduler.BACKGROUND)
             logging.info(f"Thread created for guild {guild} and added to " +
                          "database")
+
+    @staticmethod
+    async def _poll_course(
+        database: Database,
+        course: Any,
+        guild_ids: List[str],
+        cursor: Optional[Dict]
+    ) -> Tuple[AsyncEdHelper, List[Dict], Optional[Dict]]:
+        """
+        Fetches a course's new threads once with the token of the first guild
+        whose token is still valid
+
+        Params: 'database' - The bot's database
+                'course' - The Ed course ID to poll
+                'guild_ids' - The guilds subscribed to the course
+                'cursor' - The oldest cursor among those guilds
+        Returns: The AsyncEdHelper used, and get_new_threads' results
+        """
+        for i, guild_id in enumerate(guild_ids):
+            ed_helper = AsyncEdHelper.for_token(database.get_token(guild_id))
+            try:
+                return (ed_helper, *await ed_helper.get_new_threads(
+                    course, cursor, ED_THREAD_FILTERS
+                ))
+            except InvalidEdToken:
+                if i == len(guild_ids) - 1:
+                    raise
+                logging.info(f"Token for {guild_id} rejected, polling " +
+                             f"course {course} with the next guild's")
+
+    @staticmethod
+    async def _course_deadlines(
+        ed_helper: AsyncEdHelper,
+        course: Any
+    ) -> Optional[List[datetime.datetime]]:
+        """
+        Params: 'ed_helper' - An AsyncEdHelper with access to the course
+                'course' - The Ed course ID
+        Returns: The due dates of the course's lessons, None if they couldn't
+                 be fetched
+        """
+        try:
+            lessons = await ed_helper.get_lessons(course)
+        except (EdRequestFailed, InvalidEdToken) as e:
+            logging.info(f"Unable to get lessons for course {course}: {e}")
+            return None
+        return [EdHelper.parse_datetime(lesson['due_at'], milliseconds=False)
+                for lesson in lessons if lesson.get('due_at')]
+
+    @staticmethod
+    def pinned_interval(
+        database: Database,
+        guild_ids: List[str]
+    ) -> Optional[int]:
+        """
+        Params: 'database' - The bot's database
+                'guild_ids' - The guilds subscribed to a course
+        Returns: The shortest polling interval pinned by any of the guilds,
+                 None if none of them pinned one
+        """
+        return min([database.get_poll_interval(guild_id)
+                    for guild_id in guild_ids
+                    if database.get_poll_interval(guild_id) is not None],
+                   default=None)
+
+    @staticmethod
+    async def refresh_course(
+        course: Any,
+        guild_ids: List[str],
+        database: Database,
+        bot: Any,
+        scheduler: Optional[PollScheduler] = None
+    ) -> Dict[str, Optional[Exception]]:
+        """
+        Refreshes backreading threads for every guild subscribed to the same Ed
+        course. The course's threads (and the state of every thread tracked by
+        any of the guilds) are fetched from Ed once, then each guild is
+        updated from them
+
+        Params: 'course' - The Ed course ID the guilds share
+                'guild_ids' - The IDs of the guilds to refresh
+                'database' - The bot's database
+                'bot' - The discord bot object
+                'scheduler' - If given, the poll's activity and the course's
+                              lesson due dates are recorded with it
+        Returns: A dictionary mapping guild ID -> the exception updating it
+                 failed with, None if it succeeded
+        """
+        cursors = [database.get_cursor(guild_id) for guild_id in guild_ids]
+        # Page back far enough for the guild that's furthest behind
+        oldest = (None if None in cursors else
+                  min(cursors, key=lambda cursor: cursor['id']))
+        ed_helper, ed_threads, newest = await DiscordHelper._poll_course(
+            database, course, guild_ids, oldest
+        )
+        if scheduler is not None:
+            scheduler.record(course, sum(
+                1 for thread in ed_threads
+                if (oldest is None or thread['id'] > oldest['id']) and
+                thread['category'] == "Assignments" and
+                thread['type'] == "question" and not thread['is_answered']
+            ), await DiscordHelper._course_deadlines(ed_helper, course))
+
+        fetched = {str(thread['id']): thread for thread in ed_threads}
+        tracked = set()
+        for guild_id in guild_ids:
+            tracked.update(database.get_threads(guild_id))
+        states = {thread_id: fetched[thread_id] for thread_id in tracked
+                  if thread_id in fetched}
+        states.update(await ed_helper.get_thread_states(
+            [thread_id for thread_id in tracked if thread_id not in states]
+        ))
+
+        async def update(guild_id: str, cursor: Optional[Dict]):
+            try:
+                await DiscordHelper._reconcile_threads(bot, database,
+                                                       guild_id, states)
+                await DiscordHelper._post_new_threads(
+                    bot, database, guild_id,
+                    [thread for thread in ed_threads
+                     if cursor is None or thread['id'] > cursor['id']]
+                )
+                database.set_cursor(guild_id, max(
+                    [c for c in (cursor, newest) if c is not None],
+                    key=lambda c: c['id'], default=None
+                ))
+            except Exception as e:
+                logging.exception(e)
+                return e
+            return None
+
+        return dict(zip(guild_ids, await asyncio.gather(*[
+            update(guild_id, cursor)
+            for guild_id, cursor in zip(guild_ids, cursors)
+        ])))
+
+    @staticmethod
+    async def refresh_threads(
+        guild_id: Any,
+        database: Database,
+        bot: Any
+    ) -> None:
+        """
+        Refreshes backreading threads for the given guild
+
+        Params: 'guild_id' - The ID of the guild to refresh
+                'database' - The bot's database
+                'bot' - The discord bot object
+        """
+        guild_id = str(guild_id)
+        error = (await DiscordHelper.refresh_course(
+            database.get_course(guild_id), [guild_id], database, bot
+        ))[guild_id]
+        if error is not None:
+            raise error
+
+    @staticmethod
+    async def refresh_all_threads(
+        database: Database,
+        bot: Any,
+        scheduler: Optional[PollScheduler] = None,
+        concurrency: Optional[int] = REFRESH_CONCURRENCY,
+        timeout: Optional[float] = REFRESH_TIMEOUT
+    ) -> Dict[str, Optional[Exception]]:
+        """
+        Refreshes backreading threads for every guild in the database. Guilds
+        are grouped by Ed course so each course is polled once, with at most
+        'concurrency' courses refreshed at a time. A course that fails or
+        takes longer than 'timeout' seconds doesn't affect the others, nor
+        does a single guild failing affect the rest of its course. Records
+        the cycle duration and failure counts in Metrics
+
+        Params: 'database' - The bot's database
+                'bot' - The discord bot object
+                'scheduler' - If given, only courses it says are due are
+                              refreshed
+                'concurrency' - How many courses to refresh at once
+                'timeout' - How many seconds a single course can take
+        Returns: A dictionary mapping guild ID -> the exception its refresh
+                 failed with, None if it succeeded
+        """
+        courses = defaultdict(list)
+        for guild_id in database.guild_ids():
+            courses[database.get_course(guild_id)].append(guild_id)
+        if scheduler is not None:
+            courses = {course: guild_ids
+                       for course, guild_ids in courses.items()
+                       if scheduler.due(course, DiscordHelper.pinned_interval(
+                           database, guild_ids))}
+            if not courses:
+                return {}
+
+        async def refresh(course: Any) -> Dict[str, Optional[Exception]]:
+            guild_ids = courses[course]
+            try:
+                results = await asyncio.wait_for(DiscordHelper.refresh_course(
+                    course, guild_ids, database, bot, scheduler
+                ), timeout)
+            except asyncio.TimeoutError as e:
+                logging.warning(f"Refreshing course {course} timed out " +
+                                f"after {timeout}s")
+                Metrics.increment('refresh_timeouts', len(guild_ids))
+                if scheduler is not None:
+                    # Back off instead of retrying on the next tick
+                    scheduler.record(course, 0)
+                return {guild_id: e for guild_id in guild_ids}
+            except Exception as e:
+                logging.exception(e)
+                if scheduler is not None:
+                    scheduler.record(course, 0)
+                results = {guild_id: e for guild_id in guild_ids}
+            Metrics.increment('refresh_failures', sum(
+                error is not None for error in results.values()
+            ))
+            return results
+
+        start = time.monotonic()
+        results = {}
+        for course_results in await bounded_map(refresh, list(courses),
+                                                concurrency):
+            results.update(course_results)
+        duration = time.monotonic() - start
+
+        Metrics.observe('refresh_cycle_seconds', duration)
+        failed = sum(error is not None for error in results.values())
+        logging.info(f"Refreshed {len(results)} guilds in {len(courses)} " +
+                     f"courses in {duration:.2f}s, {failed} failed")
+        if duration > POLL_TICK:
+            logging.warning("Thread refresh cycle took longer than " +
+                            "POLL_TICK")
+        return results
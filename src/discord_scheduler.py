@@ -0,0 +1,198 @@
+import asyncio
+import discord
+import heapq
+import itertools
+import logging
+import time
+
+from typing import (
+    Any, Awaitable, Callable, Dict, List, Optional
+)
+from src.constants import (
+    LOGGING_FILE, DISCORD_BUCKET_RATE, DISCORD_BUCKET_BURST,
+    DISCORD_MAX_RETRIES
+)
+from src.metrics import Metrics
+from src.rate_limiter import (
+    TokenBucket, RetryPolicy
+)
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class DiscordScheduler:
+    """
+    Represents a process-wide queue of outbound Discord REST calls. Calls are
+    grouped by the Discord bucket they count against (roughly one per
+    channel and kind of call), and each bucket is paced ahead of time so
+    Discord rarely has to rate limit us. Within a bucket, interactive calls
+    (replies to commands, approvals, pushes) always run before background
+    ones (importing Ed threads), and buckets never wait on each other, so a
+    backlog import can't hold up a reply in another channel.
+
+    Pacing is a fixed DISCORD_BUCKET_RATE / DISCORD_BUCKET_BURST per bucket
+    rather than the X-RateLimit-Remaining / X-RateLimit-Reset-After headers:
+    py-cord's HTTPClient consumes those headers itself (holding its own
+    route lock until the reset) and only returns response bodies, so they
+    never reach us on successful calls. Once py-cord's lock is holding
+    calls, it releases them in arrival order, not by priority, which is why
+    we stay under the limit up front. The headers are only visible on the
+    429s py-cord gives up on, and are honoured there
+    """
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+    PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+    # bucket key -> heap of (priority, order, queued at, operation, future,
+    # attempt)
+    _queues: Dict[str, List] = {}
+    # bucket key -> the pacing for that bucket
+    _buckets: Dict[str, TokenBucket] = {}
+    # bucket keys that currently have a worker draining them
+    _workers: Dict[str, asyncio.Task] = {}
+    _order = itertools.count()
+
+    @staticmethod
+    async def run(
+        key: str,
+        operation: Callable[[], Awaitable[Any]],
+        priority: Optional[int] = INTERACTIVE
+    ) -> Any:
+        """
+        Queues a Discord call and waits for it to run
+
+        Params: 'key' - The bucket the call counts against, i.e. the ID of
+                        the channel a message is sent to
+                'operation' - Makes the call, it may be called more than once
+                              if Discord rate limits it anyway
+                'priority' - DiscordScheduler.INTERACTIVE or
+                             DiscordScheduler.BACKGROUND
+        Returns: Whatever 'operation' returned
+        """
+        future = asyncio.get_running_loop().create_future()
+        DiscordScheduler._push(key, priority, operation, future, 0)
+        return await future
+
+    @staticmethod
+    def _push(
+        key: str,
+        priority: int,
+        operation: Callable[[], Awaitable[Any]],
+        future: asyncio.Future,
+        attempt: int
+    ) -> None:
+        """
+        Adds a call to its bucket's queue, starting a worker for the bucket
+        if it doesn't have one
+        """
+        queue = DiscordScheduler._queues.setdefault(key, [])
+        heapq.heappush(queue, (priority, next(DiscordScheduler._order),
+                               time.monotonic(), operation, future, attempt))
+        if key not in DiscordScheduler._workers:
+            DiscordScheduler._workers[key] = asyncio.create_task(
+                DiscordScheduler._drain(key)
+            )
+
+    @staticmethod
+    def _bucket(
+        key: str
+    ) -> TokenBucket:
+        """
+        Returns: The pacing for the given bucket key, created when first used
+        """
+        if key not in DiscordScheduler._buckets:
+            DiscordScheduler._buckets[key] = TokenBucket(
+                rate=DISCORD_BUCKET_RATE, capacity=DISCORD_BUCKET_BURST
+            )
+        return DiscordScheduler._buckets[key]
+
+    @staticmethod
+    def _rate_limited_for(
+        error: discord.HTTPException
+    ) -> Optional[float]:
+        """
+        Params: 'error' - The exception a Discord call raised
+        Returns: How many seconds the bucket should pause for according to
+                 the rate limit headers, None if it wasn't rate limited
+        """
+        if error.status != 429:
+            return None
+        headers = getattr(error.response, 'headers', None) or {}
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        if reset_after is not None:
+            try:
+                return float(reset_after)
+            except ValueError:
+                pass
+        retry_after = RetryPolicy.retry_after(headers)
+        return 1.0 if retry_after is None else retry_after
+
+    @staticmethod
+    async def _drain(
+        key: str
+    ) -> None:
+        """
+        Runs a bucket's queued calls one at a time, highest priority first,
+        until the bucket's queue is empty
+        """
+        queue = DiscordScheduler._queues[key]
+        bucket = DiscordScheduler._bucket(key)
+        try:
+            while queue:
+                wait = bucket.reserve()
+                if wait > 0:
+                    # Something more important may be queued while waiting
+                    await asyncio.sleep(wait)
+                (priority, _, queued_at, operation, future,
+                 attempt) = heapq.heappop(queue)
+                if future.done():
+                    # Caller gave up waiting
+                    continue
+
+                Metrics.observe('discord_queue_wait_seconds',
+                                time.monotonic() - queued_at)
+                try:
+                    result = await operation()
+                except discord.HTTPException as e:
+                    pause = DiscordScheduler._rate_limited_for(e)
+                    if pause is None or attempt >= DISCORD_MAX_RETRIES:
+                        if not future.done():
+                            future.set_exception(e)
+                        continue
+                    logging.warning(f"Discord bucket {key} rate limited, " +
+                                    f"pausing for {pause:.2f}s")
+                    Metrics.increment('discord_rate_limited')
+                    bucket.pause(pause)
+                    heapq.heappush(queue, (priority,
+                                           next(DiscordScheduler._order),
+                                           queued_at, operation, future,
+                                           attempt + 1))
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    name = DiscordScheduler.PRIORITY_NAMES[priority]
+                    Metrics.increment(f"discord_{name}_calls")
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            del DiscordScheduler._workers[key]
+            # Only non-empty if the worker was cancelled, don't strand callers
+            for entry in DiscordScheduler._queues.pop(key):
+                if not entry[4].done():
+                    entry[4].cancel()
+
+    @staticmethod
+    def depth() -> Dict[str, int]:
+        """
+        Returns: How many calls are waiting at each priority, and how many
+                 buckets have calls waiting
+        """
+        depth = {name: 0 for name in DiscordScheduler.PRIORITY_NAMES.values()}
+        for queue in DiscordScheduler._queues.values():
+            for entry in queue:
+                depth[DiscordScheduler.PRIORITY_NAMES[entry[0]]] += 1
+        depth['buckets'] = len(DiscordScheduler._queues)
+        return depth
@@ -0,0 +1,313 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from typing import (
+    Optional, Dict, Any, Tuple, Mapping
+)
+from src.constants import (
+    LOGGING_FILE, ED_DISK_CACHE_FILE, ED_DISK_CACHE_BYTES
+)
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class DiskCache:
+    """
+    Represents a persistent, size-bounded LRU store of Ed GET responses in a
+    SQLite database, shared by every process (bot, job workers,
+    commands.py) that uses the same file. Responses are addressed by a hash
+    of their ResponseCache key, so tokens are never written to disk.
+
+    The store only keeps responses and when they were fetched, deciding
+    whether a response is fresh is up to the caller. Errors from SQLite are
+    logged and treated as misses, the store is never required for a request
+    to succeed
+    """
+
+    # Bump when the schema changes, older stores are dropped
+    SCHEMA_VERSION = 1
+    SCHEMA = [
+        "DROP TABLE IF EXISTS responses",
+        """CREATE TABLE responses (
+            key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            body TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            stored REAL NOT NULL,
+            used REAL NOT NULL,
+            size INTEGER NOT NULL
+        )""",
+        "CREATE INDEX responses_used ON responses (used)",
+        "CREATE INDEX responses_owner ON responses (owner)"
+    ]
+    # Eviction frees space down to this fraction of 'max_bytes', so a full
+    # store doesn't evict on every write
+    EVICT_TO = 0.9
+
+    def __init__(
+        self,
+        file_path: Optional[str] = ED_DISK_CACHE_FILE,
+        max_bytes: Optional[int] = ED_DISK_CACHE_BYTES
+    ):
+        """
+        Params: 'file_path' - The SQLite database file, created when first
+                              used. None disables the store
+                'max_bytes' - The max total size of stored response bodies
+        """
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.connection = None
+        self.pid = None
+        self.total = 0
+        self.lock = threading.Lock()
+        self.hits, self.revalidated, self.misses = 0, 0, 0
+
+    @staticmethod
+    def _hash(
+        value: Any
+    ) -> str:
+        """
+        Returns: A stable hash of any JSON serializable value
+        """
+        return hashlib.sha256(json.dumps(value).encode('utf-8')).hexdigest()
+
+    def _connect(
+        self
+    ) -> Optional[sqlite3.Connection]:
+        """
+        Returns: The connection to the store, opened (and the schema created)
+                 when first used (or first used by a forked process). None if
+                 the store is disabled. Must hold 'lock'
+        """
+        if self.file_path is None:
+            return None
+        if self.connection is not None and self.pid == os.getpid():
+            return self.connection
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        connection = sqlite3.connect(self.file_path, timeout=30,
+                                     check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != DiskCache.SCHEMA_VERSION:
+            with connection:
+                for statement in DiskCache.SCHEMA:
+                    connection.execute(statement)
+                connection.execute(
+                    f"PRAGMA user_version={DiskCache.SCHEMA_VERSION}"
+                )
+        self.total = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        self.connection, self.pid = connection, os.getpid()
+        return connection
+
+    def get(
+        self,
+        key: Tuple
+    ) -> Optional[Tuple[Any, Dict[str, str], float]]:
+        """
+        Params: 'key' - The response's ResponseCache key
+        Returns: The stored response body, its validator headers and when it
+                 was fetched or last revalidated (epoch seconds). None if it
+                 isn't stored
+        """
+        with self.lock:
+            try:
+                connection = self._connect()
+                if connection is None:
+                    return None
+                address = DiskCache._hash(key)
+                row = connection.execute(
+                    "SELECT body, etag, last_modified, stored " +
+                    "FROM responses WHERE key = ?", (address,)
+                ).fetchone()
+                if row is None:
+                    return None
+                with connection:
+                    connection.execute(
+                        "UPDATE responses SET used = ? WHERE key = ?",
+                        (time.time(), address)
+                    )
+            except sqlite3.Error as e:
+                logging.warning(f"Couldn't read Ed response store: {e}")
+                return None
+        body, etag, last_modified, stored = row
+        headers = {}
+        if etag is not None:
+            headers['ETag'] = etag
+        if last_modified is not None:
+            headers['Last-Modified'] = last_modified
+        return json.loads(body), headers, stored
+
+    def put(
+        self,
+        key: Tuple,
+        endpoint: str,
+        value: Any,
+        headers: Optional[Mapping[str, str]] = None
+    ) -> None:
+        """
+        Stores a freshly fetched response, evicting the least recently used
+        responses if the store is over 'max_bytes'
+
+        Params: 'key' - The response's ResponseCache key
+                'endpoint' - The endpoint the response is for
+                'value' - The parsed response body
+                'headers' - The response headers, used for revalidation
+        """
+        headers = headers or {}
+        body = json.dumps(value)
+        now = time.time()
+        with self.lock:
+            try:
+                connection = self._connect()
+                if connection is None:
+                    return
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO responses VALUES " +
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (DiskCache._hash(key), DiskCache._hash(key[0]),
+                         endpoint, body, headers.get('ETag'),
+                         headers.get('Last-Modified'), now, now, len(body))
+                    )
+                # Replaced responses are counted twice until the next evict
+                self.total += len(body)
+                if self.total > self.max_bytes:
+                    self._evict(connection)
+            except sqlite3.Error as e:
+                logging.warning(f"Couldn't write Ed response store: {e}")
+
+    def _evict(
+        self,
+        connection: sqlite3.Connection
+    ) -> None:
+        """
+        Deletes the least recently used responses until the store is under
+        EVICT_TO of 'max_bytes'. Must hold 'lock'
+        """
+        with connection:
+            connection.execute(
+                "DELETE FROM responses WHERE key IN (" +
+                "SELECT key FROM (SELECT key, SUM(size) OVER " +
+                "(ORDER BY used DESC, key) AS kept FROM responses) " +
+                "WHERE kept > ?)",
+                (int(self.max_bytes * DiskCache.EVICT_TO),)
+            )
+        self.total = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        logging.info(f"Evicted Ed response store down to {self.total} bytes")
+
+    def touch(
+        self,
+        key: Tuple
+    ) -> None:
+        """
+        Marks a stored response as just revalidated
+        """
+        with self.lock:
+            try:
+                connection = self._connect()
+                if connection is None:
+                    return
+                now = time.time()
+                with connection:
+                    connection.execute(
+                        "UPDATE responses SET stored = ?, used = ? " +
+                        "WHERE key = ?", (now, now, DiskCache._hash(key))
+                    )
+            except sqlite3.Error as e:
+                logging.warning(f"Couldn't write Ed response store: {e}")
+
+    def discard(
+        self,
+        key: Tuple
+    ) -> None:
+        """
+        Drops the stored response for 'key', if it's stored
+        """
+        with self.lock:
+            try:
+                connection = self._connect()
+                if connection is None:
+                    return
+                with connection:
+                    connection.execute("DELETE FROM responses WHERE key = ?",
+                                       (DiskCache._hash(key),))
+                self.total = connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()[0]
+            except sqlite3.Error as e:
+                logging.warning(f"Couldn't write Ed response store: {e}")
+
+    def invalidate(
+        self,
+        token: Optional[str] = None
+    ) -> None:
+        """
+        Drops every stored response, or only those made with 'token'
+        """
+        with self.lock:
+            try:
+                connection = self._connect()
+                if connection is None:
+                    return
+                with connection:
+                    if token is None:
+                        connection.execute("DELETE FROM responses")
+                    else:
+                        connection.execute(
+                            "DELETE FROM responses WHERE owner = ?",
+                            (DiskCache._hash(token),)
+                        )
+                self.total = connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()[0]
+            except sqlite3.Error as e:
+                logging.warning(f"Couldn't write Ed response store: {e}")
+
+    def record(
+        self,
+        counter: str
+    ) -> None:
+        """
+        Increments one of the 'hits', 'revalidated' or 'misses' counters
+        """
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(
+        self
+    ) -> Dict[str, int]:
+        """
+        Returns: The current counters, and the number and total size of
+                 stored responses as of this process's last write
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'revalidated': self.revalidated,
+                'misses': self.misses,
+                'bytes': self.total
+            }
+
+    def close(
+        self
+    ) -> None:
+        """
+        Closes the connection to the store, it's reopened if used again
+        """
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
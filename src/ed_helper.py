@@ -2,15 +2,20 @@ import logging
 import re
 import requests
 import datetime
+import time
+import threading
 
 from typing import (
-    Optional, List, Dict, Union, Any
+    Optional, List, Dict, Any, Tuple
 )
 from src.constants import (
-    LOGGING_FILE
+    LOGGING_FILE, ED_TOKEN_VALIDATION_TTL
 )
 from src.exceptions import (
-    InvalidResponse, InvalidEdToken
+    InvalidResponse, InvalidEdToken, EdRequestFailed
+)
+from src.rate_limiter import (
+    TokenBucket, RetryPolicy
 )
 
 DEBUG = False
@@ -22,6 +27,8 @@ class EdConstants:
     USER_REQUEST = 'https://us.edstem.org/api/user'  # noqa: E501
     SLIDE_REQUEST = 'https://us.edstem.org/api/lessons/slides/{slide_id}'  # noqa: E501
     THREAD_REQUEST = 'https://us.edstem.org/api/courses/{id}/threads'  # noqa: E501
+    BASE_THREAD = 'https://us.edstem.org/api/threads/{thread_id}'  # noqa: E501
+    COURSE_LESSONS = 'https://us.edstem.org/api/courses/{course_id}/lessons'  # noqa: E501
 
     BASE_CHALLENGE = 'https://us.edstem.org/api/challenges/{challenge_id}'  # noqa: E501
     CHALLENGE_USER_REQUEST = 'https://us.edstem.org/api/challenges/{challenge_id}/users'  # noqa: E501
@@ -40,6 +47,8 @@ class EdConstants:
 
     DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"  # noqa: E501
     THREAD_LIMIT = 40
+    # Upper bound on pages fetched by a single incremental thread sync
+    THREAD_MAX_PAGES = 10
 
     CRITERIA_MAP = {
         "Exemplary": "E", "Excellent": "E",
@@ -59,6 +68,52 @@ class EdRegex:
     EMAIL_REGEX = re.compile(r'[A-Za-z0-9]+(@|%40)(uw|cs.washington).edu')  # noqa: E501
 
 
+class EdTokenCache:
+    """
+    Process-wide cache of token -> Ed user object (which includes the user's
+    courses) for tokens that have been validated, shared by both clients.
+    Entries expire after ED_TOKEN_VALIDATION_TTL, or as soon as Ed rejects
+    the token
+    """
+    _users: Dict[str, Tuple[Dict, float]] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(
+        token: str
+    ) -> Optional[Dict]:
+        """
+        Returns: The cached Ed user object for 'token', None if the token
+                 hasn't been validated recently
+        """
+        with EdTokenCache._lock:
+            user, expires = EdTokenCache._users.get(token, (None, 0))
+            return user if time.monotonic() < expires else None
+
+    @staticmethod
+    def put(
+        token: str,
+        user: Dict
+    ) -> None:
+        """
+        Caches the Ed user object returned when validating 'token'
+        """
+        with EdTokenCache._lock:
+            EdTokenCache._users[token] = (
+                user, time.monotonic() + ED_TOKEN_VALIDATION_TTL
+            )
+
+    @staticmethod
+    def invalidate(
+        token: str
+    ) -> None:
+        """
+        Forgets that 'token' was valid, so it is checked again on next use
+        """
+        with EdTokenCache._lock:
+            EdTokenCache._users.pop(token, None)
+
+
 class EdHelper:
     """
     Represents an interface with the Ed API that allows users to carry out
@@ -72,7 +127,8 @@ class EdHelper:
     ):
         """
         Constructs a new ed helper instance from the given API token. If the
-        given token is invalid, raises InvalidEdToken
+        given token is invalid, raises InvalidEdToken. Recently validated
+        tokens aren't checked with Ed again
 
         Params: 'token' - The Ed API token to use with requests
         """
@@ -106,12 +162,10 @@ class EdHelper:
             thread_id=thread_id), self.token, self.retries, payload
         )
         logging.info(response)
-        # Don't wrap since ed doesn't give a response for accepting an answer
-
-        requests.post(EdConstants.ACCEPT_REQUEST.format(
-            comment_id=response['comment']['id']),
-            headers={'x-token': self.token}
-        )
+        # Ed doesn't give a response body for accepting an answer
+        post_payload(EdConstants.ACCEPT_REQUEST.format(
+            comment_id=response['comment']['id']
+        ), self.token, self.retries)
 
     def valid_course(
         self,
@@ -121,7 +175,7 @@ class EdHelper:
         Returns if the course represented by the given url is valid for the
         initial auth token
         """
-        courses = EdHelper.valid_token(self.token)['courses']
+        courses = EdHelper.valid_token(self.token, self.retries)['courses']
         if EdRegex.COURSE_PATTERN.fullmatch(url):
             course_id = int(EdHelper.get_ids(url)[0])
             for course in courses:
@@ -294,53 +348,22 @@ class EdHelper:
                  for the user
         """
         attempt_response = self.get_attempts(lesson_id, user_id)
-        if "final_id" not in attempt_response:
-            return None
-        final_id = attempt_response['final_id']
-
-        final_submission_time = None
-        for attempt in attempt_response['attempts']:
-            if attempt['id'] == final_id:
-                final_submission_time = attempt['submitted_at']
-                break
-
+        final_id, final_submission_time = EdHelper._final_attempt(
+            attempt_response
+        )
         # TODO: Have some notion of handling a too late final submission mark
         if final_submission_time is None:
             # No final submission submitted
             return None
 
-        all_criteria = []
         ed_quiz_responses = self.get_quiz_responses(final_id, slide_id)
         mark = self.get_attempt_mark(ed_quiz_responses[0]['lesson_mark']['id'])
-
-        selected_rubric_items = (mark['selected_rubric_items']
-                                 if 'selected_rubric_items' in mark else
-                                 [])
-        for section in rubric['sections']:
-            section_title = section['title']
-            for item in section['items']:
-                if item['id'] in selected_rubric_items:
-                    item_title = EdHelper.remove_html(item['title'])
-                    all_criteria.append({
-                        'name': section_title,
-                        'mark': EdConstants.CRITERIA_MAP.get(item_title,
-                                                             item_title)
-                    })
-
-        feedback_comment = ed_quiz_responses[0]['lesson_mark']['comment']
-        parsed_feedback_comment = EdHelper.remove_html(
-            "" if feedback_comment is None else feedback_comment
+        return EdHelper._format_attempt_submissions(
+            submission_id, final_submission_time,
+            ed_quiz_responses[0]['lesson_mark'], mark,
+            EdHelper._index_rubric(rubric)
         )
 
-        return [{
-            'id': submission_id,
-            'created_at': final_submission_time,
-            'feedback': {
-                'criteria': all_criteria,
-                'content': parsed_feedback_comment
-            }
-        }]
-
     def get_attempts(
         self,
         lesson_id: int,
@@ -386,19 +409,106 @@ class EdHelper:
         final_id = attempt_response['final_id']
 
         ret['completed'] = True
-        rubric = self.get_rubric(self.get_rubric_id(slide_id))
 
         ed_quiz_responses = self.get_quiz_responses(final_id, slide_id)
         mark = self.get_attempt_mark(ed_quiz_responses[0]['lesson_mark']['id'])
-        selected_rubric_items = (mark['selected_rubric_items']
-                                 if 'selected_rubric_items' in mark else
-                                 [])
-
-        if len(selected_rubric_items) == len(rubric['sections']):
+        if (len(EdHelper._selected_rubric_items(mark)) ==
+                len(rubric['sections'])):
             ret['feedback_status'] = 'complete'
 
         return ret
 
+    @staticmethod
+    def _final_attempt(
+        attempt_response: Dict
+    ) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Params: 'attempt_response' - An Ed attempts object for a single user
+        Returns: The ID of the final attempt and the time it was submitted at.
+                 None, None if no final attempt was submitted
+        """
+        if "final_id" not in attempt_response:
+            return None, None
+        final_id = attempt_response['final_id']
+        for attempt in attempt_response['attempts']:
+            if attempt['id'] == final_id:
+                return final_id, attempt['submitted_at']
+        return final_id, None
+
+    @staticmethod
+    def _selected_rubric_items(
+        mark: Dict
+    ) -> List[int]:
+        """
+        Params: 'mark' - An Ed mark object
+        Returns: The IDs of the rubric items selected on the mark
+        """
+        return (mark['selected_rubric_items']
+                if 'selected_rubric_items' in mark else
+                [])
+
+    @staticmethod
+    def _index_rubric(
+        rubric: Dict
+    ) -> Dict[int, Tuple[int, str, str]]:
+        """
+        Params: 'rubric' - An Ed rubric object
+        Returns: A dictionary mapping rubric item id -> (position in the
+                 rubric, section title, mark code) for every rubric item
+        """
+        index = {}
+        for section in rubric['sections']:
+            for item in section['items']:
+                item_title = EdHelper.remove_html(item['title'])
+                index[item['id']] = (
+                    len(index), section['title'],
+                    EdConstants.CRITERIA_MAP.get(item_title, item_title)
+                )
+        return index
+
+    @staticmethod
+    def _format_attempt_submissions(
+        submission_id: int,
+        final_submission_time: str,
+        lesson_mark: Dict,
+        mark: Dict,
+        rubric_index: Dict[int, Tuple[int, str, str]]
+    ) -> List[Dict]:
+        """
+        Joins the selected rubric items of an attempt mark on the slide rubric
+        and converts the result into the previous challenge format
+
+        Params: 'submission_id' - The ID of the specific submission
+                'final_submission_time' - When the final attempt was submitted
+                'lesson_mark' - The lesson mark attached to the quiz response
+                'mark' - The full Ed mark object for the lesson mark
+                'rubric_index' - The slide rubric indexed by item id, see
+                                 EdHelper._index_rubric
+        Returns: A list containing the single converted submission
+        """
+        # Sorting by position keeps criteria in rubric order
+        selected = sorted(rubric_index[item_id] for item_id
+                          in EdHelper._selected_rubric_items(mark)
+                          if item_id in rubric_index)
+        all_criteria = [{'name': section_title, 'mark': mark_code}
+                        for (_, section_title, mark_code) in selected]
+
+        feedback_comment = lesson_mark['comment']
+        parsed_feedback_comment = EdHelper.remove_html(
+            "" if feedback_comment is None else feedback_comment
+        )
+
+        return [{
+            'id': submission_id,
+            'created_at': final_submission_time,
+            'feedback': {
+                'criteria': all_criteria,
+                'content': parsed_feedback_comment,
+                'mark_id': lesson_mark.get('id'),
+                'updated_at': lesson_mark.get('updated_at')
+            }
+        }]
+
     @staticmethod
     def get_ids(
         url: str
@@ -433,12 +543,17 @@ class EdHelper:
     ) -> Dict:
         """
         If the given token is valid, returns the corresponding ed user object.
-        Otherwise raises InvalidResponse
+        Otherwise raises InvalidResponse. Uses EdTokenCache when possible
         """
+        user = EdTokenCache.get(token)
+        if user is not None:
+            return user
         try:
-            return get_response(EdConstants.USER_REQUEST, token, retries)
+            user = get_response(EdConstants.USER_REQUEST, token, retries)
         except Exception:
             raise InvalidResponse("Invalid Ed token")
+        EdTokenCache.put(token, user)
+        return user
 
     @staticmethod
     def valid_assignment_url(url: str) -> bool:
@@ -482,29 +597,68 @@ class EdHelper:
         return sid
 
 
-def get_response(
+def _request(
+    method: str,
     url: str,
     token: str,
     retries: int,
-    payload: Optional[Dict] = {}
-) -> Union[Any, None]:
+    idempotent: bool,
+    **kwargs
+) -> Any:
     """
-    Makes a GET request to the given 'url' endpoint using the authorization
-    bearer 'token' and url params 'payload'
+    Makes a 'method' request to the given 'url' endpoint using the
+    authorization bearer 'token', waiting on the token's rate limiter before
+    every attempt and retrying as RetryPolicy decides. Raises EdRequestFailed
+    if the request can't succeed
     """
+    limiter, status = TokenBucket.for_key(token), None
     for i in range(retries):
+        time.sleep(limiter.reserve())
+        headers, sent = None, True
         try:
-            response = requests.get(url=url, params=payload, headers={
+            response = requests.request(method, url=url, headers={
                 'Authorization': 'Bearer ' + token
-            })
+            }, **kwargs)
             if DEBUG:
-                print(response.json())
+                print(response.text)
             if response.ok:
-                logging.debug(f"GET response for {url}: {response}")
-                return response.json()
-        except requests.exceptions.ConnectionError:
-            logging.debug(f"GET Attempt {i}/{retries} failed, retrying")
-    return None
+                logging.debug(f"{method} response for {url}: {response}")
+                return response.json() if response.content else None
+            status, headers = response.status_code, response.headers
+        except requests.exceptions.ConnectionError as e:
+            # Only a connect timeout guarantees the request was never sent
+            status = None
+            sent = not isinstance(e, requests.exceptions.ConnectTimeout)
+
+        if status == 401:
+            # Token was revoked, make sure it's validated again before reuse
+            EdTokenCache.invalidate(token)
+        delay = RetryPolicy.delay(i, status, headers, idempotent, sent)
+        if delay is None:
+            raise EdRequestFailed(f"{method} {url} failed with status " +
+                                  f"{status}", status)
+        if status == 429:
+            # Everyone using this token is being throttled, not just us
+            limiter.pause(delay)
+        logging.debug(f"{method} attempt {i + 1}/{retries} for {url} " +
+                      f"failed ({status}), retrying in {delay:.2f}s")
+        if i < retries - 1:
+            time.sleep(delay)
+    raise EdRequestFailed(f"{method} {url} failed after {retries} attempts",
+                          status)
+
+
+def get_response(
+    url: str,
+    token: str,
+    retries: int,
+    payload: Optional[Dict] = {}
+) -> Any:
+    """
+    Makes a GET request to the given 'url' endpoint using the authorization
+    bearer 'token' and url params 'payload'
+    """
+    return _request('GET', url, token, retries, True, params=payload)
 
 
 def post_payload(
@@ -512,21 +666,10 @@ def post_payload(
     token: str,
     retries: int,
     payload: Optional[Dict] = {}
-) -> Union[Any, None]:
+) -> Any:
     """
     Makes a POST request to the given 'url' endpoint using the authorization
-    bearer 'token' and form params 'payload'
+    bearer 'token' and form params 'payload'. Only retried when Ed didn't
+    process it
     """
-    for i in range(retries):
-        try:
-            response = requests.post(url=url, json=payload, headers={
-                'Authorization': 'Bearer ' + token
-            })
-            if DEBUG:
-                print(response.json())
-            if response.ok:
-                logging.debug(f"POST Response for {url}: {response}")
-                return response.json()
-        except requests.exceptions.ConnectionError:
-            logging.debug(f"GET Attempt {i}/{retries} failed, retrying")
-    return None
+    return _request('POST', url, token, retries, False, json=payload)
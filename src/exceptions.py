@@ -47,3 +47,29 @@ class InvalidArgument(Exception):
     valid when running commands locally
     """
     pass
+
+
+class EdRequestFailed(Exception):
+    """
+    An exception for when a request to Ed is rejected or keeps failing after
+    every retry. 'status' is the last response status, None if Ed never
+    responded
+    """
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class JobCancelled(Exception):
+    """
+    An exception for when a background job is cancelled before finishing
+    """
+    pass
+
+
+class MissingSnapshotResponse(Exception):
+    """
+    An exception for when a check run from an assignment snapshot needs an Ed
+    response that wasn't captured
+    """
+    pass
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+
+from typing import (
+    Optional, Dict, List, Any, Tuple, Union
+)
+from src.constants import (
+    LOGGING_FILE, FINGERPRINT_DIR
+)
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+def _digest(
+    value: Any
+) -> str:
+    """
+    Returns: A stable hash of any JSON serializable value
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str)
+                          .encode('utf-8')).hexdigest()
+
+
+class FingerprintStore:
+    """
+    Represents what the last consistency check of an assignment saw for
+    every student, so the next check only refetches students that changed.
+
+    Each student has two fingerprints: 'summary', a hash of their row in
+    the roster / results list the checker fetches in one request anyway, and
+    'graded', a hash of their graded submission (mark, selected rubric items
+    and feedback comment) which costs a few requests per student to get.
+    A student whose summary is unchanged reuses their last result without
+    any requests, unless that result had an issue, since those are the
+    students TAs are fixing. A student whose graded fingerprint is unchanged
+    reuses their last result without being re-evaluated
+    """
+
+    def __init__(
+        self,
+        assignment_key: str,
+        directory: Optional[str] = FINGERPRINT_DIR
+    ):
+        """
+        Params: 'assignment_key' - The key from FingerprintStore.assignment_key
+                'directory' - Where every assignment's fingerprints are saved
+        """
+        self.file_path = os.path.join(directory, assignment_key + '.json')
+        self.students: Dict[str, Dict] = {}
+        self.reused = 0
+
+    @staticmethod
+    def assignment_key(
+        context: Any,
+        template: bool
+    ) -> str:
+        """
+        Params: 'context' - The AssignmentContext being checked
+                'template' - Whether or not the template is being checked
+        Returns: A key that changes with anything that changes every
+                 student's result (the assignment, its due date, rubric size
+                 and the template flag)
+        """
+        return _digest([context.ids, str(context.due_at),
+                        context.num_criteria, template])
+
+    @staticmethod
+    def summary(
+        row: Dict
+    ) -> str:
+        """
+        Params: 'row' - A student's Ed challenge user / attempt result object
+        Returns: The student's summary fingerprint
+        """
+        return _digest(row)
+
+    @staticmethod
+    def graded(
+        submissions: Optional[List[Dict]]
+    ) -> str:
+        """
+        Params: 'submissions' - A student's Ed submission objects, in the
+                                challenge format (None if there are none)
+        Returns: The student's graded fingerprint
+        """
+        if submissions is None:
+            return _digest(None)
+        return _digest([
+            [submission['id'], submission['created_at'],
+             None if submission['feedback'] is None else [
+                 submission['feedback'].get('mark_id'),
+                 submission['feedback'].get('updated_at'),
+                 submission['feedback']['criteria'],
+                 _digest(submission['feedback']['content'])
+             ]] for submission in submissions
+        ])
+
+    def load(
+        self
+    ) -> 'FingerprintStore':
+        """
+        Loads the fingerprints saved by the last check, if there was one
+
+        Returns: This store
+        """
+        try:
+            self.students = json.load(open(self.file_path))
+        except FileNotFoundError:
+            self.students = {}
+        except json.JSONDecodeError:
+            logging.warning(f"Ignoring corrupt fingerprints {self.file_path}")
+            self.students = {}
+        return self
+
+    def save(
+        self
+    ) -> None:
+        """
+        Saves every student's fingerprints and results for the next check
+        """
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as temp_file:
+            temp_file.write(json.dumps(self.students))
+        os.replace(temp_path, self.file_path)
+        logging.info(f"Reused {self.reused} / {len(self.students)} " +
+                     "students' last results")
+
+    def unchanged(
+        self,
+        user_id: Union[int, str],
+        summary: str
+    ) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """
+        Params: 'user_id' - The student's Ed user ID
+                'summary' - The student's current summary fingerprint
+        Returns: The student's last (fixes, submission ID) if it can be
+                 reused without fetching anything, otherwise None
+        """
+        student = self.students.get(str(user_id))
+        if (student is None or student['summary'] != summary or
+                student['result'][0] is not None):
+            return None
+        self.reused += 1
+        return tuple(student['result'])
+
+    def evaluated(
+        self,
+        user_id: Union[int, str],
+        graded: str
+    ) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """
+        Params: 'user_id' - The student's Ed user ID
+                'graded' - The student's current graded fingerprint
+        Returns: The student's last (fixes, submission ID) if their graded
+                 submission hasn't changed since, otherwise None
+        """
+        student = self.students.get(str(user_id))
+        if student is None or student['graded'] != graded:
+            return None
+        return tuple(student['result'])
+
+    def put(
+        self,
+        user_id: Union[int, str],
+        summary: str,
+        graded: str,
+        result: Tuple[Optional[str], Optional[str]]
+    ) -> None:
+        """
+        Records a student's fingerprints along with their result
+        """
+        self.students[str(user_id)] = {'summary': summary, 'graded': graded,
+                                       'result': list(result)}
@@ -0,0 +1,200 @@
+import discord
+import logging
+
+from typing import (
+    Any, Dict, Optional, Tuple
+)
+from src.constants import LOGGING_FILE
+from src.discord_helper import DiscordHelper
+from src.discord_scheduler import DiscordScheduler
+from src.exceptions import JobCancelled
+from src.report_delivery import ReportDelivery
+from src.utils import send_message
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class JobDelivery:
+    """
+    Represents posting checker job results (JobQueue's 'deliver' and
+    'publish') to the channels that asked for them. Job args are laid out
+    as the job functions take them, after the token, i.e.
+    ConsistencyChecker.consistency_job's (url, file_name, template,
+    spreadsheet, checkpoint_key, resume)
+    """
+
+    # Discord's error code for starting a second thread from a message
+    THREAD_EXISTS = 160004
+
+    def __init__(
+        self,
+        bot: Any
+    ):
+        """
+        Params: 'bot' - The discord bot object
+        """
+        self.bot = bot
+        # (job ID, channel ID) -> the thread its partial results go to, so
+        # later partials don't depend on the gateway having cached it
+        self.threads: Dict[Tuple[int, int], Any] = {}
+
+    async def _channel(
+        self,
+        channel_id: int
+    ) -> Any:
+        """
+        Returns: The channel with the given ID, fetched if it isn't cached
+        """
+        return (self.bot.get_channel(channel_id) or
+                await self.bot.fetch_channel(channel_id))
+
+    @staticmethod
+    def _summary_embed(
+        job: Dict,
+        *lines: str
+    ) -> discord.Embed:
+        """
+        Returns: The embed closing a job's report, one line per 'lines'
+        """
+        return discord.Embed(title=f"Job #{job['id']} finished",
+                             description="\n".join(lines))
+
+    async def _deliver_ungraded(
+        self,
+        channel: Any,
+        job: Dict,
+        result: Tuple
+    ) -> None:
+        """
+        Posts the result of an 'ungraded' job to 'channel'
+        """
+        title, (key_to_ungraded, _, total_ungraded) = result
+        embeds = DiscordHelper._format_ungraded_embed(key_to_ungraded, title)
+        await ReportDelivery.send(channel, embeds + [
+            JobDelivery._summary_embed(
+                job, "All clear!" if total_ungraded == 0 else
+                f"{total_ungraded} students still ungraded"
+            )
+        ])
+
+    async def _deliver_consistency(
+        self,
+        channel: Any,
+        job: Dict,
+        result: Tuple
+    ) -> None:
+        """
+        Posts the result of a 'consistency' job to 'channel', with its report
+        files if there were issues
+        """
+        file_path, spreadsheet = job['args'][1], job['args'][3]
+        title, (fixes, not_present, total_issues) = result
+        embeds, files = [], None
+        if total_issues > 0:
+            embeds = DiscordHelper._format_fixes_embed(spreadsheet, fixes,
+                                                       title)
+            files = [discord.File(file_path + ".csv"),
+                     discord.File(file_path + ".html")]
+        lines = []
+        if len(not_present) > 0:
+            lines.append(f"{len(not_present)} students not on the grading " +
+                         "spreadsheet, refresh the roster")
+        lines.append("All clear!" if total_issues == 0 else
+                     f"{total_issues} students with consistency issues")
+        await ReportDelivery.send(
+            channel, embeds + [JobDelivery._summary_embed(job, *lines)],
+            files=files
+        )
+
+    async def _results_thread(
+        self,
+        job: Dict,
+        channel_id: int,
+        message_id: int
+    ) -> Any:
+        """
+        Returns: The thread under 'message_id' that the job's partial results
+                 are posted to, created if it doesn't exist yet
+        """
+        key = (job['id'], channel_id)
+        # Threads started from a message share its ID, so one started before a
+        # restart is picked up again
+        thread = self.threads.get(key) or self.bot.get_channel(message_id)
+        if thread is None:
+            channel = await self._channel(channel_id)
+            try:
+                thread = await DiscordScheduler.run(
+                    str(channel_id),
+                    lambda: channel.get_partial_message(
+                        message_id
+                    ).create_thread(name=f"Job #{job['id']} results")
+                )
+            except discord.HTTPException as e:
+                if e.code != JobDelivery.THREAD_EXISTS:
+                    raise
+                thread = await self.bot.fetch_channel(message_id)
+        self.threads[key] = thread
+        return thread
+
+    async def deliver_partial(
+        self,
+        job: Dict,
+        key: str,
+        result: Any
+    ) -> None:
+        """
+        Posts one TA's / section's results to a thread under each message
+        that asked for the job
+
+        Params: 'job' - The job the results are for
+                'key' - The TA / section the results are for
+                'result' - Their ungraded count, or consistency issues
+        """
+        if job['kind'] == 'ungraded':
+            message = discord.Embed(description=f"{key}: {result} students " +
+                                    "still ungraded")
+        else:
+            message = DiscordHelper._format_group_embed(key, result)
+        for channel_id, message_id in job.get('messages', {}).items():
+            try:
+                thread = await self._results_thread(job, int(channel_id),
+                                                    message_id)
+                await send_message(thread, message)
+            except Exception as e:
+                logging.exception(e)
+
+    async def deliver(
+        self,
+        job: Dict,
+        result: Optional[Any],
+        error: Optional[Exception]
+    ) -> None:
+        """
+        Posts a finished job's result, or why it failed, to every channel
+        that asked for it
+
+        Params: 'job' - The finished job
+                'result' - What the job returned, None if it failed
+                'error' - Why the job failed, None if it succeeded
+        """
+        for key in [key for key in self.threads if key[0] == job['id']]:
+            del self.threads[key]
+        for channel_id in job['channels']:
+            try:
+                channel = await self._channel(channel_id)
+                if isinstance(error, JobCancelled):
+                    await send_message(channel,
+                                       f"Job #{job['id']} was cancelled")
+                    continue
+                if error is not None:
+                    await send_message(channel, f"Job #{job['id']} failed. " +
+                                       "Error encountered when handling " +
+                                       f"request: {error}")
+                elif job['kind'] == 'ungraded':
+                    await self._deliver_ungraded(channel, job, result)
+                else:
+                    await self._deliver_consistency(channel, job, result)
+                logging.info(f"Delivered job {job['id']} to {channel_id}")
+            except Exception as e:
+                logging.exception(e)
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import (
+    ThreadPoolExecutor, ProcessPoolExecutor
+)
+
+from typing import (
+    Optional, Dict, Any, Callable, Awaitable, Tuple
+)
+from src.constants import (
+    LOGGING_FILE, JOB_EXECUTOR, JOB_WORKERS, JOB_CANCEL_POLL
+)
+from src.exceptions import JobCancelled
+from src.async_ed_helper import AsyncEdHelper
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class _LoopReporter:
+    """
+    Callback (i.e. progress) handed to jobs running in a worker thread.
+    Schedules the real callback on the bot's event loop without waiting for
+    it, so a slow Discord edit never holds up the check
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        callback: Callable[..., Awaitable[None]]
+    ):
+        """
+        Params: 'loop' - The event loop 'callback' must run on
+                'callback' - The coroutine function to report to
+        """
+        self.loop = loop
+        self.callback = callback
+
+    async def __call__(
+        self,
+        *update: Any
+    ) -> None:
+        asyncio.run_coroutine_threadsafe(self.callback(*update), self.loop)
+
+
+class _QueueReporter:
+    """
+    Callback (i.e. progress) handed to jobs running in a worker process.
+    Updates are put on a managed queue that the bot's event loop drains
+    """
+
+    def __init__(
+        self,
+        queue: Any
+    ):
+        """
+        Params: 'queue' - A multiprocessing.Manager queue
+        """
+        self.queue = queue
+
+    async def __call__(
+        self,
+        *update: Any
+    ) -> None:
+        self.queue.put(update)
+
+
+async def _watch_cancel(
+    cancel: Any,
+    task: asyncio.Task
+) -> None:
+    """
+    Cancels 'task' once the 'cancel' event is set
+    """
+    while not cancel.is_set():
+        await asyncio.sleep(JOB_CANCEL_POLL)
+    task.cancel()
+
+
+async def _job_main(
+    job: Callable[..., Awaitable[Any]],
+    args: Tuple,
+    callbacks: Dict[str, Callable[..., Awaitable[None]]],
+    cancel: Optional[Any]
+) -> Any:
+    """
+    Runs 'job' on the worker's event loop, closing the Ed sessions it opened
+    on that loop before the loop goes away
+    """
+    task = asyncio.ensure_future(job(*args, **callbacks))
+    watcher = (asyncio.ensure_future(_watch_cancel(cancel, task))
+               if cancel is not None else None)
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if cancel is not None and cancel.is_set():
+            raise JobCancelled("Job was cancelled")
+        raise
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        await AsyncEdHelper.close_sessions()
+
+
+def _run_job(
+    job: Callable[..., Awaitable[Any]],
+    args: Tuple,
+    callbacks: Dict[str, Callable[..., Awaitable[None]]],
+    cancel: Optional[Any]
+) -> Any:
+    """
+    Entry point in the worker thread / process. Each job gets its own event
+    loop, so nothing it does can block the bot's
+    """
+    return asyncio.run(_job_main(job, args, callbacks, cancel))
+
+
+class JobExecutor:
+    """
+    Runs long checker jobs off the bot's event loop in a thread or process
+    pool. Fairness between guilds is up to the caller, i.e. JobQueue.
+
+    A job is a module level coroutine function called as
+    job(*args, **callbacks), where each callback is an awaitable forwarded to
+    the bot's event loop, i.e. progress=(completed, total). Jobs must build
+    their own
+    AsyncEdHelper since sessions belong to the loop that opened them. In
+    process mode the job and its arguments / result must be picklable
+    """
+
+    def __init__(
+        self,
+        kind: Optional[str] = JOB_EXECUTOR,
+        workers: Optional[int] = JOB_WORKERS
+    ):
+        """
+        Params: 'kind' - Either 'thread' or 'process'
+                'workers' - How many jobs can run at once overall
+        """
+        if kind == 'thread':
+            self.pool = ThreadPoolExecutor(workers, thread_name_prefix='job')
+        elif kind == 'process':
+            # Forking a process with a running event loop isn't safe
+            self.pool = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        else:
+            raise ValueError(f"Unknown job executor kind: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.manager = None
+
+    def _manager(
+        self
+    ) -> Any:
+        """
+        Returns: The multiprocessing manager used to share queues and events
+                 with worker processes, started on first use
+        """
+        if self.manager is None:
+            self.manager = multiprocessing.get_context('spawn').Manager()
+        return self.manager
+
+    def event(
+        self
+    ) -> Any:
+        """
+        Returns: An event that cancels a job when set, to pass to run as
+                 'cancel'
+        """
+        if self.kind == 'thread':
+            return threading.Event()
+        return self._manager().Event()
+
+    def _reporter(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        callback: Optional[Callable[..., Awaitable[None]]]
+    ) -> Tuple[Any, Optional[asyncio.Task]]:
+        """
+        Returns: The callback to hand to the worker in place of 'callback',
+                 along with the task draining its queue in process mode
+                 (otherwise None)
+        """
+        if callback is None:
+            return None, None
+        if self.kind == 'thread':
+            return _LoopReporter(loop, callback), None
+
+        queue = self._manager().Queue()
+
+        async def drain():
+            # None marks the end of the job
+            while (update := await loop.run_in_executor(None, queue.get)):
+                await callback(*update)
+        return _QueueReporter(queue), loop.create_task(drain())
+
+    async def run(
+        self,
+        guild_id: Any,
+        job: Callable[..., Awaitable[Any]],
+        *args: Any,
+        cancel: Optional[Any] = None,
+        **callbacks: Optional[Callable[..., Awaitable[None]]]
+    ) -> Any:
+        """
+        Runs 'job' in the pool
+
+        Params: 'guild_id' - The guild the job is for
+                'job' - The coroutine function to run
+                'args' - The positional arguments to call 'job' with
+                'cancel' - An event from JobExecutor.event, the job is
+                           cancelled once it is set
+                'callbacks' - Coroutine functions awaited on this loop as the
+                              job calls them, i.e. 'progress' with
+                              (completed, total). None is passed on as is
+        Returns: Whatever 'job' returns. Exceptions raised by 'job' are
+                 re-raised here, JobCancelled if it was cancelled
+        """
+        loop = asyncio.get_running_loop()
+        reporters, drains = {}, []
+        for name, callback in callbacks.items():
+            reporters[name], drain = self._reporter(loop, callback)
+            if drain is not None:
+                drains.append((reporters[name], drain))
+        logging.info(f"Starting {job.__qualname__} job for {guild_id}")
+        try:
+            return await loop.run_in_executor(self.pool, _run_job, job,
+                                              args, reporters, cancel)
+        finally:
+            for reporter, drain in drains:
+                reporter.queue.put(None)
+                await drain
+
+    def shutdown(
+        self
+    ) -> None:
+        """
+        Stops the pool, cancelling any jobs that haven't started yet
+        """
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.manager is not None:
+            self.manager.shutdown()
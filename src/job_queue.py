@@ -0,0 +1,364 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+from typing import (
+    Optional, Dict, List, Any, Callable, Awaitable, Tuple, Union
+)
+from src.constants import (
+    LOGGING_FILE, JOBS_FILE, JOB_GUILD_LIMIT
+)
+from src.database import Database
+from src.job_executor import JobExecutor
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class JobQueue:
+    """
+    Represents a persistent queue of checker jobs shared by every guild.
+    Queued jobs are saved to 'file_path' so they survive restarts, and jobs
+    that were running when the bot stopped are queued again on load.
+
+    Jobs are started round-robin across guilds, with at most 'guild_limit'
+    running per guild, so a guild with many queued jobs can't starve the
+    others. Identical jobs (same guild, kind and key)
+    share one execution and deliver their result to every channel that
+    asked for it
+    """
+
+    def __init__(
+        self,
+        executor: JobExecutor,
+        database: Database,
+        kinds: Dict[str, Callable[..., Awaitable[Any]]],
+        deliver: Callable[[Dict, Any, Optional[Exception]], Awaitable[None]],
+        file_path: Optional[str] = JOBS_FILE,
+        publish: Optional[Callable[..., Awaitable[None]]] = None,
+        guild_limit: Optional[int] = JOB_GUILD_LIMIT
+    ):
+        """
+        Params: 'executor' - The executor to run jobs with
+                'database' - The bot's database, used to look up each guild's
+                             Ed token when its job starts
+                'kinds' - A dictionary mapping job kind -> job function,
+                          called as job(token, *args, progress=...) plus
+                          partial=... if 'publish' is given
+                'deliver' - A coroutine function awaited with (job, result,
+                            error) once a job finishes, where exactly one of
+                            result / error is set
+                'file_path' - Where to persist the queue
+                'publish' - A coroutine function awaited with (job, *update)
+                            whenever a job reports partial results through
+                            its 'partial' callback, in order and before the
+                            job's result is delivered. Jobs are only passed
+                            'partial' if this is given
+                'guild_limit' - How many jobs a single guild can run at once
+        """
+        self.executor = executor
+        self.database = database
+        self.kinds = kinds
+        self.deliver = deliver
+        self.file_path = file_path
+        self.publish = publish
+        self.guild_limit = guild_limit
+
+        try:
+            saved = json.load(open(file_path))
+        except FileNotFoundError:
+            saved = {'next_id': 1, 'jobs': []}
+        self.next_id = saved['next_id']
+        self.jobs: Dict[int, Dict] = {job['id']: job for job in saved['jobs']}
+        for job in self.jobs.values():
+            if job['status'] != 'queued':
+                logging.info(f"Requeuing interrupted job {job['id']}")
+                job.update(status='queued', progress=[0, 0], started=None)
+
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self.cancels: Dict[int, Any] = {}
+        self.last_guild = None
+        self.wakeup = None
+        self.dispatcher = None
+
+    @staticmethod
+    def job_key(
+        guild_id: Union[int, str],
+        kind: str,
+        *params: Any
+    ) -> str:
+        """
+        Params: 'guild_id' - The guild the job is for
+                'kind' - The job kind
+                'params' - Everything that affects the job's result (link,
+                           flags, spreadsheet, ...). Must be JSON serializable
+        Returns: A key that's equal for jobs that would produce the same
+                 result
+        """
+        return hashlib.sha256(json.dumps(
+            [str(guild_id), kind, params], sort_keys=True
+        ).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def eta(
+        job: Dict
+    ) -> Optional[float]:
+        """
+        Params: 'job' - The job to estimate
+        Returns: The estimated number of seconds until the job finishes, None
+                 if it hasn't made enough progress to tell
+        """
+        completed, total = job['progress']
+        if job['started'] is None or completed == 0:
+            return None
+        elapsed = time.time() - job['started']
+        return elapsed / completed * (total - completed)
+
+    def start(
+        self
+    ) -> None:
+        """
+        Starts running queued jobs on the current event loop. Does nothing if
+        the queue is already running
+        """
+        if self.dispatcher is not None:
+            return
+        self.wakeup = asyncio.Event()
+        self.dispatcher = asyncio.ensure_future(self._dispatch())
+        self.wakeup.set()
+
+    async def stop(
+        self
+    ) -> None:
+        """
+        Cancels the running jobs and saves the queue. Jobs that were running
+        are queued again the next time the queue is loaded
+        """
+        for cancel in self.cancels.values():
+            cancel.set()
+        tasks = list(self.tasks.values())
+        if self.dispatcher is not None:
+            tasks.append(self.dispatcher)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.dispatcher = None
+        self.save()
+
+    def submit(
+        self,
+        guild_id: Union[int, str],
+        channel_id: int,
+        kind: str,
+        args: List[Any],
+        key: str,
+        message_id: Optional[int] = None
+    ) -> Tuple[Dict, bool]:
+        """
+        Queues a new job, unless an identical one is already queued or running
+        (and isn't being cancelled)
+
+        Params: 'guild_id' - The guild the job is for
+                'channel_id' - The channel to post the result to
+                'kind' - The job kind, a key of 'kinds'
+                'args' - The JSON serializable arguments to call the job with,
+                         after the guild's token
+                'key' - The job's key from JobQueue.job_key
+                'message_id' - The message that asked for the job, partial
+                               results for 'channel_id' are threaded under it
+        Returns: The job and whether or not it was newly created
+        """
+        for job in self.jobs.values():
+            if job['key'] == key and job['status'] != 'cancelling':
+                if channel_id not in job['channels']:
+                    job['channels'].append(channel_id)
+                    if message_id is not None:
+                        job.setdefault('messages', {})[str(channel_id)] = (
+                            message_id
+                        )
+                    self.save()
+                return job, False
+
+        job = JobInfo.create(self.next_id, guild_id, channel_id, kind, args,
+                             key, message_id)
+        self.next_id += 1
+        self.jobs[job['id']] = job
+        self.save()
+        logging.info(f"Queued {kind} job {job['id']} for {guild_id}")
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return job, True
+
+    def get_jobs(
+        self,
+        guild_id: Union[int, str]
+    ) -> List[Dict]:
+        """
+        Params: 'guild_id' - The guild ID to get jobs for
+        Returns: The guild's queued and running jobs, oldest first
+        """
+        return [job for job in self.jobs.values()
+                if job['guild'] == str(guild_id)]
+
+    def cancel(
+        self,
+        guild_id: Union[int, str],
+        job_id: int
+    ) -> bool:
+        """
+        Cancels a job. Queued jobs are removed right away, running jobs stop
+        at their next cancellation check and deliver a JobCancelled error
+
+        Params: 'guild_id' - The guild the job must belong to
+                'job_id' - The ID of the job to cancel
+        Returns: Whether or not a matching job was found
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job['guild'] != str(guild_id):
+            return False
+
+        logging.info(f"Cancelling job {job_id} for {guild_id}")
+        if job['status'] == 'queued':
+            del self.jobs[job_id]
+            self.save()
+        else:
+            job['status'] = 'cancelling'
+            self.cancels[job_id].set()
+        return True
+
+    def _next_job(
+        self
+    ) -> Optional[Dict]:
+        """
+        Returns: The oldest queued job of the next guild in the rotation that
+                 is under its job limit, None if no job can start
+        """
+        running, oldest = {}, {}
+        for job in self.jobs.values():
+            if job['status'] != 'queued':
+                running[job['guild']] = running.get(job['guild'], 0) + 1
+            elif job['guild'] not in oldest:
+                oldest[job['guild']] = job
+
+        guilds = sorted(guild for guild in oldest
+                        if running.get(guild, 0) < self.guild_limit)
+        if not guilds:
+            return None
+        # Pick up the rotation after whichever guild started a job last
+        later = [guild for guild in guilds
+                 if self.last_guild is None or guild > self.last_guild]
+        return oldest[(later or guilds)[0]]
+
+    async def _dispatch(
+        self
+    ) -> None:
+        """
+        Starts jobs whenever there are free workers
+        """
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while (len(self.tasks) < self.executor.workers and
+                   (job := self._next_job()) is not None):
+                job.update(status='running', started=time.time())
+                self.last_guild = job['guild']
+                self.cancels[job['id']] = self.executor.event()
+                self.tasks[job['id']] = asyncio.ensure_future(self._run(job))
+                self.save()
+
+    async def _run(
+        self,
+        job: Dict
+    ) -> None:
+        """
+        Runs a single job and delivers its result
+        """
+        async def progress(completed: int, total: int):
+            job['progress'] = [completed, total]
+
+        # Updates from worker threads are scheduled without being awaited,
+        # the lock keeps them in order
+        publishing = asyncio.Lock()
+
+        async def partial(*update: Any):
+            async with publishing:
+                try:
+                    await self.publish(job, *update)
+                except Exception as e:
+                    logging.exception(e)
+
+        callbacks = {'progress': progress}
+        if self.publish is not None:
+            callbacks['partial'] = partial
+
+        result, error = None, None
+        try:
+            result = await self.executor.run(
+                job['guild'], self.kinds[job['kind']],
+                self.database.get_token(job['guild']), *job['args'],
+                cancel=self.cancels[job['id']], **callbacks
+            )
+        except Exception as e:
+            logging.exception(e)
+            error = e
+        finally:
+            self.tasks.pop(job['id'], None)
+            self.cancels.pop(job['id'], None)
+        async with publishing:
+            # Partial results still being posted go out before the result
+            pass
+
+        # Not reached if the queue is stopping, so the job is kept for later
+        del self.jobs[job['id']]
+        self.save()
+        self.wakeup.set()
+        logging.info(f"Finished job {job['id']} for {job['guild']}")
+        try:
+            await self.deliver(job, result, error)
+        except Exception as e:
+            logging.exception(e)
+
+    def save(
+        self
+    ) -> None:
+        """
+        Atomically saves the queue to the file it was created with, so a
+        crash mid-write never loses the saved queue
+        """
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as temp_file:
+            temp_file.write(json.dumps({
+                'next_id': self.next_id,
+                'jobs': list(self.jobs.values())
+            }))
+        os.replace(temp_path, self.file_path)
+
+
+class JobInfo:
+    @staticmethod
+    def create(
+        job_id: int,
+        guild_id: Union[int, str],
+        channel_id: int,
+        kind: str,
+        args: List[Any],
+        key: str,
+        message_id: Optional[int] = None
+    ) -> Dict:
+        return {
+            'id': job_id,
+            'guild': str(guild_id),
+            'channels': [channel_id],
+            'messages': ({} if message_id is None
+                         else {str(channel_id): message_id}),
+            'kind': kind,
+            'args': args,
+            'key': key,
+            'status': 'queued',
+            'progress': [0, 0],
+            'created': time.time(),
+            'started': None
+        }
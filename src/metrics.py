@@ -0,0 +1,65 @@
+import threading
+
+from typing import (
+    Dict, Any
+)
+
+
+class Metrics:
+    """
+    Represents a process-wide, thread-safe registry of counters and timings
+    recorded by the bot, i.e. how long each thread refresh cycle took
+    """
+
+    _counters: Dict[str, int] = {}
+    _timings: Dict[str, Dict[str, float]] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def increment(
+        name: str,
+        amount: int = 1
+    ) -> None:
+        """
+        Adds 'amount' to the counter called 'name'
+        """
+        with Metrics._lock:
+            Metrics._counters[name] = Metrics._counters.get(name, 0) + amount
+
+    @staticmethod
+    def observe(
+        name: str,
+        seconds: float
+    ) -> None:
+        """
+        Records a single timing of 'seconds' for 'name'
+        """
+        with Metrics._lock:
+            timing = Metrics._timings.setdefault(
+                name, {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0}
+            )
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+            timing['last'] = seconds
+
+    @staticmethod
+    def snapshot() -> Dict[str, Any]:
+        """
+        Returns: A copy of every counter, and of every timing with its mean
+        """
+        with Metrics._lock:
+            timings = {
+                name: dict(timing, mean=timing['total'] / timing['count'])
+                for name, timing in Metrics._timings.items()
+            }
+            return {'counters': dict(Metrics._counters), 'timings': timings}
+
+    @staticmethod
+    def reset() -> None:
+        """
+        Clears every counter and timing
+        """
+        with Metrics._lock:
+            Metrics._counters.clear()
+            Metrics._timings.clear()
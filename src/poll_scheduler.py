@@ -0,0 +1,153 @@
+import datetime
+import random
+import time
+
+from typing import (
+    Optional, Dict, List, Any, Tuple
+)
+from src.constants import (
+    REFRESH_DELAY, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_BACKOFF,
+    POLL_JITTER, POLL_DEADLINE_WINDOW, POLL_DEADLINE_INTERVAL
+)
+
+
+class CourseSchedule:
+    """
+    Represents when a single Ed course was last polled and how long to wait
+    before polling it again
+    """
+
+    def __init__(
+        self,
+        interval: float
+    ):
+        """
+        Params: 'interval' - The starting number of seconds between polls
+        """
+        self.interval = interval
+        self.last_poll = None
+        self.jitter = 1.0
+        self.deadlines: List[datetime.datetime] = []
+
+    def effective_interval(
+        self,
+        pinned: Optional[float] = None
+    ) -> float:
+        """
+        Params: 'pinned' - An interval an admin pinned the course to, if any
+        Returns: How many seconds to wait between polls right now, before
+                 jitter
+        """
+        if pinned is not None:
+            return pinned
+        now = datetime.datetime.now(datetime.timezone.utc)
+        window = datetime.timedelta(seconds=POLL_DEADLINE_WINDOW)
+        if any(now - window <= due_at <= now + window
+               for due_at in self.deadlines):
+            # Questions spike around due dates
+            return min(self.interval, POLL_DEADLINE_INTERVAL)
+        return self.interval
+
+    def until_next(
+        self,
+        pinned: Optional[float] = None
+    ) -> float:
+        """
+        Returns: How many seconds until the course should be polled again,
+                 0 or less if it's due
+        """
+        if self.last_poll is None:
+            return 0.0
+        return (self.last_poll + self.effective_interval(pinned) * self.jitter
+                - time.monotonic())
+
+
+class PollScheduler:
+    """
+    Decides how often each Ed course's threads are polled. A course is polled
+    at its minimum interval as long as new assignment questions keep
+    showing up, and backs off exponentially while nothing changes. Courses
+    with a lesson due soon are polled at least every POLL_DEADLINE_INTERVAL
+    seconds, and every poll is jittered so courses don't all poll at once.
+    Admins can pin a course to a fixed interval
+    """
+
+    def __init__(
+        self,
+        initial: Optional[float] = REFRESH_DELAY * 60,
+        minimum: Optional[float] = POLL_MIN_INTERVAL,
+        maximum: Optional[float] = POLL_MAX_INTERVAL
+    ):
+        """
+        Params: 'initial' - The interval a course starts out with (seconds)
+                'minimum' - The shortest interval a course can adapt to
+                'maximum' - The longest interval a course can back off to
+        """
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.courses: Dict[Any, CourseSchedule] = {}
+
+    def _get(
+        self,
+        course: Any
+    ) -> CourseSchedule:
+        """
+        Returns: The schedule for 'course', creating it if it's new
+        """
+        if course not in self.courses:
+            self.courses[course] = CourseSchedule(self.initial)
+        return self.courses[course]
+
+    def due(
+        self,
+        course: Any,
+        pinned: Optional[float] = None
+    ) -> bool:
+        """
+        Params: 'course' - The Ed course ID
+                'pinned' - The course's pinned interval, if any
+        Returns: Whether or not the course should be polled now
+        """
+        return self._get(course).until_next(pinned) <= 0
+
+    def record(
+        self,
+        course: Any,
+        new_questions: int,
+        deadlines: Optional[List[datetime.datetime]] = None
+    ) -> None:
+        """
+        Adapts a course's interval after it was polled
+
+        Params: 'course' - The Ed course ID
+                'new_questions' - How many new assignment questions the poll
+                                  found
+                'deadlines' - Upcoming lesson due dates for the course, None
+                              to keep the last known ones
+        """
+        schedule = self._get(course)
+        if new_questions > 0:
+            schedule.interval = self.minimum
+        else:
+            schedule.interval = min(self.maximum,
+                                    schedule.interval * POLL_BACKOFF)
+        if deadlines is not None:
+            schedule.deadlines = deadlines
+        schedule.last_poll = time.monotonic()
+        schedule.jitter = random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+    def status(
+        self,
+        course: Any,
+        pinned: Optional[float] = None
+    ) -> Tuple[float, float]:
+        """
+        Params: 'course' - The Ed course ID
+                'pinned' - The course's pinned interval, if any
+        Returns: The course's current interval and how many seconds until it
+                 is next polled
+        """
+        schedule = self._get(course)
+        return (schedule.effective_interval(pinned),
+                max(0.0, schedule.until_next(pinned)))
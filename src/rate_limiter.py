@@ -0,0 +1,183 @@
+import email.utils
+import random
+import threading
+import time
+import datetime
+
+from typing import (
+    Optional, Dict, Mapping
+)
+from src.constants import (
+    ED_RATE_LIMIT, ED_RATE_BURST, ED_BACKOFF_BASE, ED_BACKOFF_CAP
+)
+
+
+class TokenBucket:
+    """
+    Represents a thread-safe token bucket. Callers reserve a token before
+    each request and wait however long the bucket tells them to, so requests
+    are spread out at 'rate' per second with bursts of up to 'capacity'
+    """
+
+    # key -> bucket, so every client using the same Ed token shares a bucket
+    _buckets: Dict[str, 'TokenBucket'] = {}
+    _buckets_lock = threading.Lock()
+
+    def __init__(
+        self,
+        rate: Optional[float] = ED_RATE_LIMIT,
+        capacity: Optional[float] = ED_RATE_BURST
+    ):
+        """
+        Params: 'rate' - How many tokens are added back per second
+                'capacity' - The max number of tokens the bucket can hold
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def for_key(
+        key: str
+    ) -> 'TokenBucket':
+        """
+        Params: 'key' - What the bucket is shared by (an Ed API token)
+        Returns: The process-wide bucket for the given key
+        """
+        with TokenBucket._buckets_lock:
+            if key not in TokenBucket._buckets:
+                TokenBucket._buckets[key] = TokenBucket()
+            return TokenBucket._buckets[key]
+
+    def reserve(
+        self
+    ) -> float:
+        """
+        Takes a token from the bucket, going into debt if there are none left
+
+        Returns: How many seconds the caller must wait before using the token
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.paused_until - now)
+
+    def pause(
+        self,
+        seconds: float
+    ) -> None:
+        """
+        Stops handing out usable tokens for the next 'seconds' seconds, used
+        when the server explicitly asks us to back off
+
+        Params: 'seconds' - How long to pause for
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until,
+                                    time.monotonic() + seconds)
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed Ed request should be retried and how long to
+    wait before doing so
+    """
+    # Client errors that are worth trying again
+    RETRY_STATUSES = {408, 425, 429}
+    # Client errors that mean the resource no longer exists
+    GONE_STATUSES = {404, 410}
+
+    @staticmethod
+    def transient(
+        status: Optional[int]
+    ) -> bool:
+        """
+        Params: 'status' - The status of a failed request, None if no response
+                           was received (connection error / timeout)
+        Returns: Whether or not the failure is likely temporary (timeout,
+                 throttling, server error), so a cached response can stand in
+                 for it
+        """
+        return status is None or status == 429 or status >= 500
+
+    @staticmethod
+    def retry_after(
+        headers: Mapping[str, str]
+    ) -> Optional[float]:
+        """
+        Params: 'headers' - The response headers
+        Returns: The number of seconds the Retry-After header asks for, None
+                 if it is missing or malformed
+        """
+        value = headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retry_at - datetime.datetime.now(
+            datetime.timezone.utc)).total_seconds())
+
+    @staticmethod
+    def backoff(
+        attempt: int
+    ) -> float:
+        """
+        Params: 'attempt' - How many attempts have already failed, from 0
+        Returns: An exponential backoff delay with full jitter
+        """
+        return random.uniform(0, min(ED_BACKOFF_CAP,
+                                     ED_BACKOFF_BASE * (2 ** attempt)))
+
+    @staticmethod
+    def delay(
+        attempt: int,
+        status: Optional[int],
+        headers: Optional[Mapping[str, str]] = None,
+        idempotent: Optional[bool] = True,
+        sent: Optional[bool] = True
+    ) -> Optional[float]:
+        """
+        Classifies a failed request
+
+        Params: 'attempt' - How many attempts have already failed, from 0
+                'status' - The response status, None if no response was
+                           received (connection error / timeout)
+                'headers' - The response headers, if any
+                'idempotent' - Whether or not the request is safe to repeat
+                               after the server may have processed it
+                'sent' - Whether or not the request may have reached the
+                         server, only False when the connection couldn't be
+                         made at all
+        Returns: How many seconds to wait before retrying, None if the
+                 request should not be retried
+        """
+        if status is None:
+            # A timeout or dropped connection doesn't say whether Ed
+            # processed the request, repeating it could e.g. post twice
+            if sent and not idempotent:
+                return None
+            return RetryPolicy.backoff(attempt)
+        if status == 429 or status == 503:
+            retry_after = RetryPolicy.retry_after(headers or {})
+            if retry_after is not None:
+                return retry_after
+        if status in RetryPolicy.RETRY_STATUSES:
+            return RetryPolicy.backoff(attempt)
+        if status >= 500 and idempotent:
+            return RetryPolicy.backoff(attempt)
+        # Any other client error won't change by retrying
+        return None
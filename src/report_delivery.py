@@ -0,0 +1,169 @@
+import discord
+import logging
+
+from typing import (
+    Any, List, Optional
+)
+from src.constants import (
+    LOGGING_FILE, DISCORD_MAX_EMBEDS, DISCORD_MAX_EMBED_CHARS,
+    REPORT_MAX_MESSAGES, REPORT_PAGE_TIMEOUT
+)
+from src.discord_scheduler import DiscordScheduler
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class ReportPages(discord.ui.View):
+    """
+    Represents previous / next buttons under a report message that flip it
+    between pages of embeds in place. The buttons are removed once nobody
+    has used them for 'timeout' seconds
+    """
+
+    def __init__(
+        self,
+        pages: List[List[discord.Embed]],
+        timeout: Optional[float] = REPORT_PAGE_TIMEOUT
+    ):
+        """
+        Params: 'pages' - The report's embeds, split into messages
+                'timeout' - How long the buttons keep working after their
+                            last use (seconds)
+        """
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.page = 0
+        self.message = None
+        self._update_buttons()
+
+    def _update_buttons(
+        self
+    ) -> None:
+        """
+        Disables the buttons that would go past either end of the report and
+        shows which page is showing
+        """
+        self.previous.disabled = self.page == 0
+        self.next.disabled = self.page == len(self.pages) - 1
+        self.position.label = f"{self.page + 1}/{len(self.pages)}"
+
+    async def _show(
+        self,
+        interaction: discord.Interaction,
+        page: int
+    ) -> None:
+        """
+        Replaces the message's embeds with the given page
+        """
+        self.page = page
+        self._update_buttons()
+        # Interaction responses don't count against the channel's bucket
+        await interaction.response.edit_message(embeds=self.pages[page],
+                                                view=self)
+
+    @discord.ui.button(label="<", style=discord.ButtonStyle.secondary)
+    async def previous(
+        self,
+        button: discord.ui.Button,
+        interaction: discord.Interaction
+    ) -> None:
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label="1/1", style=discord.ButtonStyle.secondary,
+                       disabled=True)
+    async def position(
+        self,
+        button: discord.ui.Button,
+        interaction: discord.Interaction
+    ) -> None:
+        pass
+
+    @discord.ui.button(label=">", style=discord.ButtonStyle.secondary)
+    async def next(
+        self,
+        button: discord.ui.Button,
+        interaction: discord.Interaction
+    ) -> None:
+        await self._show(interaction, self.page + 1)
+
+    async def on_timeout(
+        self
+    ) -> None:
+        if self.message is None:
+            return
+        try:
+            await DiscordScheduler.run(
+                str(self.message.channel.id),
+                lambda: self.message.edit(view=None),
+                DiscordScheduler.BACKGROUND
+            )
+        except discord.HTTPException as e:
+            # Message was probably deleted, nothing left to clean up
+            logging.info(f"Couldn't remove report buttons: {e}")
+
+
+class ReportDelivery:
+    """
+    Sends reports made up of many embeds (i.e. per TA results) in as few
+    messages as possible
+    """
+
+    @staticmethod
+    def paginate(
+        embeds: List[discord.Embed]
+    ) -> List[List[discord.Embed]]:
+        """
+        Params: 'embeds' - Every embed in the report, in order
+        Returns: The embeds split into messages, each within Discord's limits
+                 on embeds per message and characters per message
+        """
+        pages = [[]]
+        characters = 0
+        for embed in embeds:
+            full = (len(pages[-1]) == DISCORD_MAX_EMBEDS or
+                    characters + len(embed) > DISCORD_MAX_EMBED_CHARS)
+            if pages[-1] and full:
+                pages.append([])
+                characters = 0
+            pages[-1].append(embed)
+            characters += len(embed)
+        return pages
+
+    @staticmethod
+    async def send(
+        channel: Any,
+        embeds: List[discord.Embed],
+        files: Optional[List[Any]] = None,
+        priority: Optional[int] = DiscordScheduler.INTERACTIVE
+    ) -> List[Any]:
+        """
+        Sends a report to 'channel'. Reports that fit in REPORT_MAX_MESSAGES
+        messages are sent as is, larger ones are sent as a single message
+        with buttons to page through the rest
+
+        Params: 'channel' - The channel to send the report to
+                'embeds' - Every embed in the report, in order
+                'files' - Files to attach to the first message
+                'priority' - The DiscordScheduler priority of the sends
+        Returns: The messages that were sent
+        """
+        pages = ReportDelivery.paginate(embeds)
+        if len(pages) > REPORT_MAX_MESSAGES:
+            view = ReportPages(pages)
+            view.message = await DiscordScheduler.run(
+                str(channel.id),
+                lambda: channel.send(embeds=pages[0], files=files, view=view),
+                priority
+            )
+            return [view.message]
+
+        messages = []
+        for i, page in enumerate(pages):
+            messages.append(await DiscordScheduler.run(
+                str(channel.id),
+                lambda: channel.send(embeds=page,
+                                     files=files if i == 0 else None),
+                priority
+            ))
+        return messages
@@ -0,0 +1,146 @@
+import asyncio
+import csv
+import json
+import logging
+
+from typing import (
+    List, Optional, Any
+)
+from src.constants import (
+    LOGGING_FILE, REPORT_SINK_BATCH
+)
+from src.html_constants import (
+    HTML_ROW, HTML_HREF, HTML_TABLE, HTML_HEADER, HTML_STYLE
+)
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class ReportSink:
+    """
+    Represents the .csv, .html and (optionally) .jsonl files of a
+    consistency report, written in a single pass as rows are produced. Rows
+    are buffered up to REPORT_SINK_BATCH at a time and written from a worker
+    thread, so neither the event loop nor memory grows with the report.
+    Use as an async context manager, the files are finished on exit
+
+    Rows are [TA | section, link, issue], and rows for the same TA / section
+    should be written together so the HTML table can shade them as a group
+    """
+
+    HEADER = ['TA', 'Link', 'Issue']
+
+    def __init__(
+        self,
+        file_path: str,
+        jsonl: Optional[bool] = False,
+        batch: Optional[int] = REPORT_SINK_BATCH
+    ):
+        """
+        Params: 'file_path' - The path to write the report to, without an
+                              extension
+                'jsonl' - Whether or not to also write a .jsonl file with
+                          one JSON object per row
+                'batch' - How many rows to buffer before writing them
+        """
+        self.file_path = file_path
+        self.jsonl = jsonl
+        self.batch = batch
+        self.buffer: List[List[str]] = []
+        self.rows = 0
+        self.lock = asyncio.Lock()
+        self.files = {}
+        self.csv_writer = None
+        self.last_key = None
+        self.shade = False
+
+    async def __aenter__(
+        self
+    ) -> 'ReportSink':
+        await asyncio.to_thread(self._open)
+        return self
+
+    async def __aexit__(
+        self,
+        *exc_info: Any
+    ) -> None:
+        async with self.lock:
+            rows, self.buffer = self.buffer, []
+            await asyncio.to_thread(self._close, rows)
+
+    def _open(
+        self
+    ) -> None:
+        """
+        Opens every file and writes their headers. Runs in a worker thread
+        """
+        extensions = ['csv', 'html'] + (['jsonl'] if self.jsonl else [])
+        for extension in extensions:
+            self.files[extension] = open(f"{self.file_path}.{extension}",
+                                         'w', newline='')
+        self.csv_writer = csv.writer(self.files['csv'])
+        self.csv_writer.writerow(ReportSink.HEADER)
+        # HTML_TABLE has a %s for the header and one for the rows
+        self.html_start, self.html_middle, self.html_end = (
+            HTML_TABLE.split('%s')
+        )
+        self.files['html'].write(HTML_STYLE + self.html_start +
+                                 HTML_HEADER.format(*ReportSink.HEADER) +
+                                 self.html_middle)
+
+    def _write(
+        self,
+        rows: List[List[str]]
+    ) -> None:
+        """
+        Writes a batch of rows to every file. Runs in a worker thread
+        """
+        self.csv_writer.writerows(rows)
+        html = []
+        for key, link, issue in rows:
+            if self.last_key is not None and key != self.last_key:
+                self.shade = not self.shade
+            self.last_key = key
+            html.append(HTML_ROW.format(key, HTML_HREF.format(link), issue,
+                                        "one" if self.shade else "two"))
+        self.files['html'].write("".join(html))
+        if self.jsonl:
+            self.files['jsonl'].write("".join(
+                json.dumps(dict(zip(ReportSink.HEADER, row))) + "\n"
+                for row in rows
+            ))
+
+    def _close(
+        self,
+        rows: List[List[str]]
+    ) -> None:
+        """
+        Writes the last rows, finishes the HTML table and closes every file.
+        Runs in a worker thread
+        """
+        try:
+            if rows:
+                self._write(rows)
+            self.files['html'].write(self.html_end)
+        finally:
+            for file in self.files.values():
+                file.close()
+        logging.info(f"Wrote {self.rows} row report to {self.file_path}")
+
+    async def write(
+        self,
+        rows: List[List[str]]
+    ) -> None:
+        """
+        Adds rows to the report, writing them out once a full batch is
+        buffered
+
+        Params: 'rows' - A list of [TA | section, link, issue] rows
+        """
+        async with self.lock:
+            self.buffer.extend(rows)
+            self.rows += len(rows)
+            if len(self.buffer) >= self.batch:
+                rows, self.buffer = self.buffer, []
+                await asyncio.to_thread(self._write, rows)
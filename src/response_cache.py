@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from typing import (
+    Optional, Dict, Any, Tuple, Mapping
+)
+from src.constants import (
+    ED_CACHE_SIZE, ED_CACHE_STALE
+)
+
+
+class CacheEntry:
+    """
+    Represents a single cached Ed response along with what's needed to
+    revalidate it
+    """
+
+    def __init__(
+        self,
+        value: Any,
+        ttl: float,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ):
+        """
+        Params: 'value' - The parsed response body
+                'ttl' - How many seconds the response is fresh for
+                'etag' - The ETag header of the response, if any
+                'last_modified' - The Last-Modified header of the response, if
+                                  any
+        """
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.refresh(ttl)
+
+    def refresh(
+        self,
+        ttl: float
+    ) -> None:
+        """
+        Marks the entry as fresh for another 'ttl' seconds
+        """
+        self.expires = time.monotonic() + ttl
+
+    def fresh(
+        self
+    ) -> bool:
+        """
+        Returns: Whether or not the entry can be served without revalidating
+        """
+        return time.monotonic() < self.expires
+
+    def servable_stale(
+        self
+    ) -> bool:
+        """
+        Returns: Whether or not the entry is recent enough to serve while it
+                 is revalidated, or if revalidating fails
+        """
+        return time.monotonic() < self.expires + ED_CACHE_STALE
+
+    def conditional_headers(
+        self
+    ) -> Dict[str, str]:
+        """
+        Returns: The headers to send to revalidate this entry
+        """
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    Represents a thread-safe, size-bounded LRU cache of Ed GET responses.
+    Counts hits, stale hits, misses and successful revalidations
+    """
+
+    def __init__(
+        self,
+        size: Optional[int] = ED_CACHE_SIZE
+    ):
+        """
+        Params: 'size' - The max number of responses to keep
+        """
+        self.size = size
+        self.entries: OrderedDict[Tuple, CacheEntry] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits, self.stale_hits, self.misses, self.revalidated = 0, 0, 0, 0
+
+    @staticmethod
+    def key(
+        token: str,
+        url: str,
+        payload: Optional[Dict] = None
+    ) -> Tuple:
+        """
+        Returns: The cache key for a GET of 'url' with url params 'payload'
+                 made with 'token'. Responses are kept per token since
+                 different users can see different data
+        """
+        return (token, url, json.dumps(payload or {}, sort_keys=True))
+
+    def get(
+        self,
+        key: Tuple
+    ) -> Optional[CacheEntry]:
+        """
+        Returns: The entry for 'key', None if it isn't cached
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(
+        self,
+        key: Tuple,
+        value: Any,
+        ttl: float,
+        headers: Optional[Mapping[str, str]] = None
+    ) -> CacheEntry:
+        """
+        Caches 'value' for 'key', evicting the least recently used entry if
+        the cache is full
+
+        Params: 'headers' - The response headers, used for revalidation
+        Returns: The new entry
+        """
+        headers = headers or {}
+        entry = CacheEntry(value, ttl, headers.get('ETag'),
+                           headers.get('Last-Modified'))
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return entry
+
+    def discard(
+        self,
+        key: Tuple
+    ) -> None:
+        """
+        Drops the entry for 'key', if it's cached
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def invalidate(
+        self,
+        token: Optional[str] = None
+    ) -> None:
+        """
+        Drops every cached response, or only those made with 'token'
+        """
+        with self.lock:
+            for key in [key for key in self.entries
+                        if token is None or key[0] == token]:
+                del self.entries[key]
+
+    def record(
+        self,
+        counter: str
+    ) -> None:
+        """
+        Increments one of the 'hits', 'stale_hits', 'misses' or 'revalidated'
+        counters
+        """
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(
+        self
+    ) -> Dict[str, int]:
+        """
+        Returns: The current counters and number of cached responses
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated,
+                'size': len(self.entries)
+            }
@@ -0,0 +1,207 @@
+import datetime
+import gzip
+import json
+import logging
+
+from typing import (
+    Optional, Dict, Any, Callable, Awaitable
+)
+from src.constants import (
+    LOGGING_FILE, CHECK_CONCURRENCY
+)
+from src.exceptions import (
+    MissingSnapshotResponse
+)
+from src.async_ed_helper import AsyncEdHelper
+from src.assignment_context import AssignmentContext
+from src.utils import bounded_map
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+
+class EdSnapshot:
+    """
+    Represents every Ed response the checkers need for a single assignment
+    (slide, lesson, rubric, roster and each student's attempts, quiz
+    responses and marks), captured once so checks can be rerun offline
+    against exactly the same data. Saved as gzipped JSON.
+
+    Snapshots include student emails, keep them out of shared channels
+    """
+
+    # Bump when the file format changes
+    VERSION = 1
+
+    def __init__(
+        self,
+        url: str,
+        responses: Optional[Dict[str, Any]] = None,
+        captured_at: Optional[str] = None
+    ):
+        """
+        Params: 'url' - The url of the captured assignment
+                'responses' - Captured response bodies by EdSnapshot.key
+                'captured_at' - When the capture finished (ISO format)
+        """
+        self.url = url
+        self.responses = responses if responses is not None else {}
+        self.captured_at = captured_at
+
+    @staticmethod
+    def key(
+        url: str,
+        payload: Optional[Dict] = None
+    ) -> str:
+        """
+        Returns: The key a GET of 'url' with url params 'payload' is captured
+                 under
+        """
+        return url + json.dumps(payload or {}, sort_keys=True)
+
+    @staticmethod
+    def load(
+        file_path: str
+    ) -> 'EdSnapshot':
+        """
+        Params: 'file_path' - A file written by EdSnapshot.save
+        Returns: The snapshot saved in the file
+        """
+        with gzip.open(file_path, 'rt', encoding='utf-8') as file:
+            saved = json.load(file)
+        if saved.get('version') != EdSnapshot.VERSION:
+            raise ValueError(f"Unsupported snapshot version in {file_path}")
+        return EdSnapshot(saved['url'], saved['responses'],
+                          saved['captured_at'])
+
+    def save(
+        self,
+        file_path: str
+    ) -> None:
+        """
+        Writes the snapshot to 'file_path' as gzipped JSON
+        """
+        with gzip.open(file_path, 'wt', encoding='utf-8') as file:
+            json.dump({
+                'version': EdSnapshot.VERSION,
+                'url': self.url,
+                'captured_at': self.captured_at,
+                'responses': self.responses
+            }, file, separators=(',', ':'))
+        logging.info(f"Saved snapshot of {len(self.responses)} responses " +
+                     f"to {file_path}")
+
+    @staticmethod
+    async def capture(
+        token: str,
+        url: str,
+        concurrency: Optional[int] = CHECK_CONCURRENCY,
+        progress_bar_update: Optional[Callable[[int, int],
+                                               Awaitable[None]]] = None
+    ) -> 'EdSnapshot':
+        """
+        Fetches everything the checkers (consistency, ungraded and feedback
+        box searches) would for the given assignment
+
+        Params: 'token' - The Ed API token to capture with
+                'url' - The url of the ed assignment
+                'concurrency' - How many students to capture at once
+                'progress_bar_update' - A function to call with (completed,
+                                        total) students
+        Returns: The captured snapshot
+        """
+        snapshot = EdSnapshot(url)
+        ed_helper = RecordingEdHelper(token, snapshot)
+        context = await AssignmentContext.create(ed_helper, url)
+        snapshot.url = context.url
+
+        if not context.attempt_slide:
+            users = [user for user in await ed_helper.get_challenge_users(
+                        context.challenge_id)
+                     if user['course_role'] == 'student']
+
+            async def capture_user(user: Dict):
+                await ed_helper.get_challenge_submissions(
+                    user['id'], context.challenge_id
+                )
+        else:
+            # The ungraded check converts every attempt, not just students'
+            users = await ed_helper.get_attempt_results(context.lesson_id)
+
+            async def capture_user(user: Dict):
+                # Fetches the attempts, quiz responses and mark that
+                # get_attempt_submissions needs as well
+                await ed_helper.get_attempt_user(user, context)
+
+        await bounded_map(capture_user, users, concurrency,
+                          progress_bar_update)
+        snapshot.captured_at = datetime.datetime.now().isoformat()
+        return snapshot
+
+
+class RecordingEdHelper(AsyncEdHelper):
+    """
+    Represents an AsyncEdHelper that records every GET response into an
+    EdSnapshot
+    """
+
+    def __init__(
+        self,
+        token: str,
+        snapshot: EdSnapshot
+    ):
+        """
+        Params: 'token' - The Ed API token to use with requests
+                'snapshot' - The snapshot to record responses into
+        """
+        super().__init__(token)
+        self.snapshot = snapshot
+
+    async def _get(
+        self,
+        url: str,
+        payload: Optional[Dict] = None,
+        endpoint: Optional[str] = None,
+        prefer_cache_after: Optional[float] = None
+    ) -> Any:
+        response = await super()._get(url, payload, endpoint,
+                                      prefer_cache_after)
+        self.snapshot.responses[EdSnapshot.key(url, payload)] = response
+        return response
+
+
+class SnapshotEdHelper(AsyncEdHelper):
+    """
+    Represents an AsyncEdHelper that answers every GET from an EdSnapshot
+    and never talks to Ed. Raises MissingSnapshotResponse for anything that
+    wasn't captured
+    """
+
+    def __init__(
+        self,
+        snapshot: EdSnapshot
+    ):
+        """
+        Params: 'snapshot' - The snapshot to answer requests from
+        """
+        super().__init__(None)
+        self.snapshot = snapshot
+
+    async def _get(
+        self,
+        url: str,
+        payload: Optional[Dict] = None,
+        endpoint: Optional[str] = None,
+        prefer_cache_after: Optional[float] = None
+    ) -> Any:
+        key = EdSnapshot.key(url, payload)
+        if key not in self.snapshot.responses:
+            raise MissingSnapshotResponse(f"{url} wasn't captured")
+        return self.snapshot.responses[key]
+
+    async def _post(
+        self,
+        url: str,
+        payload: Optional[Dict] = None
+    ) -> Any:
+        raise MissingSnapshotResponse("Snapshots are read only")
@@ -0,0 +1,599 @@
+import abc
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from typing import (
+    Dict, Union, Optional, List, Any
+)
+from src.constants import (
+    LOGGING_FILE, JSON_FLUSH_INTERVAL, JSON_FLUSH_BATCH, JSON_COMPACT_RECORDS
+)
+from src.exceptions import (
+    DBFileNotFound
+)
+
+logging.basicConfig(filename=LOGGING_FILE, encoding='utf-8',
+                    level=logging.INFO)
+
+# Extensions that are stored with SqliteStorage, anything else is JSON
+SQLITE_EXTENSIONS = {'.db', '.sqlite', '.sqlite3'}
+
+
+class Storage(abc.ABC):
+    """
+    Represents where the Database persists guild information. Every change
+    to the database is passed on through one of these methods so backends
+    can write only what changed. 'guild_info' dictionaries are the result of
+    GuildInfo.create, 'thread_info' ones of ThreadInfo.create. Backends must
+    implement every abstract method
+    """
+
+    @abc.abstractmethod
+    def load(
+        self
+    ) -> Dict[str, Dict]:
+        """
+        Returns: A dictionary mapping guild ID -> guild info, the same
+                 dictionary the Database will keep updating
+        """
+        pass
+
+    @abc.abstractmethod
+    def put_guild(
+        self,
+        guild_id: str,
+        guild_info: Dict
+    ) -> None:
+        """
+        Saves a guild's info, including its threads
+        """
+        pass
+
+    def update_guild(
+        self,
+        guild_id: str,
+        guild_info: Dict
+    ) -> None:
+        """
+        Saves a guild's info after a change to anything but its threads
+        """
+        self.put_guild(guild_id, guild_info)
+
+    @abc.abstractmethod
+    def delete_guild(
+        self,
+        guild_id: str
+    ) -> None:
+        """
+        Removes a guild and all of its threads
+        """
+        pass
+
+    @abc.abstractmethod
+    def put_thread(
+        self,
+        guild_id: str,
+        discord_id: str,
+        thread_info: Dict
+    ) -> None:
+        """
+        Saves a single tracked thread of a guild
+        """
+        pass
+
+    @abc.abstractmethod
+    def delete_thread(
+        self,
+        guild_id: str,
+        discord_id: str
+    ) -> None:
+        """
+        Removes a single tracked thread of a guild
+        """
+        pass
+
+    @abc.abstractmethod
+    def save(
+        self,
+        guild_to_info: Dict[str, Dict]
+    ) -> None:
+        """
+        Saves everything, making sure the stored copy matches
+        'guild_to_info' exactly
+        """
+        pass
+
+    def flush(
+        self
+    ) -> None:
+        """
+        Writes any changes the storage is still holding on to
+        """
+        pass
+
+    def close(
+        self
+    ) -> None:
+        """
+        Releases anything the storage holds open
+        """
+        pass
+
+    @staticmethod
+    def for_path(
+        file_path: str
+    ) -> 'Storage':
+        """
+        Params: 'file_path' - The file to store the database in
+        Returns: SqliteStorage for .db / .sqlite / .sqlite3 files, otherwise
+                 JsonStorage
+        """
+        if os.path.splitext(file_path)[1] in SQLITE_EXTENSIONS:
+            return SqliteStorage(file_path)
+        return JsonStorage(file_path)
+
+
+class JsonStorage(Storage):
+    """
+    Stores every guild in a JSON snapshot file plus an append-only journal of
+    changes next to it ('file_path'.journal). Changes are queued and written
+    to the journal in batches by a background thread, which also keeps its
+    own copy of the database to periodically compact the journal into a new
+    snapshot. The journal is replayed on top of the snapshot when loading
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        flush_interval: Optional[float] = JSON_FLUSH_INTERVAL,
+        flush_batch: Optional[int] = JSON_FLUSH_BATCH,
+        compact_records: Optional[int] = JSON_COMPACT_RECORDS
+    ):
+        """
+        Params: 'file_path' - The JSON snapshot file. Loading raises
+                              DBFileNotFound if it doesn't exist
+                'flush_interval' - How many seconds changes can wait before
+                                   being written
+                'flush_batch' - How many queued changes trigger a write right
+                                away
+                'compact_records' - How many journaled changes trigger a
+                                    compaction into a new snapshot
+        """
+        self.file_path = file_path
+        self.journal_path = file_path + '.journal'
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.compact_records = compact_records
+
+        self.pending: List[str] = []
+        self.pending_lock = threading.Lock()
+        # Held while the journal, snapshot or replica are being written
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.replica = None
+        self.journal_records = 0
+        self.writer = None
+
+    @staticmethod
+    def _apply(
+        guild_to_info: Dict[str, Dict],
+        record: Dict
+    ) -> None:
+        """
+        Applies a single journal record to 'guild_to_info'. Records are
+        idempotent, so replaying one that's already in the snapshot is fine
+        """
+        guild_id, op = record['guild'], record['op']
+        if op == 'put_guild':
+            guild_to_info[guild_id] = record['info']
+        elif op == 'update_guild':
+            guild_to_info[guild_id].update(record['info'])
+        elif op == 'delete_guild':
+            guild_to_info.pop(guild_id, None)
+        elif op == 'put_thread':
+            thread_info = record['thread']
+            guild_to_info[guild_id]['threads'][thread_info['ed_id']] = int(
+                record['discord_id']
+            )
+            guild_to_info[guild_id].setdefault('discord_threads', {})[
+                record['discord_id']] = thread_info
+        elif op == 'delete_thread':
+            thread_info = guild_to_info[guild_id].get(
+                'discord_threads', {}
+            ).pop(record['discord_id'], None)
+            if thread_info is not None:
+                guild_to_info[guild_id]['threads'].pop(thread_info['ed_id'],
+                                                       None)
+
+    def load(
+        self
+    ) -> Dict[str, Dict]:
+        try:
+            guild_to_info = json.load(open(self.file_path))
+        except FileNotFoundError:
+            raise DBFileNotFound("Database file cannot be found, unable to " +
+                                 "create/load database")
+
+        replayed, good = 0, 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as journal:
+                for line in journal:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("Missing newline")
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn final write from a crash, nothing after it
+                        logging.warning("Dropping partial database journal " +
+                                        "record")
+                        break
+                    JsonStorage._apply(guild_to_info, record)
+                    replayed += 1
+                    good += len(line)
+            if good < os.path.getsize(self.journal_path):
+                # Otherwise later records are appended after the torn one and
+                # never replayed
+                os.truncate(self.journal_path, good)
+        if replayed:
+            logging.info(f"Replayed {replayed} database journal records")
+
+        for guild_info in guild_to_info.values():
+            if 'discord_threads' not in guild_info:
+                # Databases saved before the reverse index existed. Threads
+                # are started from their starter message, so they share IDs
+                guild_info['discord_threads'] = {
+                    str(discord_id): {
+                        'ed_id': ed_id, 'course': guild_info['course'],
+                        'message': discord_id
+                    } for ed_id, discord_id in guild_info['threads'].items()
+                }
+
+        self.replica = json.loads(json.dumps(guild_to_info))
+        self.journal_records = replayed
+        self.writer = threading.Thread(target=self._write_loop,
+                                       name='database-writer', daemon=True)
+        self.writer.start()
+        return guild_to_info
+
+    def _record(
+        self,
+        op: str,
+        guild_id: str,
+        **fields: Any
+    ) -> None:
+        """
+        Queues a journal record. It's serialized right away so later changes
+        to the database can't leak into it
+        """
+        line = json.dumps(dict(op=op, guild=guild_id, **fields))
+        with self.pending_lock:
+            self.pending.append(line)
+            if len(self.pending) >= self.flush_batch:
+                self.wakeup.set()
+
+    def put_guild(
+        self,
+        guild_id: str,
+        guild_info: Dict
+    ) -> None:
+        self._record('put_guild', guild_id, info=guild_info)
+
+    def update_guild(
+        self,
+        guild_id: str,
+        guild_info: Dict
+    ) -> None:
+        self._record('update_guild', guild_id, info={
+            key: value for key, value in guild_info.items()
+            if key not in ('threads', 'discord_threads')
+        })
+
+    def delete_guild(
+        self,
+        guild_id: str
+    ) -> None:
+        self._record('delete_guild', guild_id)
+
+    def put_thread(
+        self,
+        guild_id: str,
+        discord_id: str,
+        thread_info: Dict
+    ) -> None:
+        self._record('put_thread', guild_id, discord_id=discord_id,
+                     thread=thread_info)
+
+    def delete_thread(
+        self,
+        guild_id: str,
+        discord_id: str
+    ) -> None:
+        self._record('delete_thread', guild_id, discord_id=discord_id)
+
+    def _write_loop(
+        self
+    ) -> None:
+        """
+        Background thread body, flushing queued records until stopped
+        """
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.exception(e)
+
+    def flush(
+        self
+    ) -> None:
+        """
+        Appends every queued record to the journal, compacting it into a new
+        snapshot if it has grown past 'compact_records'
+        """
+        with self.write_lock:
+            with self.pending_lock:
+                lines, self.pending = self.pending, []
+            if not lines:
+                return
+
+            with open(self.journal_path, 'a') as journal:
+                journal.write(''.join(line + '\n' for line in lines))
+                journal.flush()
+                os.fsync(journal.fileno())
+            for line in lines:
+                JsonStorage._apply(self.replica, json.loads(line))
+            self.journal_records += len(lines)
+
+            if self.journal_records >= self.compact_records:
+                self._compact()
+
+    def _compact(
+        self
+    ) -> None:
+        """
+        Atomically replaces the snapshot with the replica and empties the
+        journal. Must hold 'write_lock'
+        """
+        # Write a copy first so dying mid-write can't truncate the database
+        temp_path = self.file_path + '.tmp'
+        try:
+            with open(temp_path, 'w') as temp_file:
+                temp_file.write(json.dumps(self.replica))
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, self.file_path)
+        except FileNotFoundError:
+            raise DBFileNotFound("Original database file can't be found, " +
+                                 "unable to save")
+        # Dying before this just replays records already in the snapshot
+        open(self.journal_path, 'w').close()
+        self.journal_records = 0
+
+    def save(
+        self,
+        guild_to_info: Dict[str, Dict]
+    ) -> None:
+        snapshot = json.loads(json.dumps(guild_to_info))
+        with self.write_lock:
+            with self.pending_lock:
+                # Everything queued is already part of the snapshot
+                self.pending = []
+            self.replica = snapshot
+            self._compact()
+
+    def close(
+        self
+    ) -> None:
+        self.stopped.set()
+        self.wakeup.set()
+        if self.writer is not None:
+            self.writer.join()
+        self.flush()
+
+
+class SqliteStorage(Storage):
+    """
+    Stores guilds and their tracked threads in separate tables of a SQLite
+    database in WAL mode, so every change is a single row write. The first
+    time the database is opened, the JSON database next to it (same name,
+    .json extension) is imported if it exists
+    """
+    # Bump when the schema changes
+    SCHEMA_VERSION = 1
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS guilds (
+            guild_id TEXT PRIMARY KEY,
+            info TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS threads (
+            guild_id TEXT NOT NULL
+                REFERENCES guilds (guild_id) ON DELETE CASCADE,
+            ed_id TEXT NOT NULL,
+            discord_id INTEGER NOT NULL,
+            course,
+            message INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, ed_id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS threads_ed_id ON threads (ed_id)",
+        """CREATE INDEX IF NOT EXISTS threads_discord_id
+            ON threads (discord_id)"""
+    ]
+    # Guild info keys that are stored in the threads table instead
+    THREAD_KEYS = ('threads', 'discord_threads')
+
+    def __init__(
+        self,
+        file_path: str
+    ):
+        """
+        Params: 'file_path' - The SQLite database file, created if it doesn't
+                              exist
+        """
+        self.file_path = file_path
+        self.legacy_path = os.path.splitext(file_path)[0] + '.json'
+        self.connection = sqlite3.connect(file_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version < SqliteStorage.SCHEMA_VERSION:
+            with self.connection:
+                for statement in SqliteStorage.SCHEMA:
+                    self.connection.execute(statement)
+                if version == 0 and os.path.exists(self.legacy_path):
+                    self._migrate()
+                self.connection.execute(
+                    f"PRAGMA user_version={SqliteStorage.SCHEMA_VERSION}"
+                )
+
+    def _migrate(
+        self
+    ) -> None:
+        """
+        Imports every guild from the legacy JSON database, within the caller's
+        transaction
+        """
+        logging.info(f"Migrating database from {self.legacy_path}")
+        guild_to_info = json.load(open(self.legacy_path))
+        for guild_id, guild_info in guild_to_info.items():
+            discord_threads = guild_info.get('discord_threads', {})
+            guild_info['discord_threads'] = {
+                str(discord_id): discord_threads.get(str(discord_id), {
+                    'ed_id': ed_id, 'course': guild_info['course'],
+                    'message': discord_id
+                }) for ed_id, discord_id in guild_info['threads'].items()
+            }
+            self._put_guild(guild_id, guild_info)
+        logging.info(f"Migrated {len(guild_to_info)} guilds")
+
+    def load(
+        self
+    ) -> Dict[str, Dict]:
+        guild_to_info = {}
+        for guild_id, info in self.connection.execute(
+            "SELECT guild_id, info FROM guilds"
+        ):
+            guild_to_info[guild_id] = dict(json.loads(info), threads={},
+                                           discord_threads={})
+        for guild_id, ed_id, discord_id, course, message in (
+            self.connection.execute(
+                "SELECT guild_id, ed_id, discord_id, course, message " +
+                "FROM threads"
+            )
+        ):
+            guild_info = guild_to_info[guild_id]
+            guild_info['threads'][ed_id] = discord_id
+            guild_info['discord_threads'][str(discord_id)] = {
+                'ed_id': ed_id, 'course': course, 'message': message
+            }
+        return guild_to_info
+
+    def _info(
+        self,
+        guild_info: Dict
+    ) -> str:
+        """
+        Returns: The JSON stored in the guilds table for 'guild_info'
+        """
+        return json.dumps({key: value for key, value in guild_info.items()
+                           if key not in SqliteStorage.THREAD_KEYS})
+
+    def _put_thread(
+        self,
+        guild_id: str,
+        discord_id: Union[int, str],
+        thread_info: Dict
+    ) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO threads " +
+            "(guild_id, ed_id, discord_id, course, message) " +
+            "VALUES (?, ?, ?, ?, ?)",
+            (guild_id, thread_info['ed_id'], int(discord_id),
+             thread_info['course'], thread_info['message'])
+        )
+
+    def _put_guild(
+        self,
+        guild_id: str,
+        guild_info: Dict
+    ) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO guilds (guild_id, info) VALUES (?, ?)",
+            (guild_id, self._info(guild_info))
+        )
+        self.connection.execute("DELETE FROM threads WHERE guild_id = ?",
+                                (guild_id,))
+        for discord_id, thread_info in guild_info.get('discord_threads',
+                                                      {}).items():
+            self._put_thread(guild_id, discord_id, thread_info)
+
+    def put_guild(
+        self,
+        guild_id: str,
+        guild_info: Dict
+    ) -> None:
+        with self.connection:
+            self._put_guild(guild_id, guild_info)
+
+    def update_guild(
+        self,
+        guild_id: str,
+        guild_info: Dict
+    ) -> None:
+        with self.connection:
+            self.connection.execute(
+                "UPDATE guilds SET info = ? WHERE guild_id = ?",
+                (self._info(guild_info), guild_id)
+            )
+
+    def delete_guild(
+        self,
+        guild_id: str
+    ) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM guilds WHERE guild_id = ?",
+                                    (guild_id,))
+
+    def put_thread(
+        self,
+        guild_id: str,
+        discord_id: str,
+        thread_info: Dict
+    ) -> None:
+        with self.connection:
+            self._put_thread(guild_id, discord_id, thread_info)
+
+    def delete_thread(
+        self,
+        guild_id: str,
+        discord_id: str
+    ) -> None:
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM threads WHERE guild_id = ? AND discord_id = ?",
+                (guild_id, int(discord_id))
+            )
+
+    def save(
+        self,
+        guild_to_info: Dict[str, Dict]
+    ) -> None:
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM guilds WHERE guild_id NOT IN " +
+                f"({', '.join('?' * len(guild_to_info))})",
+                list(guild_to_info)
+            )
+            for guild_id, guild_info in guild_to_info.items():
+                self._put_guild(guild_id, guild_info)
+
+    def close(
+        self
+    ) -> None:
+        self.connection.close()
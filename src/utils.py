@@ -1,9 +1,8 @@
 import discord
 import asyncio
-import csv
-import functools
+import inspect
 from typing import (
-    List, Callable, Tuple, Any, Dict, Optional, Set
+    List, Callable, Tuple, Any, Dict, Optional, Set, Awaitable
 )
 from src.exceptions import (
     TimeoutError, InvalidResponse
@@ -11,9 +10,7 @@ from src.exceptions import (
 from src.constants import (
     GREEN_CHECK, RED_X, EMPTY_SQUARE, FULL_SQUARE, BAR_SIZE
 )
-from src.html_constants import (
-    HTML_ROW, HTML_HREF, HTML_TABLE, HTML_HEADER, HTML_STYLE
-)
+from src.discord_scheduler import DiscordScheduler
 
 
 def correct_user_check(
@@ -60,34 +57,40 @@ def reaction_check(
 async def send_message(
     channel: Any,
     message: Any,
-    files: Optional[List[Any]] = None
+    files: Optional[List[Any]] = None,
+    priority: Optional[int] = DiscordScheduler.INTERACTIVE
 ) -> None:
     """
-    Sends the 'message' to 'channel' using embed format
+    Sends the 'message' to 'channel' using embed format. The send is queued
+    behind other calls to the same channel by DiscordScheduler, replies to
+    users should keep the default INTERACTIVE 'priority'
     """
-    return (await channel.send(
+    return (await DiscordScheduler.run(str(channel.id), lambda: channel.send(
         embed=(message if isinstance(message, discord.Embed) else
                discord.Embed(description=message)),
         files=files
-    ))
+    ), priority))
 
 
 async def repeat_request(
     bot, auth_check: Callable[[str], bool],
-    valid_check: Callable[[str], bool],
+    valid_check: Callable[[str], Any],
     timeout: int,
     send_invalid_message: Callable[[str], None]
 ) -> Tuple[str, Any]:
     """
     Repeats the same request multiple times using 'bot' until a valid response
     is achieved determined by 'check' or the 'timeout' time is reached.
-    'send_message' should be a functions preloaded with the appropriate error
-    message to send on a bad response
+    'valid_check' may be a coroutine function, so checks that talk to Ed
+    don't block the event loop. 'send_message' should be a functions
+    preloaded with the appropriate error message to send on a bad response
     """
     try:
         result = (await bot.wait_for('message', check=auth_check,
                                      timeout=timeout)).content
         parsed_result = valid_check(result)
+        if inspect.isawaitable(parsed_result):
+            parsed_result = await parsed_result
         return result, parsed_result
     except asyncio.TimeoutError:
         raise TimeoutError
@@ -142,48 +145,6 @@ def invert_csv(
     return id_to_ta
 
 
-def write_csv(
-    file_path: str,
-    header: List[str],
-    data: List[str]
-) -> None:
-    """
-    Writes the information provided via 'data' with the given 'header' to the
-    .csv file located at 'file_path'
-    """
-    with open(file_path, 'w') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(header)
-        csvwriter.writerows(data)
-
-
-def convert_csv_to_html(
-    csv_file_path: str,
-    html_file_path: str
-) -> None:
-    """
-    Converts the given csv consistency file to an html one formatted
-    appropriately for an Ed post
-    """
-    with open(csv_file_path, newline='\n') as csv_file:
-        rows = []
-        one = False
-        last_ta = ""
-        for row in csv.DictReader(csv_file):
-            if last_ta != "" and row['TA'] != last_ta:
-                one = not one
-
-            last_ta = row['TA']
-            rows.append(HTML_ROW.format(row['TA'],
-                        HTML_HREF.format(row['Link']), row['Issue'],
-                        "one" if one else "two"))
-
-        output = HTML_TABLE % (HTML_HEADER.format('TA', 'Link', 'Issue'),
-                               "".join(rows))
-        with open(html_file_path, 'w') as output_file:
-            output_file.write(HTML_STYLE + output)
-
-
 def progress_bar(
     current: int,
     total: int
@@ -196,9 +157,37 @@ def progress_bar(
     return (FULL_SQUARE * (empty)) + (EMPTY_SQUARE * (BAR_SIZE - empty))
 
 
-# TODO: Look more into this
-def to_thread(func):
-    @functools.wraps(func)
-    async def wrapper(*args, **kwargs):
-        return await asyncio.to_thread(func, *args, **kwargs)
-    return wrapper
+async def bounded_map(
+    func: Callable[[Any], Awaitable[Any]],
+    items: List[Any],
+    limit: int,
+    on_complete: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> List[Any]:
+    """
+    Awaits 'func' on every element of 'items', keeping at most 'limit' calls
+    in flight at once. 'on_complete' is awaited with (completed, total) after
+    each call finishes. Results are returned in the same order as 'items'
+    regardless of completion order
+    """
+    results = [None] * len(items)
+    indices = iter(range(len(items)))
+    completed = 0
+
+    async def worker():
+        nonlocal completed
+        # Workers share the index iterator, so each item is taken exactly once
+        for i in indices:
+            results[i] = await func(items[i])
+            completed += 1
+            if on_complete is not None:
+                await on_complete(completed, len(items))
+
+    workers = [asyncio.ensure_future(worker())
+               for _ in range(max(1, min(limit, len(items))))]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        raise
+    return results
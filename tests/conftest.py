@@ -0,0 +1,10 @@
+import logging
+import os
+import tempfile
+
+# Every src module calls logging.basicConfig with the bot's log file on
+# import, which does nothing once logging is configured. Configure it here
+# first so test runs never write to the tracked store/logging/base.log
+logging.basicConfig(filename=os.path.join(tempfile.gettempdir(),
+                                          'gr-bot-tests.log'),
+                    encoding='utf-8', level=logging.INFO)
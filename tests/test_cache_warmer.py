@@ -0,0 +1,69 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+from src.async_ed_helper import AsyncEdHelper
+from src.assignment_context import AssignmentContext
+from src.cache_warmer import CacheWarmer
+
+
+def _due_in(seconds):
+    due_at = (datetime.datetime.now(datetime.timezone.utc) +
+              datetime.timedelta(seconds=seconds))
+    return due_at.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def test_tick(monkeypatch):
+    """
+    Tests that only lessons due within the lead, or closed within it, are
+    warmed, once per due date each, and that every student of their graded
+    slides is fetched
+    """
+    lessons = [{'id': 1, 'due_at': _due_in(30 * 60)},
+               {'id': 2, 'due_at': _due_in(3 * 24 * 60 * 60)},
+               {'id': 3, 'due_at': _due_in(-30 * 60)},
+               {'id': 4, 'due_at': None},
+               {'id': 5, 'due_at': _due_in(-5 * 60)},
+               {'id': 6, 'due_at': _due_in(-2 * 60 * 60)}]
+    warmed, warmed_lessons = [], []
+
+    async def get_lessons(course):
+        return lessons
+
+    async def get_lesson(lesson_id):
+        return {'slides': [{'id': 10, 'type': 'quiz'},
+                           {'id': 11, 'type': 'document'}]}
+
+    async def get_attempt_results(lesson_id):
+        warmed_lessons.append(lesson_id)
+        return [{'user_id': i} for i in range(3)]
+
+    async def get_attempt_user(attempt, context):
+        warmed.append((context.slide_id, attempt['user_id']))
+
+    async def create(ed_helper, url):
+        return SimpleNamespace(slide_id=url.rsplit('=', 1)[1])
+
+    helper = SimpleNamespace(
+        get_lessons=get_lessons, get_lesson=get_lesson,
+        get_attempt_results=get_attempt_results,
+        get_attempt_user=get_attempt_user
+    )
+    monkeypatch.setattr(AsyncEdHelper, 'for_token', lambda token: helper)
+    monkeypatch.setattr(AssignmentContext, 'create', create)
+    database = SimpleNamespace(guild_ids=lambda: ["a", "b"],
+                               get_course=lambda guild_id: 5,
+                               get_token=lambda guild_id: "token")
+    warmer = CacheWarmer(spacing=0)
+
+    async def run():
+        await warmer.tick(database)
+        await warmer.task
+        await warmer.tick(database)
+        assert warmer.task.done()
+
+    asyncio.run(run())
+    assert warmed_lessons == [1, 3]
+    assert warmed == [("10", 0), ("10", 1), ("10", 2)] * 2
+    assert list(warmer.warmed) == [("5", "1")]
+    assert list(warmer.closed) == [("5", "3")]
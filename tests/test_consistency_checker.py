@@ -0,0 +1,143 @@
+import asyncio
+import datetime
+import os
+import pytest
+from types import SimpleNamespace
+
+from src.consistency_checker import ConsistencyChecker
+from src.fingerprints import FingerprintStore
+from src.checkpoint import Checkpoint
+
+CONTEXT = SimpleNamespace(
+    ids=[1, 2, 3], attempt_slide=False, challenge_id=4, num_criteria=1,
+    due_at=datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+)
+
+
+def test_partial_results():
+    """
+    Tests that each TA's results are reported as soon as their students are
+    checked, before students of the next TA, and match the final report
+    """
+    users = [{'id': i, 'tutorial': "AA", 'course_role': "student"}
+             for i in range(6)]
+    spreadsheet = {"0": "b", "1": "a", "2": "b", "3": "a", "4": "c",
+                   "5": "a"}
+    events = []
+
+    async def get_challenge_users(challenge_id):
+        return users
+
+    async def get_challenge_submissions(user_id, challenge_id):
+        events.append(user_id)
+        # Only even students are missing a grade, odd ones submitted late
+        year = 2020 if user_id % 2 == 0 else 2031
+        return [{'id': user_id, 'feedback': None,
+                 'created_at': f"{year}-01-01T00:00:00.0+00:00"}]
+
+    async def partial(key, issues):
+        events.append((key, [issue for _, issue in issues]))
+
+    ed_helper = SimpleNamespace(
+        get_challenge_users=get_challenge_users,
+        get_challenge_submissions=get_challenge_submissions
+    )
+    fixes, not_present = asyncio.run(ConsistencyChecker._find_fixes(
+        ed_helper, CONTEXT, spreadsheet=spreadsheet, concurrency=1,
+        partial=partial
+    ))
+    issue = "Missing grade / incorrect submission graded or marked final"
+    assert events == [1, 3, 5, ("a", []), 0, 2, ("b", [issue, issue]),
+                      4, ("c", [issue])]
+    assert list(fixes) == ["b", "c"] and len(fixes["b"]) == 2
+    assert not_present == []
+
+
+def test_incremental(tmp_path):
+    """
+    Tests that a rerun only refetches students whose summary changed or who
+    had an issue last time, and that their earlier results are reused
+    """
+    users = [{'id': i, 'tutorial': "AA", 'course_role': "student",
+              'feedback_status': "complete"} for i in range(4)]
+    fetched = []
+
+    async def get_challenge_users(challenge_id):
+        return users
+
+    async def get_challenge_submissions(user_id, challenge_id):
+        fetched.append(user_id)
+        # Student 0 is missing a grade, everyone else submitted late
+        year = 2020 if user_id == 0 else 2031
+        return [{'id': user_id, 'feedback': None,
+                 'created_at': f"{year}-01-01T00:00:00.0+00:00"}]
+
+    ed_helper = SimpleNamespace(
+        get_challenge_users=get_challenge_users,
+        get_challenge_submissions=get_challenge_submissions
+    )
+
+    def check():
+        fingerprints = FingerprintStore("key", str(tmp_path)).load()
+        fixes, _ = asyncio.run(ConsistencyChecker._find_fixes(
+            ed_helper, CONTEXT, fingerprints=fingerprints
+        ))
+        fingerprints.save()
+        return fixes, fingerprints
+
+    first, _ = check()
+    assert sorted(fetched) == [0, 1, 2, 3]
+
+    fetched.clear()
+    users[2]['feedback_status'] = "incomplete"
+    second, fingerprints = check()
+    assert sorted(fetched) == [0, 2]
+    assert fingerprints.reused == 2
+    assert second == first and len(second["AA"]) == 1
+
+
+def test_checkpoint(tmp_path):
+    """
+    Tests that a check interrupted partway resumes from its checkpoint
+    without refetching finished students, and that the checkpoint is
+    cleared once the check finishes
+    """
+    users = [{'id': i, 'tutorial': "AA", 'course_role': "student"}
+             for i in range(4)]
+    fetched, failing = [], {3}
+
+    async def get_challenge_users(challenge_id):
+        return users
+
+    async def get_challenge_submissions(user_id, challenge_id):
+        fetched.append(user_id)
+        if user_id in failing:
+            raise ConnectionError("Ed is down")
+        year = 2020 if user_id == 0 else 2031
+        return [{'id': user_id, 'feedback': None,
+                 'created_at': f"{year}-01-01T00:00:00.0+00:00"}]
+
+    ed_helper = SimpleNamespace(
+        get_challenge_users=get_challenge_users,
+        get_challenge_submissions=get_challenge_submissions
+    )
+
+    def check():
+        checkpoint = Checkpoint("key", str(tmp_path), interval=1).load()
+        return asyncio.run(ConsistencyChecker.check_consistency(
+            ed_helper, CONTEXT, str(tmp_path / "report"), concurrency=1,
+            incremental=False, checkpoint=checkpoint
+        )), checkpoint
+
+    with pytest.raises(ConnectionError):
+        check()
+    assert fetched == [0, 1, 2, 3]
+    assert os.path.exists(tmp_path / "key.json")
+
+    fetched.clear()
+    failing.clear()
+    (fixes, _, total), checkpoint = check()
+    assert fetched == [3]
+    assert checkpoint.resumed == 3
+    assert total == 1 and len(fixes["AA"]) == 1
+    assert not os.path.exists(tmp_path / "key.json")
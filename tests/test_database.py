@@ -1,78 +1,109 @@
 import pytest
 import json
+import os
 from copy import deepcopy
 
 from typing import (
     Union, Dict
 )
 from tests.testing_constants import (
-    TESTING_DATABASE, STANDARD_GUILD, STANDARD_GUILD_ID, STANDARD_GUILD_SAVED
+    STANDARD_GUILD, STANDARD_GUILD_ID, STANDARD_GUILD_SAVED
 )
 from src.database import (
     Database
 )
 
 
+def _write_db(
+    db_path: str,
+    guild_to_info: Dict
+) -> None:
+    with open(db_path, 'w') as db_file:
+        db_file.write(json.dumps(guild_to_info))
+    if os.path.exists(db_path + '.journal'):
+        os.remove(db_path + '.journal')
+
+
 @pytest.fixture
-def reset_db():
-    with open(TESTING_DATABASE, 'w') as db_file:
-        db_file.write(json.dumps({}))
+def db_path(tmp_path):
+    return str(tmp_path / 'testing-db.json')
+
+
+@pytest.fixture
+def open_db(db_path):
+    """
+    Opens databases on 'db_path', closing them (and their writer threads)
+    once the test is done
+    """
+    opened = []
+
+    def open_db():
+        opened.append(Database(db_path))
+        return opened[-1]
+    yield open_db
+    for db in opened:
+        db.close()
+
+
+@pytest.fixture
+def reset_db(db_path):
+    _write_db(db_path, {})
 
 
 @pytest.fixture
-def simple_db():
-    with open(TESTING_DATABASE, 'w') as db_file:
-        db_file.write(json.dumps(STANDARD_GUILD_SAVED))
+def simple_db(db_path):
+    _write_db(db_path, STANDARD_GUILD_SAVED)
 
 
 @pytest.fixture
-def simple_db_with_thread():
-    with open(TESTING_DATABASE, 'w') as db_file:
+def simple_db_with_thread(db_path):
+    with open(db_path, 'w') as db_file:
         db_file.write(json.dumps)
 
 
-def test_create(reset_db):
+def test_create(reset_db, open_db):
     """
     Tests that the database is able to be created successfully
     """
-    _ = Database(TESTING_DATABASE)
+    _ = open_db()
     assert True
 
 
-def test_register_save(reset_db):
+def test_register_save(reset_db, db_path, open_db):
     """
     Tests that the database is able to register / save
     """
-    db = Database(TESTING_DATABASE)
+    db = open_db()
     db.register(STANDARD_GUILD_ID, STANDARD_GUILD)
-    with open(TESTING_DATABASE, 'r') as db_file:
+    db.save()
+    with open(db_path, 'r') as db_file:
         assert db_file.readline() == json.dumps(STANDARD_GUILD_SAVED)
 
 
-def test_load(simple_db):
+def test_load(simple_db, db_path, open_db):
     """
     Tests that the database is able to load from a file
     """
-    db = Database(TESTING_DATABASE)
-    with open(TESTING_DATABASE, 'w') as db_file:
+    db = open_db()
+    with open(db_path, 'w') as db_file:
         db_file.write(json.dumps({}))
     db.save()
-    with open(TESTING_DATABASE, 'r') as db_file:
+    with open(db_path, 'r') as db_file:
         assert db_file.readline() == json.dumps(STANDARD_GUILD_SAVED)
 
 
-def test_contains(simple_db):
+def test_contains(simple_db, open_db):
     """
     Tests the database contains method
     """
-    assert STANDARD_GUILD_ID in Database(TESTING_DATABASE)
+    assert STANDARD_GUILD_ID in open_db()
 
 
-def test_guild_ids(simple_db):
+def test_guild_ids(simple_db, open_db):
     """
     Tests the database guild_ids method
     """
-    db = Database(TESTING_DATABASE)
+    db = open_db()
     assert db.guild_ids() == {str(STANDARD_GUILD_ID)}
 
 
@@ -85,69 +116,70 @@ def _test_get_methods(
     return getattr(db, method_name)(guild_id) == STANDARD_GUILD[field]
 
 
-def test_get_admin(simple_db):
+def test_get_admin(simple_db, open_db):
     """
     Tests the database get_admin method
     """
-    assert _test_get_methods(Database(TESTING_DATABASE), 'get_admin',
+    assert _test_get_methods(open_db(), 'get_admin',
                              STANDARD_GUILD_ID, 'admin')
 
 
-def test_get_channel(simple_db):
+def test_get_channel(simple_db, open_db):
     """
     Tests the database get_channel method
     """
-    assert _test_get_methods(Database(TESTING_DATABASE), 'get_channel',
+    assert _test_get_methods(open_db(), 'get_channel',
                              STANDARD_GUILD_ID, 'channel')
 
 
-def test_get_token(simple_db):
+def test_get_token(simple_db, open_db):
     """
     Tests the database get_token method
     """
-    assert _test_get_methods(Database(TESTING_DATABASE), 'get_token',
+    assert _test_get_methods(open_db(), 'get_token',
                              STANDARD_GUILD_ID, 'token')
 
 
-def test_get_course(simple_db):
+def test_get_course(simple_db, open_db):
     """
     Tests the database get_course method
     """
-    assert _test_get_methods(Database(TESTING_DATABASE), 'get_course',
+    assert _test_get_methods(open_db(), 'get_course',
                              STANDARD_GUILD_ID, 'course')
 
 
-def test_get_role(simple_db):
+def test_get_role(simple_db, open_db):
     """
     Tests the database get_channel method
     """
-    assert _test_get_methods(Database(TESTING_DATABASE), 'get_role',
+    assert _test_get_methods(open_db(), 'get_role',
                              STANDARD_GUILD_ID, 'role')
 
 
-def test_get_approval(simple_db):
+def test_get_approval(simple_db, open_db):
     """
     Tests the database get_approval method
     """
-    assert _test_get_methods(Database(TESTING_DATABASE), 'get_approval',
+    assert _test_get_methods(open_db(), 'get_approval',
                              STANDARD_GUILD_ID, 'approval')
 
 
-def test_get_threads(simple_db):
+def test_get_threads(simple_db, open_db):
     """
     Tests the database get_channel method
     """
-    assert _test_get_methods(Database(TESTING_DATABASE), 'get_threads',
+    assert _test_get_methods(open_db(), 'get_threads',
                              STANDARD_GUILD_ID, 'threads')
 
 
-def test_delete(simple_db):
+def test_delete(simple_db, db_path, open_db):
     """
     Tests that the database is able to remove guild info
     """
-    db = Database(TESTING_DATABASE)
+    db = open_db()
     db.delete(STANDARD_GUILD_ID)
-    with open(TESTING_DATABASE, 'r') as db_file:
+    db.save()
+    with open(db_path, 'r') as db_file:
         assert db_file.readline() == json.dumps({})
 
 
@@ -160,28 +192,128 @@ def _add_thread(
     db.add_thread(guild_id, ed_id, discord_id)
     expected = deepcopy(STANDARD_GUILD_SAVED)
     expected[STANDARD_GUILD_ID]['threads']["0"] = 0
+    expected[STANDARD_GUILD_ID]['discord_threads']["0"] = {
+        'ed_id': "0", 'course': STANDARD_GUILD['course'], 'message': 0
+    }
     return expected
 
 
-def test_add_thread(simple_db):
+def test_add_thread(simple_db, db_path, open_db):
     """
     Tests that the database can add a thread to a guild
     """
-    db = Database(TESTING_DATABASE)
+    db = open_db()
     expected = _add_thread(db, STANDARD_GUILD_ID, "0", 0)
-    with open(TESTING_DATABASE, 'r') as db_file:
+    db.save()
+    with open(db_path, 'r') as db_file:
         assert db_file.readline() == json.dumps(expected)
 
 
-def test_remove_thread(simple_db):
+def test_remove_thread(simple_db, db_path, open_db):
     """
     Tests that the database can remove a thread from a guild
     """
-    db = Database(TESTING_DATABASE)
+    db = open_db()
     expected = _add_thread(db, STANDARD_GUILD_ID, "0", 0)
-    with open(TESTING_DATABASE, 'r') as db_file:
+    db.save()
+    with open(db_path, 'r') as db_file:
         assert db_file.readline() == json.dumps(expected)
 
     db.remove_thread(STANDARD_GUILD_ID, "0")
-    with open(TESTING_DATABASE, 'r') as db_file:
+    db.save()
+    with open(db_path, 'r') as db_file:
         assert db_file.readline() == json.dumps(STANDARD_GUILD_SAVED)
+
+
+def test_cursor(simple_db, open_db):
+    """
+    Tests that the database stores the thread sync cursor
+    """
+    db = open_db()
+    assert db.get_cursor(STANDARD_GUILD_ID) is None
+
+    cursor = {'id': 5, 'created_at': "now"}
+    db.set_cursor(STANDARD_GUILD_ID, cursor)
+    db.flush()
+    assert open_db().get_cursor(STANDARD_GUILD_ID) == cursor
+
+
+def test_poll_interval(simple_db, open_db):
+    """
+    Tests that the database stores a pinned polling interval
+    """
+    db = open_db()
+    assert db.get_poll_interval(STANDARD_GUILD_ID) is None
+
+    db.set_poll_interval(STANDARD_GUILD_ID, 120)
+    db.flush()
+    assert open_db().get_poll_interval(
+        STANDARD_GUILD_ID) == 120
+
+
+def test_discord_thread_index(simple_db, db_path, open_db):
+    """
+    Tests that threads can be looked up by their discord ID, and that
+    databases saved before the index existed are indexed on load
+    """
+    db = open_db()
+    db.add_thread(STANDARD_GUILD_ID, 5, 10, "course", 11)
+    assert db.get_discord_thread(STANDARD_GUILD_ID, "10") == {
+        'ed_id': "5", 'course': "course", 'message': 11
+    }
+    db.remove_thread(STANDARD_GUILD_ID, 5)
+    assert db.get_discord_thread(STANDARD_GUILD_ID, 10) is None
+
+    legacy = deepcopy(STANDARD_GUILD_SAVED)
+    del legacy[STANDARD_GUILD_ID]['discord_threads']
+    legacy[STANDARD_GUILD_ID]['threads']["7"] = 8
+    db.close()
+    _write_db(db_path, legacy)
+    assert open_db().get_discord_thread(
+        STANDARD_GUILD_ID, 8
+    ) == {'ed_id': "7", 'course': STANDARD_GUILD['course'], 'message': 8}
+
+
+def test_journal(simple_db, db_path, open_db):
+    """
+    Tests that unsaved changes are journaled, replayed on load, ignoring a
+    partial last record, and compacted into the database file
+    """
+    db = open_db()
+    db.storage.compact_records = 3
+    expected = _add_thread(db, STANDARD_GUILD_ID, "0", 0)
+    db.set_cursor(STANDARD_GUILD_ID, {'id': 1, 'created_at': "now"})
+    db.flush()
+    with open(db_path + '.journal', 'a') as journal:
+        journal.write('{"op": "delete_gu')
+    reloaded = open_db()
+    assert reloaded.get_threads(STANDARD_GUILD_ID) == {"0": 0}
+    assert reloaded.get_cursor(STANDARD_GUILD_ID)['id'] == 1
+
+    _write_db(db_path, STANDARD_GUILD_SAVED)
+    db = open_db()
+    db.storage.compact_records = 1
+    _add_thread(db, STANDARD_GUILD_ID, "0", 0)
+    db.close()
+    assert os.path.getsize(db_path + '.journal') == 0
+    with open(db_path, 'r') as db_file:
+        assert db_file.readline() == json.dumps(expected)
+
+
+def test_journal_after_torn_record(simple_db, db_path, open_db):
+    """
+    Tests that a partial journal record is dropped on load, so records
+    journaled after it are replayed too
+    """
+    db = open_db()
+    db.add_thread(STANDARD_GUILD_ID, "1", 10)
+    db.close()
+    with open(db_path + '.journal', 'a') as journal:
+        journal.write('{"op": "put_thr')
+
+    db = open_db()
+    db.add_thread(STANDARD_GUILD_ID, "2", 20)
+    db.close()
+    reloaded = open_db()
+    assert reloaded.get_threads(STANDARD_GUILD_ID) == {"1": 10, "2": 20}
+    reloaded.close()
@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.discord_helper import DiscordHelper
+from src.async_ed_helper import AsyncEdHelper
+from src.metrics import Metrics
+from src.exceptions import InvalidEdToken
+
+
+def test_refresh_isolated(monkeypatch):
+    """
+    Tests that courses are refreshed concurrently and that one course failing
+    or timing out doesn't stop the others from refreshing
+    """
+    refreshed = []
+
+    async def refresh_course(course, guild_ids, database, bot, scheduler):
+        if course == "fail":
+            raise ValueError("fail")
+        if course == "slow":
+            await asyncio.sleep(10)
+        await asyncio.sleep(0.05)
+        refreshed.append(course)
+        return {guild_id: None for guild_id in guild_ids}
+
+    monkeypatch.setattr(DiscordHelper, 'refresh_course', refresh_course)
+    database = SimpleNamespace(
+        guild_ids=lambda: ["fail", "slow", "a", "b", "c"],
+        get_course=lambda guild_id: guild_id
+    )
+
+    Metrics.reset()
+    results = asyncio.run(DiscordHelper.refresh_all_threads(
+        database, None, concurrency=5, timeout=0.2
+    ))
+    assert sorted(refreshed) == ["a", "b", "c"]
+    assert isinstance(results["fail"], ValueError)
+    assert isinstance(results["slow"], asyncio.TimeoutError)
+    assert results["a"] is None
+
+    snapshot = Metrics.snapshot()
+    assert snapshot['counters'] == {'refresh_failures': 1,
+                                    'refresh_timeouts': 1}
+    assert snapshot['timings']['refresh_cycle_seconds']['last'] < 1
+
+
+def test_refresh_course_fan_out(monkeypatch):
+    """
+    Tests that guilds sharing a course poll Ed once, paging back to the
+    oldest cursor, and that each guild only gets threads newer than its own
+    cursor
+    """
+    polls, posted = [], {}
+    threads = [{'id': i, 'created_at': str(i), 'is_answered': False}
+               for i in (30, 20, 10)]
+
+    async def get_new_threads(course, cursor, filters):
+        polls.append(cursor)
+        return threads, {'id': 30, 'created_at': "30"}
+
+    async def get_thread_states(thread_ids):
+        return {}
+
+    async def post_new_threads(bot, database, guild_id, ed_threads):
+        posted[guild_id] = [thread['id'] for thread in ed_threads]
+
+    helper = SimpleNamespace(get_new_threads=get_new_threads,
+                             get_thread_states=get_thread_states)
+    monkeypatch.setattr(AsyncEdHelper, 'for_token', lambda token: helper)
+    monkeypatch.setattr(DiscordHelper, '_post_new_threads', post_new_threads)
+
+    cursors = {"a": {'id': 20, 'created_at': "20"},
+               "b": {'id': 10, 'created_at': "10"}}
+    database = SimpleNamespace(
+        get_cursor=cursors.get,
+        set_cursor=cursors.__setitem__,
+        get_token=lambda guild_id: "token",
+        get_threads=lambda guild_id: {}
+    )
+
+    results = asyncio.run(DiscordHelper.refresh_course(
+        "course", ["a", "b"], database, None
+    ))
+    assert results == {"a": None, "b": None}
+    assert polls == [{'id': 10, 'created_at': "10"}]
+    assert posted == {"a": [30], "b": [30, 20]}
+    assert cursors["a"]['id'] == cursors["b"]['id'] == 30
+
+
+def test_course_deadlines_rejected_token():
+    """
+    Tests that a rejected token only drops the deadline hint instead of
+    failing the course's refresh
+    """
+    async def get_lessons(course):
+        raise InvalidEdToken("Ed token was rejected")
+
+    ed_helper = SimpleNamespace(get_lessons=get_lessons)
+    assert asyncio.run(DiscordHelper._course_deadlines(ed_helper, 1)) is None
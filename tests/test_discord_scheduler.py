@@ -0,0 +1,64 @@
+import asyncio
+import discord
+from types import SimpleNamespace
+
+from src.discord_scheduler import DiscordScheduler
+from src.metrics import Metrics
+
+
+def test_interactive_first():
+    """
+    Tests that queued interactive calls run before background ones in the
+    same bucket, and that buckets don't wait on each other
+    """
+    order = []
+
+    def call(name, seconds=0):
+        async def operation():
+            await asyncio.sleep(seconds)
+            order.append(name)
+            return name
+        return operation
+
+    async def run():
+        blocker = asyncio.create_task(DiscordScheduler.run(
+            "a", call("blocker", 0.05), DiscordScheduler.BACKGROUND
+        ))
+        await asyncio.sleep(0)
+        queued = [
+            asyncio.create_task(DiscordScheduler.run(
+                "a", call("import"), DiscordScheduler.BACKGROUND
+            )),
+            asyncio.create_task(DiscordScheduler.run("a", call("reply"))),
+            asyncio.create_task(DiscordScheduler.run("b", call("other")))
+        ]
+        await asyncio.sleep(0)
+        assert DiscordScheduler.depth() == {'interactive': 2,
+                                            'background': 1, 'buckets': 2}
+        return await asyncio.gather(blocker, *queued)
+
+    results = asyncio.run(run())
+    assert results == ["blocker", "import", "reply", "other"]
+    assert order == ["other", "blocker", "reply", "import"]
+    assert DiscordScheduler.depth()['buckets'] == 0
+
+
+def test_rate_limited_retry():
+    """
+    Tests that a call Discord rate limits anyway pauses its bucket for as
+    long as the rate limit headers say and is retried
+    """
+    attempts = []
+    response = SimpleNamespace(status=429, reason="Too Many Requests",
+                               headers={'X-RateLimit-Reset-After': '0.1'})
+
+    async def operation():
+        attempts.append(asyncio.get_running_loop().time())
+        if len(attempts) == 1:
+            raise discord.HTTPException(response, "rate limited")
+        return "sent"
+
+    Metrics.reset()
+    assert asyncio.run(DiscordScheduler.run("c", operation)) == "sent"
+    assert attempts[1] - attempts[0] >= 0.09
+    assert Metrics.snapshot()['counters']['discord_rate_limited'] == 1
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+from src import async_ed_helper
+from src.async_ed_helper import AsyncEdHelper
+from src.disk_cache import DiskCache
+from src.response_cache import ResponseCache
+
+
+def test_put_get(tmp_path):
+    """
+    Tests that stored responses survive reopening the store, along with
+    their validators, and that tokens aren't written to disk
+    """
+    file_path = str(tmp_path / "cache.db")
+    cache = DiskCache(file_path)
+    key = ResponseCache.key("secret-token", "url", {'a': 1})
+    cache.put(key, 'slide', {'value': 0}, {'ETag': '"v1"'})
+    cache.close()
+
+    value, headers, stored = DiskCache(file_path).get(key)
+    assert value == {'value': 0}
+    assert headers == {'ETag': '"v1"'}
+    assert stored > 0
+    assert DiskCache(file_path).get(ResponseCache.key("other", "url",
+                                                      {'a': 1})) is None
+    assert b"secret-token" not in open(file_path, 'rb').read()
+
+
+def test_lru_eviction(tmp_path):
+    """
+    Tests that the least recently used responses are evicted once the store
+    is over its size
+    """
+    cache = DiskCache(str(tmp_path / "cache.db"), max_bytes=30)
+    for name in ["a", "b"]:
+        cache.put(("token", name, "{}"), 'mark', "x" * 10)
+    cache.get(("token", "a", "{}"))
+    cache.put(("token", "c", "{}"), 'mark', "x" * 10)
+    assert cache.get(("token", "b", "{}")) is None
+    assert cache.get(("token", "a", "{}")) is not None
+    assert cache.get(("token", "c", "{}")) is not None
+    assert cache.stats()['bytes'] <= 30
+
+
+def test_invalidate(tmp_path):
+    """
+    Tests that invalidating a token only drops its responses, and that
+    discarding drops a single response
+    """
+    cache = DiskCache(str(tmp_path / "cache.db"))
+    cache.put(ResponseCache.key("a", "url"), 'mark', 0)
+    cache.put(ResponseCache.key("b", "url"), 'mark', 1)
+    cache.invalidate("a")
+    assert cache.get(ResponseCache.key("a", "url")) is None
+    assert cache.get(ResponseCache.key("b", "url"))[0] == 1
+    cache.discard(ResponseCache.key("b", "url"))
+    assert cache.get(ResponseCache.key("b", "url")) is None
+
+
+def test_disabled():
+    """
+    Tests that a store without a file never stores anything
+    """
+    cache = DiskCache(None)
+    cache.put(("token", "url", "{}"), 'mark', 0)
+    assert cache.get(("token", "url", "{}")) is None
+
+
+def test_ed_helper_store(tmp_path, monkeypatch):
+    """
+    Tests that AsyncEdHelper reuses stored responses across helpers while
+    they're fresh, and reuses responses fetched after 'prefer_cache_after'
+    however old they are
+    """
+    monkeypatch.setattr(AsyncEdHelper, 'disk_cache',
+                        DiskCache(str(tmp_path / "cache.db")))
+    monkeypatch.setattr(AsyncEdHelper, '_session', lambda self: None)
+    requests = []
+
+    async def get_conditional(session, url, retries, limiter, payload=None,
+                              headers=None):
+        requests.append(url)
+        return True, {}, {'url': url}
+
+    monkeypatch.setattr(async_ed_helper, 'get_conditional', get_conditional)
+
+    async def get(url, prefer_cache_after=None):
+        return await AsyncEdHelper("token")._get(
+            url, endpoint='attempts', prefer_cache_after=prefer_cache_after
+        )
+
+    assert asyncio.run(get("a")) == {'url': "a"}
+    assert asyncio.run(get("a")) == {'url': "a"}
+    assert requests == ["a"]
+
+    # Pretend it was fetched long ago
+    monkeypatch.setattr(time, 'time', lambda: 10 ** 10)
+    asyncio.run(get("a", prefer_cache_after=0))
+    assert requests == ["a"]
+    asyncio.run(get("a"))
+    assert requests == ["a", "a"]
@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.job_delivery import JobDelivery
+from src.job_executor import JobExecutor
+from src.job_queue import JobQueue
+
+DATABASE = SimpleNamespace(get_token=lambda guild_id: "token")
+
+
+async def consistency_job(token, url, file_name, template=False,
+                          spreadsheet=None, checkpoint_key=None, resume=True,
+                          progress=None, partial=None):
+    for extension in [".csv", ".html"]:
+        with open(file_name + extension, 'w') as report:
+            report.write("report")
+    return "Slide", ({"TA": [("a", "b")]}, ["missing"], 1)
+
+
+def _fake_bot(sent):
+    async def send(**kwargs):
+        sent.append(kwargs)
+        return SimpleNamespace(channel=channel, **kwargs)
+    channel = SimpleNamespace(id=10, send=send)
+    return SimpleNamespace(get_channel=lambda channel_id: channel)
+
+
+def test_deliver_consistency(tmp_path):
+    """
+    Tests that a queued consistency job, with its args laid out like
+    gr-consistency queues them, posts its report and files once it finishes
+    """
+    sent = []
+    delivery = JobDelivery(_fake_bot(sent))
+    queue = JobQueue(JobExecutor('thread', workers=1), DATABASE,
+                     {'consistency': consistency_job}, delivery.deliver,
+                     str(tmp_path / 'jobs.json'))
+    file_path = str(tmp_path / 'report')
+    queue.submit(1, 10, 'consistency',
+                 ["link", file_path, False, {"1": "TA"}, "key", True], "key")
+
+    async def run():
+        queue.start()
+        while queue.jobs or not sent:
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert len(sent) == 1
+    assert [file.filename for file in sent[0]['files']] == ["report.csv",
+                                                            "report.html"]
+    assert sent[0]['embeds'][-1].description == (
+        "1 students not on the grading spreadsheet, refresh the roster\n" +
+        "1 students with consistency issues"
+    )
+
+
+def test_results_thread_reused():
+    """
+    Tests that partial results reuse the thread created for the job even if
+    the gateway hasn't cached it, and that it's forgotten once the job is
+    delivered
+    """
+    created, posted = [], []
+
+    async def send(**kwargs):
+        posted.append(kwargs)
+        return SimpleNamespace(channel=thread, **kwargs)
+    thread = SimpleNamespace(id=99, send=send)
+
+    async def create_thread(name):
+        created.append(name)
+        return thread
+    message = SimpleNamespace(create_thread=create_thread)
+    channel = SimpleNamespace(id=10, send=send,
+                              get_partial_message=lambda message_id: message)
+    bot = SimpleNamespace(get_channel=lambda channel_id: (
+        channel if channel_id == 10 else None
+    ))
+    delivery = JobDelivery(bot)
+    job = {'id': 1, 'kind': 'ungraded', 'channels': [10],
+           'messages': {"10": 99}}
+
+    async def run():
+        await delivery.deliver_partial(job, "TA", 2)
+        await delivery.deliver_partial(job, "Other TA", 3)
+        await delivery.deliver(job, None, RuntimeError("failed"))
+
+    asyncio.run(run())
+    assert created == ["Job #1 results"]
+    assert len(posted) == 3
+    assert delivery.threads == {}
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+from src.job_executor import JobExecutor
+
+
+async def count_job(total, progress=None):
+    for i in range(1, total + 1):
+        if progress is not None:
+            await progress(i, total)
+    return threading.current_thread().name
+
+
+async def sleep_job(seconds, progress=None):
+    await asyncio.sleep(seconds)
+
+
+def test_thread_job():
+    """
+    Tests that jobs run off the loop's thread and that their progress is
+    reported back on the loop's thread
+    """
+    executor = JobExecutor('thread', workers=2)
+    updates = []
+
+    async def progress(completed, total):
+        updates.append((completed, threading.current_thread().name))
+
+    async def run():
+        name = await executor.run(1, count_job, 3, progress=progress)
+        await asyncio.sleep(0.01)
+        return name
+
+    assert asyncio.run(run()) != threading.current_thread().name
+    assert updates == [(i, threading.current_thread().name)
+                       for i in range(1, 4)]
+    executor.shutdown()
+
+
+def test_process_job():
+    """
+    Tests that jobs can run in a process pool with progress sent back
+    through a queue
+    """
+    executor = JobExecutor('process', workers=1)
+    updates = []
+
+    async def progress(completed, total):
+        updates.append(completed)
+
+    asyncio.run(executor.run(1, count_job, 2, progress=progress))
+    assert updates == [1, 2]
+    executor.shutdown()
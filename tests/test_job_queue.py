@@ -0,0 +1,199 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+from src.exceptions import JobCancelled
+from src.job_executor import JobExecutor
+from src import job_queue as queue_module
+from src.job_queue import JobQueue
+
+DATABASE = SimpleNamespace(get_token=lambda guild_id: "token")
+
+
+async def echo_job(token, value, progress=None):
+    return value
+
+
+async def sleep_job(token, seconds, progress=None):
+    await asyncio.sleep(seconds)
+
+
+async def partial_job(token, keys, progress=None, partial=None):
+    for key in keys:
+        await partial(key, len(key))
+    return "done"
+
+
+@pytest.fixture
+def jobs_file(tmp_path):
+    return str(tmp_path / 'jobs.json')
+
+
+def make_queue(jobs_file, delivered, workers=1):
+    async def deliver(job, result, error):
+        delivered.append((job['id'], result, error))
+    return JobQueue(JobExecutor('thread', workers=workers), DATABASE,
+                    {'echo': echo_job, 'sleep': sleep_job}, deliver,
+                    jobs_file)
+
+
+async def wait_for_jobs(queue):
+    while queue.jobs:
+        await asyncio.sleep(0.01)
+
+
+def test_dedup(jobs_file):
+    """
+    Tests that identical jobs share one execution and deliver to every
+    channel that asked for them
+    """
+    queue = make_queue(jobs_file, [])
+    key = JobQueue.job_key(1, 'echo', "link", None)
+    job, created = queue.submit(1, 10, 'echo', ["a"], key)
+    same, created_again = queue.submit(1, 11, 'echo', ["a"], key)
+    assert created and not created_again
+    assert same is job and job['channels'] == [10, 11]
+    assert JobQueue.job_key(2, 'echo', "link", None) != key
+
+
+def test_round_robin(jobs_file):
+    """
+    Tests that jobs are started round-robin across guilds instead of in
+    submission order
+    """
+    delivered = []
+    queue = make_queue(jobs_file, delivered)
+    for guild_id, value in [(1, "a1"), (1, "a2"), (1, "a3"), (2, "b1")]:
+        queue.submit(guild_id, 0, 'echo', [value],
+                     JobQueue.job_key(guild_id, 'echo', value))
+
+    async def run():
+        queue.start()
+        await wait_for_jobs(queue)
+        await queue.stop()
+
+    asyncio.run(run())
+    assert [result for _, result, _ in delivered] == ["a1", "b1", "a2", "a3"]
+
+
+def test_dedup_skips_cancelling(jobs_file):
+    """
+    Tests that a new request isn't attached to an identical job that's being
+    cancelled
+    """
+    queue = make_queue(jobs_file, [])
+    job, _ = queue.submit(1, 10, 'echo', ["a"], "key")
+    job['status'] = 'cancelling'
+    fresh, created = queue.submit(1, 11, 'echo', ["a"], "key")
+    assert created and fresh is not job
+    assert job['channels'] == [10]
+
+
+def test_guild_limit(jobs_file):
+    """
+    Tests that a guild can only run 'guild_limit' jobs at once while other
+    guilds aren't held up, and that waiting jobs stay queued
+    """
+    async def deliver(job, result, error):
+        pass
+
+    queue = JobQueue(JobExecutor('thread', workers=3), DATABASE,
+                     {'sleep': sleep_job}, deliver, jobs_file, guild_limit=1)
+    for guild_id, key in [(1, "a"), (1, "b"), (2, "c")]:
+        queue.submit(guild_id, 0, 'sleep', [30], key)
+
+    async def run():
+        queue.start()
+        await asyncio.sleep(0.05)
+        statuses = [(job['guild'], job['status'])
+                    for job in queue.jobs.values()]
+        await queue.stop()
+        return statuses
+
+    assert asyncio.run(run()) == [("1", 'running'), ("1", 'queued'),
+                                  ("2", 'running')]
+
+
+def test_persistence(jobs_file):
+    """
+    Tests that queued jobs survive a restart and interrupted jobs are queued
+    again
+    """
+    queue = make_queue(jobs_file, [])
+    job, _ = queue.submit(1, 0, 'echo', ["a"], "key")
+    job['status'] = 'running'
+    queue.save()
+
+    reloaded = make_queue(jobs_file, [])
+    assert reloaded.jobs[job['id']]['status'] == 'queued'
+    assert reloaded.submit(1, 0, 'echo', ["b"], "other")[0]['id'] == 2
+
+
+def test_save_atomic(jobs_file, monkeypatch):
+    """
+    Tests that a save that fails partway through leaves the last saved queue
+    intact
+    """
+    queue = make_queue(jobs_file, [])
+    job, _ = queue.submit(1, 0, 'echo', ["a"], "key")
+
+    def crash(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(queue_module.json, 'dumps', crash)
+    with pytest.raises(OSError):
+        queue.submit(1, 0, 'echo', ["b"], "other")
+    monkeypatch.undo()
+    assert list(make_queue(jobs_file, []).jobs) == [job['id']]
+
+
+def test_cancel(jobs_file):
+    """
+    Tests that queued jobs are dropped and running jobs stop with
+    JobCancelled
+    """
+    delivered = []
+    queue = make_queue(jobs_file, delivered)
+    running, _ = queue.submit(1, 0, 'sleep', [30], "running")
+    queued, _ = queue.submit(1, 0, 'sleep', [30], "queued")
+
+    async def run():
+        queue.start()
+        await asyncio.sleep(0.05)
+        assert queue.cancel(1, queued['id'])
+        assert not queue.cancel(2, running['id'])
+        assert queue.cancel(1, running['id'])
+        await asyncio.wait_for(wait_for_jobs(queue), 5)
+        await queue.stop()
+
+    asyncio.run(run())
+    assert len(delivered) == 1
+    assert isinstance(delivered[0][2], JobCancelled)
+
+
+def test_publish(jobs_file):
+    """
+    Tests that partial results are published in order, before the job's
+    result is delivered, and that the asking message is recorded
+    """
+    events = []
+
+    async def deliver(job, result, error):
+        events.append(result)
+
+    async def publish(job, key, value):
+        await asyncio.sleep(0.01)
+        events.append((key, value))
+
+    queue = JobQueue(JobExecutor('thread', workers=1), DATABASE,
+                     {'partial': partial_job}, deliver, jobs_file, publish)
+    job, _ = queue.submit(1, 10, 'partial', [["a", "bb", "ccc"]], "key", 99)
+    assert job['messages'] == {"10": 99}
+
+    async def run():
+        queue.start()
+        await wait_for_jobs(queue)
+        await queue.stop()
+
+    asyncio.run(run())
+    assert events == [("a", 1), ("bb", 2), ("ccc", 3), "done"]
@@ -0,0 +1,19 @@
+from src.metrics import Metrics
+
+
+def test_metrics():
+    """
+    Tests that counters add up and timings keep their count, max and mean
+    """
+    Metrics.reset()
+    Metrics.increment('a')
+    Metrics.increment('a', 2)
+    Metrics.observe('t', 1.0)
+    Metrics.observe('t', 3.0)
+
+    snapshot = Metrics.snapshot()
+    assert snapshot['counters'] == {'a': 3}
+    assert snapshot['timings']['t']['count'] == 2
+    assert snapshot['timings']['t']['max'] == 3.0
+    assert snapshot['timings']['t']['mean'] == 2.0
+    assert snapshot['timings']['t']['last'] == 3.0
@@ -0,0 +1,63 @@
+import datetime
+
+from src.poll_scheduler import PollScheduler
+from src.constants import (
+    POLL_JITTER, POLL_DEADLINE_INTERVAL
+)
+
+
+def test_new_course_due():
+    """
+    Tests that a course that was never polled is due right away
+    """
+    assert PollScheduler().due("course")
+
+
+def test_backoff():
+    """
+    Tests that quiet courses back off up to the maximum and active ones drop
+    to the minimum
+    """
+    scheduler = PollScheduler(initial=100, minimum=10, maximum=300)
+    scheduler.record("course", 0)
+    assert scheduler.status("course")[0] == 200
+    scheduler.record("course", 0)
+    assert scheduler.status("course")[0] == 300
+    scheduler.record("course", 2)
+    assert scheduler.status("course")[0] == 10
+
+
+def test_jitter():
+    """
+    Tests that the next poll is within the jittered interval
+    """
+    scheduler = PollScheduler(initial=50, maximum=1000)
+    scheduler.record("course", 0)
+    interval, until_next = scheduler.status("course")
+    assert not scheduler.due("course")
+    assert (interval * (1 - POLL_JITTER) - 1 <= until_next <=
+            interval * (1 + POLL_JITTER))
+
+
+def test_deadline_hint():
+    """
+    Tests that courses with a lesson due soon are polled more often
+    """
+    scheduler = PollScheduler(initial=1000, maximum=2000)
+    soon = (datetime.datetime.now(datetime.timezone.utc) +
+            datetime.timedelta(hours=1))
+    scheduler.record("course", 0, [soon])
+    assert scheduler.status("course")[0] == POLL_DEADLINE_INTERVAL
+    scheduler.record("course", 0, [])
+    assert scheduler.status("course")[0] == 2000
+
+
+def test_pinned():
+    """
+    Tests that a pinned interval overrides the adaptive one
+    """
+    scheduler = PollScheduler(initial=1000)
+    scheduler.record("course", 0)
+    assert not scheduler.due("course")
+    assert scheduler.due("course", pinned=0)
+    assert scheduler.status("course", pinned=60)[0] == 60
@@ -0,0 +1,128 @@
+import aiohttp
+import asyncio
+import pytest
+
+from src.async_ed_helper import post_payload
+from src.exceptions import EdRequestFailed
+from src.rate_limiter import (
+    TokenBucket, RetryPolicy
+)
+
+
+def test_bucket_burst():
+    """
+    Tests that the bucket hands out its capacity without waiting, then asks
+    callers to wait
+    """
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() > 0.9
+
+
+def test_bucket_pause():
+    """
+    Tests that pausing the bucket delays even available tokens
+    """
+    bucket = TokenBucket(rate=1, capacity=3)
+    bucket.pause(5)
+    assert bucket.reserve() > 4
+
+
+def test_bucket_shared():
+    """
+    Tests that the same key always gets the same bucket
+    """
+    assert TokenBucket.for_key("a") is TokenBucket.for_key("a")
+    assert TokenBucket.for_key("a") is not TokenBucket.for_key("b")
+
+
+def test_retry_after():
+    """
+    Tests that Retry-After is honored on 429s
+    """
+    assert RetryPolicy.delay(0, 429, {'Retry-After': '7'}) == 7
+
+
+def test_fail_fast():
+    """
+    Tests that client errors aren't retried
+    """
+    assert RetryPolicy.delay(0, 404) is None
+    assert RetryPolicy.delay(0, 401) is None
+
+
+def test_server_error_backoff():
+    """
+    Tests that server errors are retried for idempotent requests only
+    """
+    assert 0 <= RetryPolicy.delay(3, 502) <= 4
+    assert RetryPolicy.delay(0, 502, idempotent=False) is None
+    assert RetryPolicy.delay(0, None) is not None
+
+
+def test_ambiguous_failure():
+    """
+    Tests that non-idempotent requests are only retried after failures that
+    guarantee they were never sent
+    """
+    assert RetryPolicy.delay(0, None, idempotent=False) is None
+    assert RetryPolicy.delay(0, None, idempotent=False,
+                             sent=False) is not None
+
+
+def test_post_timeout_not_retried():
+    """
+    Tests that a POST that times out is sent once, since Ed may have
+    processed it
+    """
+    calls = []
+
+    class Response:
+        async def __aenter__(self):
+            raise asyncio.TimeoutError
+
+        async def __aexit__(self, *args):
+            return False
+
+    class Session:
+        def request(self, method, url, **kwargs):
+            calls.append(method)
+            return Response()
+
+    with pytest.raises(EdRequestFailed):
+        asyncio.run(post_payload(Session(), 'https://ed/x', 5,
+                                 TokenBucket(rate=100, capacity=10)))
+    assert calls == ['POST']
+
+
+def test_post_connect_error_retried(monkeypatch):
+    """
+    Tests that a POST whose connection couldn't be made is retried
+    """
+    calls = []
+    monkeypatch.setattr(RetryPolicy, 'backoff', lambda attempt: 0)
+
+    class Response:
+        ok, status, headers = True, 200, {}
+
+        async def __aenter__(self):
+            if len(calls) == 1:
+                raise aiohttp.ClientConnectorError(None, OSError('refused'))
+            return self
+
+        async def __aexit__(self, *args):
+            return False
+
+        async def text(self):
+            return '{"ok": true}'
+
+    class Session:
+        def request(self, method, url, **kwargs):
+            calls.append(method)
+            return Response()
+
+    assert asyncio.run(post_payload(Session(), 'https://ed/x', 5,
+                                    TokenBucket(rate=100, capacity=10))) == {
+        'ok': True
+    }
+    assert calls == ['POST', 'POST']
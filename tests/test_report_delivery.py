@@ -0,0 +1,72 @@
+import asyncio
+import discord
+from types import SimpleNamespace
+
+from src.report_delivery import ReportDelivery
+
+
+def _fake_channel(sent):
+    async def send(**kwargs):
+        sent.append(kwargs)
+        return SimpleNamespace(channel=channel, **kwargs)
+    channel = SimpleNamespace(id=1, send=send)
+    return channel
+
+
+def test_paginate():
+    """
+    Tests that embeds are packed up to the per message embed and character
+    limits
+    """
+    small = [discord.Embed(title=str(i)) for i in range(23)]
+    pages = ReportDelivery.paginate(small)
+    assert [len(page) for page in pages] == [10, 10, 3]
+    large = [discord.Embed(description="x" * 4000) for _ in range(3)]
+    assert [len(page) for page in ReportDelivery.paginate(large)] == [1, 1, 1]
+
+
+def test_send_packed():
+    """
+    Tests that a report fitting in one message is sent in one request, with
+    its files
+    """
+    sent = []
+    embeds = [discord.Embed(title=str(i)) for i in range(10)]
+    asyncio.run(ReportDelivery.send(_fake_channel(sent), embeds,
+                                    files=["file"]))
+    assert len(sent) == 1
+    assert sent[0]['embeds'] == embeds and sent[0]['files'] == ["file"]
+
+
+def test_send_paged():
+    """
+    Tests that very large reports are sent as a single message that can be
+    paged through
+    """
+    sent = []
+    embeds = [discord.Embed(title=str(i)) for i in range(25)]
+
+    async def run():
+        messages = await ReportDelivery.send(_fake_channel(sent), embeds)
+        view = sent[0]['view']
+        assert len(messages) == 1 and view.message is messages[0]
+        assert view.previous.disabled and not view.next.disabled
+
+        edits = []
+
+        async def edit_message(**kwargs):
+            edits.append(kwargs)
+        interaction = SimpleNamespace(
+            response=SimpleNamespace(edit_message=edit_message)
+        )
+        await view.next.callback(interaction)
+        await view.next.callback(interaction)
+        await view.previous.callback(interaction)
+        view.stop()
+        return edits
+
+    edits = asyncio.run(run())
+    assert len(sent) == 1 and sent[0]['embeds'] == embeds[:10]
+    assert [edit['embeds'] for edit in edits] == [embeds[10:20], embeds[20:],
+                                                  embeds[10:20]]
+    assert edits[-1]['view'].position.label == "2/3"
@@ -0,0 +1,50 @@
+import asyncio
+import csv
+import json
+
+from src.report_sink import ReportSink
+
+
+def test_report_files(tmp_path):
+    """
+    Tests that rows written in batches end up in the .csv, .html and .jsonl
+    files in order, with each TA's rows shaded together
+    """
+    file_path = str(tmp_path / 'report')
+    rows = [["a", "link0", "issue0"], ["a", "link1", "issue1"],
+            ["b", "link2", "issue2"]]
+
+    async def run():
+        async with ReportSink(file_path, jsonl=True, batch=2) as sink:
+            await sink.write(rows[:2])
+            await sink.write(rows[2:])
+        return sink
+
+    sink = asyncio.run(run())
+    assert sink.rows == 3 and sink.buffer == []
+
+    with open(file_path + '.csv', newline='') as csv_file:
+        assert list(csv.reader(csv_file)) == [ReportSink.HEADER] + rows
+    with open(file_path + '.jsonl') as jsonl_file:
+        assert [json.loads(line) for line in jsonl_file] == [
+            dict(zip(ReportSink.HEADER, row)) for row in rows
+        ]
+    html = open(file_path + '.html').read()
+    assert html.count('class="s0 two"') == 6
+    assert html.count('class="s0 one"') == 3
+    assert html.rstrip().endswith("</div>")
+
+
+def test_report_no_rows(tmp_path):
+    """
+    Tests that an empty report still has its headers
+    """
+    file_path = str(tmp_path / 'report')
+
+    async def run():
+        async with ReportSink(file_path):
+            pass
+
+    asyncio.run(run())
+    assert open(file_path + '.csv').read().strip() == "TA,Link,Issue"
+    assert "<tbody>" in open(file_path + '.html').read()
@@ -0,0 +1,118 @@
+import asyncio
+import gc
+import pytest
+
+from src import async_ed_helper
+from src.async_ed_helper import AsyncEdHelper
+from src.exceptions import EdRequestFailed
+from src.response_cache import (
+    ResponseCache
+)
+
+
+def test_put_get():
+    """
+    Tests that cached responses are fresh until their TTL
+    """
+    cache = ResponseCache(2)
+    key = ResponseCache.key("token", "url", {'b': 1, 'a': 2})
+    cache.put(key, {'value': 0}, 60)
+    assert cache.get(key).value == {'value': 0}
+    assert cache.get(key).fresh()
+    assert cache.get(ResponseCache.key("token", "url", {'a': 2, 'b': 1}))
+
+
+def test_lru_eviction():
+    """
+    Tests that the least recently used response is evicted first
+    """
+    cache = ResponseCache(2)
+    cache.put("a", 0, 60)
+    cache.put("b", 1, 60)
+    cache.get("a")
+    cache.put("c", 2, 60)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_expired():
+    """
+    Tests that expired responses are kept around for revalidation
+    """
+    cache = ResponseCache(2)
+    entry = cache.put("a", 0, -1, {'ETag': '"v1"',
+                                   'Last-Modified': 'yesterday'})
+    assert not entry.fresh() and entry.servable_stale()
+    assert entry.conditional_headers() == {'If-None-Match': '"v1"',
+                                           'If-Modified-Since': 'yesterday'}
+
+
+def test_invalidate_token():
+    """
+    Tests that invalidating a token only drops its responses
+    """
+    cache = ResponseCache(4)
+    cache.put(ResponseCache.key("a", "url"), 0, 60)
+    cache.put(ResponseCache.key("b", "url"), 0, 60)
+    cache.invalidate("a")
+    assert cache.stats()['size'] == 1
+
+
+def test_stale_only_on_transient_failures(monkeypatch):
+    """
+    Tests that expired responses stand in for Ed only when it fails
+    temporarily, and are dropped once Ed says they're gone
+    """
+    cache = ResponseCache(2)
+    monkeypatch.setattr(AsyncEdHelper, 'cache', cache)
+    monkeypatch.setattr(AsyncEdHelper, '_session', lambda self: None)
+    status = 503
+
+    async def get_conditional(session, url, retries, limiter, payload=None,
+                              headers=None):
+        raise EdRequestFailed("failed", status)
+
+    monkeypatch.setattr(async_ed_helper, 'get_conditional', get_conditional)
+    key = ResponseCache.key("token", "url")
+    cache.put(key, {'thread': 1}, -1)
+
+    def revalidate():
+        return asyncio.run(AsyncEdHelper("token")._revalidate(
+            key, "url", None, 60, 'thread'
+        ))
+
+    assert revalidate() == {'thread': 1}
+    status = 404
+    with pytest.raises(EdRequestFailed):
+        revalidate()
+    assert cache.get(key) is None
+
+
+def test_background_revalidation_failure(monkeypatch):
+    """
+    Tests that a failed background revalidation is retrieved (and logged)
+    rather than left for asyncio to report as never retrieved
+    """
+    cache = ResponseCache(2)
+    monkeypatch.setattr(AsyncEdHelper, 'cache', cache)
+    monkeypatch.setattr(AsyncEdHelper, '_session', lambda self: None)
+
+    async def get_conditional(session, url, retries, limiter, payload=None,
+                              headers=None):
+        raise EdRequestFailed("failed", 404)
+
+    monkeypatch.setattr(async_ed_helper, 'get_conditional', get_conditional)
+    cache.put(ResponseCache.key("token", "url"), {'thread': 1}, -1)
+    unhandled = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: unhandled.append(context)
+        )
+        value = await AsyncEdHelper("token")._get("url", endpoint='thread')
+        await asyncio.sleep(0.01)
+        gc.collect()
+        return value
+
+    assert asyncio.run(run()) == {'thread': 1}
+    assert unhandled == []
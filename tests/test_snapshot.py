@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+
+from src.assignment_context import AssignmentContext
+from src.async_ed_helper import AsyncEdHelper
+from src.consistency_checker import ConsistencyChecker
+from src.ed_helper import EdConstants
+from src.exceptions import MissingSnapshotResponse
+from src.snapshot import (
+    EdSnapshot, SnapshotEdHelper
+)
+
+URL = "https://edstem.org/us/courses/1/lessons/2/slides/3"
+RESPONSES = {
+    EdConstants.SLIDE_REQUEST.format(slide_id=3): {
+        'slide': {'challenge_id': 4, 'title': "HW"}
+    },
+    EdConstants.BASE_CHALLENGE.format(challenge_id=4): {
+        'challenge': {'due_at': "2030-01-01T00:00:00+00:00",
+                      'settings': {'criteria': [{}]}}
+    },
+    EdConstants.CHALLENGE_USER_REQUEST.format(challenge_id=4): {
+        'users': [{'id': i, 'tutorial': "AA", 'course_role': "student",
+                   'completed': True, 'feedback_status': "incomplete"}
+                  for i in range(2)]
+    },
+    **{EdConstants.CHALLENGE_SUBMISSIONS.format(user_id=i, challenge_id=4): {
+        'submissions': [{'id': i, 'feedback': None,
+                         'created_at': "2020-01-01T00:00:00.0+00:00"}]
+    } for i in range(2)}
+}
+
+
+def test_capture_replay(tmp_path, monkeypatch):
+    """
+    Tests that a captured snapshot survives saving, and that checks run
+    against it give the same results without any requests
+    """
+    requests = []
+
+    async def get(self, url, payload=None, endpoint=None,
+                  prefer_cache_after=None):
+        requests.append(url)
+        return RESPONSES[url]
+
+    monkeypatch.setattr(AsyncEdHelper, '_get', get)
+    snapshot = asyncio.run(EdSnapshot.capture("token", URL))
+    assert sorted(set(requests)) == sorted(RESPONSES)
+
+    snapshot.save(str(tmp_path / "snapshot.json.gz"))
+    requests.clear()
+    ed_helper = SnapshotEdHelper(EdSnapshot.load(
+        str(tmp_path / "snapshot.json.gz")
+    ))
+
+    async def check():
+        context = await AssignmentContext.create(ed_helper, URL)
+        return (
+            await ConsistencyChecker.check_ungraded(ed_helper, context),
+            await ConsistencyChecker._find_fixes(ed_helper, context)
+        )
+
+    (ungraded, (fixes, _)) = asyncio.run(check())
+    assert requests == []
+    assert ungraded[2] == 2
+    assert len(fixes["AA"]) == 2
+
+    with pytest.raises(MissingSnapshotResponse):
+        asyncio.run(ed_helper.get_lessons(1))
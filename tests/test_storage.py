@@ -0,0 +1,79 @@
+import json
+import sqlite3
+import pytest
+
+from tests.testing_constants import (
+    STANDARD_GUILD, STANDARD_GUILD_ID, STANDARD_GUILD_SAVED
+)
+from src.database import Database
+from src.storage import Storage
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'database.db')
+
+
+def test_sqlite_round_trip(db_path):
+    """
+    Tests that guilds, settings and threads survive reopening a SQLite
+    database
+    """
+    db = Database(db_path)
+    db.register(STANDARD_GUILD_ID, STANDARD_GUILD)
+    db.add_thread(STANDARD_GUILD_ID, 5, 10, "course", 11)
+    db.add_thread(STANDARD_GUILD_ID, 6, 12)
+    db.remove_thread(STANDARD_GUILD_ID, 6)
+    db.set_cursor(STANDARD_GUILD_ID, {'id': 5, 'created_at': "now"})
+    db.close()
+
+    db = Database(db_path)
+    assert db.get_threads(STANDARD_GUILD_ID) == {"5": 10}
+    assert db.get_discord_thread(STANDARD_GUILD_ID, 10) == {
+        'ed_id': "5", 'course': "course", 'message': 11
+    }
+    assert db.get_cursor(STANDARD_GUILD_ID)['id'] == 5
+    assert db.get_token(STANDARD_GUILD_ID) == STANDARD_GUILD['token']
+
+    db.delete(STANDARD_GUILD_ID)
+    db.close()
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("SELECT COUNT(*) FROM threads").fetchone() == (
+        0,
+    )
+    assert connection.execute("PRAGMA journal_mode").fetchone() == ('wal',)
+
+
+def test_sqlite_migration(db_path, tmp_path):
+    """
+    Tests that the JSON database next to a new SQLite database is imported
+    once
+    """
+    legacy = json.loads(json.dumps(STANDARD_GUILD_SAVED))
+    legacy[STANDARD_GUILD_ID]['threads'] = {"7": 8}
+    del legacy[STANDARD_GUILD_ID]['discord_threads']
+    with open(tmp_path / 'database.json', 'w') as legacy_file:
+        legacy_file.write(json.dumps(legacy))
+
+    db = Database(db_path)
+    assert db.get_threads(STANDARD_GUILD_ID) == {"7": 8}
+    assert db.get_discord_thread(STANDARD_GUILD_ID, 8)['ed_id'] == "7"
+    db.delete(STANDARD_GUILD_ID)
+    db.close()
+
+    db = Database(db_path)
+    assert STANDARD_GUILD_ID not in db
+    db.close()
+
+
+def test_incomplete_backend():
+    """
+    Tests that a backend missing part of the Storage interface can't be
+    created
+    """
+    class PartialStorage(Storage):
+        def load(self):
+            return {}
+
+    with pytest.raises(TypeError):
+        PartialStorage()
@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.exceptions import InvalidResponse
+from src.utils import (
+    bounded_map, repeat_request
+)
+
+
+def test_bounded_map_order():
+    """
+    Tests that bounded_map returns results in input order even when calls
+    finish out of order
+    """
+    async def func(item):
+        await asyncio.sleep(0.001 * (5 - item))
+        return item * 2
+
+    results = asyncio.run(bounded_map(func, list(range(5)), 3))
+    assert results == [0, 2, 4, 6, 8]
+
+
+def test_bounded_map_limit():
+    """
+    Tests that bounded_map never has more than 'limit' calls in flight
+    """
+    in_flight, most = 0, 0
+
+    async def func(item):
+        nonlocal in_flight, most
+        in_flight += 1
+        most = max(most, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return item
+
+    asyncio.run(bounded_map(func, list(range(20)), 4))
+    assert most == 4
+
+
+def test_bounded_map_progress():
+    """
+    Tests that bounded_map reports every completion
+    """
+    seen = []
+
+    async def func(item):
+        return item
+
+    async def on_complete(completed, total):
+        seen.append((completed, total))
+
+    asyncio.run(bounded_map(func, list(range(3)), 2, on_complete))
+    assert seen == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_repeat_request_async_check():
+    """
+    Tests that repeat_request awaits coroutine checks, retrying on
+    InvalidResponse
+    """
+    messages = iter(['bad', 'good'])
+    invalid = []
+
+    async def wait_for(event, check, timeout):
+        return SimpleNamespace(content=next(messages))
+
+    async def valid_check(content):
+        await asyncio.sleep(0)
+        if content != 'good':
+            raise InvalidResponse
+        return {'content': content}
+
+    async def send_invalid_message():
+        invalid.append(True)
+
+    bot = SimpleNamespace(wait_for=wait_for)
+    result = asyncio.run(repeat_request(bot, None, valid_check, 1,
+                                        send_invalid_message))
+    assert result == ('good', {'content': 'good'})
+    assert invalid == [True]